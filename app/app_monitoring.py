@@ -1,46 +1,67 @@
 import streamlit as st
-import hopsworks
 import mlflow
 from dotenv import load_dotenv
 import os
+import sys
 import pandas as pd
 
+# `streamlit run app/...` puts only app/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.monitoring.run_cache import EXPERIMENTS, MlflowRunCache, latest_runs
+
+REFRESH_TTL = 120  # seconds between incremental fetches from the tracking server
+
 # ---------------------------
 # Load secrets from env or Streamlit
 # ---------------------------
 load_dotenv()
-os.environ["HOPSWORKS_API_KEY"] = os.getenv("HOPSWORKS_API_KEY")
 os.environ["MLFLOW_TRACKING_USERNAME"] = os.getenv("DAGSHUB_USERNAME")
 os.environ["MLFLOW_TRACKING_PASSWORD"] = os.getenv("DAGSHUB_TOKEN")
 
+
+@st.cache_resource
+def run_cache():
+    mlflow.set_tracking_uri(f"https://dagshub.com/{os.getenv('DAGSHUB_USERNAME')}/{os.getenv('DAGSHUB_REPO')}.mlflow")
+    return MlflowRunCache(min_refresh_interval_s=REFRESH_TTL)
+
+
+@st.cache_data(ttl=REFRESH_TTL)
+def load_runs(experiments):
+    # Only runs newer than the cached ones are requested; reruns within the TTL hit no server
+    cache = run_cache()
+    try:
+        cache.refresh(list(experiments))
+    except Exception as e:
+        st.warning(f"Showing cached runs, MLflow refresh failed: {e}")
+    return cache.load(list(experiments))
+
+
 # ---------------------------
 # UI setup
 # ---------------------------
 st.set_page_config(page_title="Citi Bike Model Monitoring", layout="wide")
 st.title("Citi Bike Model Monitoring Dashboard")
 
+experiments = st.multiselect("Experiments", EXPERIMENTS, default=EXPERIMENTS[:1])
+per_experiment = st.slider("Runs per experiment", 5, 50, 10)
+
 # ---------------------------
-# MLflow from DagsHub
+# MLflow from DagsHub (via the local run cache)
 # ---------------------------
 try:
     st.subheader("MAE by Model Version (from MLflow @ DagsHub)")
 
-    # Connect to MLflow
-    mlflow.set_tracking_uri(f"https://dagshub.com/{os.getenv('DAGSHUB_USERNAME')}/{os.getenv('DAGSHUB_REPO')}.mlflow")
-    mlflow.set_experiment("citibike_trip_prediction_lag28")
-
-    # Get recent runs
-    runs = mlflow.search_runs(order_by=["start_time DESC"]).head(10)
-
-    # Use run name as version label (fallback: short run_id)
-    runs["Version"] = runs["tags.mlflow.runName"].fillna(runs["run_id"].str[:8])
-    runs = runs[["Version", "metrics.mae"]].rename(columns={"metrics.mae": "MAE"})
-
-    # Drop any missing values and sort by Version label
-    runs = runs.dropna().sort_values("Version")
+    runs = latest_runs(load_runs(tuple(experiments)), per_experiment=per_experiment)
+    if runs.empty:
+        st.info("No finished runs with an MAE yet.")
+    else:
+        # Display bar chart, one column per experiment
+        by_version = runs.pivot_table(index="Version", columns="experiment_name", values="metrics.mae")
+        st.bar_chart(by_version)
 
-    # Display bar chart
-    st.bar_chart(runs.set_index("Version")["MAE"])
+        st.subheader("MAE over time")
+        over_time = runs.pivot_table(index="start_time", columns="experiment_name", values="metrics.mae")
+        st.line_chart(over_time)
 
 except Exception as e:
     st.error(f"Failed to load MLflow metrics: {e}")
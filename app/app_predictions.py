@@ -1,32 +1,91 @@
 import streamlit as st
 import pandas as pd
 import os
-import hopsworks
+import sys
+from datetime import timedelta
 from dotenv import load_dotenv
 
+# `streamlit run app/...` puts only app/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.common.downsample import lttb_frame
+from src.common.feature_store import PREDICTIONS_VERSION, get_feature_store
+from src.common.count_store import HourlyCountStore, count_store_root
+from src.common.feature_view import LagFeatureView, lag_feature_mode
+
+DATA_TTL = 300      # seconds before cached reads are refreshed
+MAX_POINTS = 1500   # chart points per series after downsampling
+DEFAULT_DAYS = 14
+
 # ---------------------------
 # Load environment variables
 # ---------------------------
 load_dotenv()
-os.environ["HOPSWORKS_API_KEY"] = os.getenv("HOPSWORKS_API_KEY")
 
-# ---------------------------
-# Connect to Hopsworks
-# ---------------------------
-project = hopsworks.login(project=os.getenv("HOPSWORKS_PROJECT"))
-fs = project.get_feature_store()
 
 # ---------------------------
-# Load prediction and actuals data
+# Cached connection and scoped reads
 # ---------------------------
-pred_fg = fs.get_feature_group("citibike_predictions", version=1)
-actual_fg = fs.get_feature_group("citibike_lag_features", version=1)
+@st.cache_resource(ttl=3600)
+def connect():
+    # Login happens once per server process, not on every rerun
+    return get_feature_store()
+
+
+@st.cache_resource(ttl=3600)
+def lag_view():
+    return LagFeatureView(connect())
 
-df_pred = pred_fg.read()
-df_actual = actual_fg.read()
 
-df_pred["datetime"] = pd.to_datetime(df_pred["datetime"])
-df_actual["datetime"] = pd.to_datetime(df_actual["datetime"])
+@st.cache_data(ttl=DATA_TTL)
+def load_stations():
+    """Stations and their latest lag hour from the small watermark table."""
+    store = connect()
+    try:
+        wm = store.read("citibike_lag_watermarks", columns=["start_station_name", "watermark"])
+    except Exception:
+        wm = pd.DataFrame()
+    if wm.empty:
+        wm = store.read("citibike_predictions", PREDICTIONS_VERSION, columns=["start_station_name", "datetime"])
+        wm = wm.groupby("start_station_name", as_index=False, observed=True)["datetime"].max()
+        wm = wm.rename(columns={"datetime": "watermark"})
+    wm["watermark"] = pd.to_datetime(wm["watermark"])
+    return wm.sort_values("start_station_name").reset_index(drop=True)
+
+
+@st.cache_data(ttl=DATA_TTL, max_entries=64)
+def load_station_series(station, start, end):
+    """Predictions joined with actuals for one station and date range, cached per selection."""
+    store = connect()
+    end_exclusive = pd.Timestamp(end) + timedelta(days=1)
+    filters = [
+        ("start_station_name", "==", station),
+        ("datetime", ">=", pd.Timestamp(start)),
+        ("datetime", "<", end_exclusive),
+    ]
+    # v3 rows are keyed by the hour predicted, so they line up with that hour's actuals
+    pred_df = store.read("citibike_predictions", PREDICTIONS_VERSION, columns=["datetime", "prediction"],
+                         filters=filters)
+    if count_store_root():
+        # Actuals sliced from the local memory-mapped counts
+        series = HourlyCountStore(count_store_root()).series(station, start, end_exclusive - timedelta(hours=1))
+        actual_df = series.reset_index()
+    elif lag_feature_mode() == "view":
+        # Actuals straight from the hourly series, zero-filled like the lag table
+        actual_df = lag_view().read([], start=start, stations=[station])
+        actual_df = actual_df.loc[actual_df["datetime"] < end_exclusive, ["datetime", "trip_count"]]
+    else:
+        actual_df = store.read("citibike_lag_features", columns=["datetime", "trip_count"], filters=filters)
+    pred_df["datetime"] = pd.to_datetime(pred_df["datetime"])
+    actual_df["datetime"] = pd.to_datetime(actual_df["datetime"])
+
+    # Merge on datetime
+    return pd.merge(
+        pred_df.drop_duplicates("datetime", keep="last"),
+        actual_df,
+        on="datetime",
+        how="inner"
+    ).sort_values("datetime").reset_index(drop=True)
+
 
 # ---------------------------
 # Setup Streamlit UI
@@ -34,29 +93,36 @@ df_actual["datetime"] = pd.to_datetime(df_actual["datetime"])
 st.set_page_config(page_title="Predictions vs Ground Truth", layout="wide")
 st.title("Citi Bike: Predictions vs Ground Truth")
 
-stations = sorted(df_pred["start_station_name"].unique().tolist())
+stations_df = load_stations()
+stations = stations_df["start_station_name"].tolist()
 selected_station = st.selectbox("Select a Station", stations)
 
+latest = stations_df.loc[stations_df["start_station_name"] == selected_station, "watermark"].max()
+latest = (latest if pd.notna(latest) else pd.Timestamp.utcnow()).date()
+date_range = st.date_input("Date range", (latest - timedelta(days=DEFAULT_DAYS), latest))
+# While the user is still picking, the range has only its first date
+if isinstance(date_range, (list, tuple)):
+    start, end = (date_range[0], date_range[-1]) if date_range else (latest, latest)
+else:
+    start = end = date_range
+
 # ---------------------------
 # Filter and align data
 # ---------------------------
-pred_df = df_pred[df_pred["start_station_name"] == selected_station]
-actual_df = df_actual[df_actual["start_station_name"] == selected_station]
-
-# Merge on datetime
-merged_df = pd.merge(
-    pred_df[["datetime", "prediction"]],
-    actual_df[["datetime", "trip_count"]],
-    on="datetime",
-    how="inner"
-).sort_values("datetime")
+merged_df = load_station_series(selected_station, start, end)
 
 # ---------------------------
 # Plot results
 # ---------------------------
 st.subheader(f"Predicted vs Actual Trips for {selected_station}")
 
-st.line_chart(
-    merged_df.set_index("datetime")[["trip_count", "prediction"]],
-    use_container_width=True
-)
+if merged_df.empty:
+    st.info("No predictions with matching actuals in this range.")
+else:
+    chart_df = lttb_frame(merged_df, "datetime", ["trip_count", "prediction"], MAX_POINTS)
+    if len(chart_df) < len(merged_df):
+        st.caption(f"Showing {len(chart_df)} of {len(merged_df)} hours (LTTB downsampled)")
+    st.line_chart(
+        chart_df.set_index("datetime")[["trip_count", "prediction"]],
+        use_container_width=True
+    )
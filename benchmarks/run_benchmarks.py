@@ -0,0 +1,247 @@
+# File: benchmarks/run_benchmarks.py
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import synthetic
+from src.data_engineering.aggregate_and_upload_to_hopsworks import hourly_counts
+from src.data_engineering.fetch_clean_merge import clean_trips, hourly_month_counts
+from src.modeling.forecasting import next_hour_lags, recursive_forecast
+from src.modeling.multi_station import train_bundle
+from src.modeling.utils import create_lag_features
+
+BASELINE_FILE = "benchmarks/baseline.json"
+RESULTS_FILE = "benchmarks/results.json"
+LAGS = list(range(1, 29))
+
+
+# -----------------------------------
+# 1. Stages: setup(data) -> args, run(*args) -> rows processed
+# -----------------------------------
+def _clean_setup(data):
+    return (data["trips"].copy(),)
+
+
+def _clean_run(trips):
+    rows = len(trips)
+    clean_trips(trips)
+    return rows
+
+
+def _parse_run(zip_path, n_trips):
+    hourly_month_counts(zip_path)
+    return n_trips
+
+
+def _aggregate_setup(data):
+    if "cleaned" not in data:
+        data["cleaned"] = clean_trips(data["trips"].copy())[["start_station_name", "started_at"]]
+    return (data["cleaned"],)
+
+
+def _aggregate_run(cleaned):
+    hourly_counts(cleaned)
+    return len(cleaned)
+
+
+def _lag_run(hourly):
+    return len(create_lag_features(hourly, lags=LAGS))
+
+
+def _lagged(data):
+    if "lagged" not in data:
+        data["lagged"] = create_lag_features(data["hourly"], lags=LAGS)
+    return data["lagged"]
+
+
+def _train_run(lagged):
+    train_bundle(lagged, "global")
+    return len(lagged)
+
+
+def _model(data):
+    if "bundle" not in data:
+        data["bundle"] = train_bundle(_lagged(data), "global")
+    return data["bundle"]
+
+
+def _latest(data):
+    lagged = _lagged(data)
+    return lagged.sort_values("datetime").groupby("start_station_name", observed=True).tail(1)
+
+
+def _predict_run(bundle, latest):
+    bundle.predict(latest)
+    return len(latest)
+
+
+def _forecast_run(bundle, latest):
+    recursive_forecast(bundle.predict, latest["start_station_name"].to_numpy(), next_hour_lags(latest), 24)
+    return len(latest) * 24
+
+
+STAGES = {
+    "clean_trips": (_clean_setup, _clean_run),
+    "parse_month_zip": (lambda data: (data["zip_path"], data["n_trips"]), _parse_run),
+    "hourly_aggregation": (_aggregate_setup, _aggregate_run),
+    "lag_features": (lambda data: (data["hourly"],), _lag_run),
+    "train_global": (lambda data: (_lagged(data),), _train_run),
+    "predict_latest": (lambda data: (_model(data), _latest(data)), _predict_run),
+    "forecast_24h": (lambda data: (_model(data), _latest(data)), _forecast_run),
+}
+
+
+# -----------------------------------
+# 2. Measurement
+# -----------------------------------
+def measure(setup, run, data, repeat=3):
+    """
+    Best-of-`repeat` wall and CPU time without tracing, then one extra run
+    under tracemalloc for the peak Python/NumPy allocation of the stage.
+    """
+    best_wall, best_cpu, rows = float("inf"), float("inf"), None
+    for _ in range(repeat):
+        args = setup(data)
+        gc.collect()
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        rows = run(*args)
+        best_wall = min(best_wall, time.perf_counter() - wall0)
+        best_cpu = min(best_cpu, time.process_time() - cpu0)
+
+    args = setup(data)
+    gc.collect()
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_s": round(best_wall, 4),
+        "cpu_s": round(best_cpu, 4),
+        "rows": int(rows),
+        "rows_per_s": round(rows / best_wall, 1) if best_wall > 0 else None,
+        "peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def make_data(n_stations, days, workdir, seed=0):
+    trips = synthetic.raw_trips(n_stations, days, seed)
+    zip_path = synthetic.write_month_zip(trips, os.path.join(workdir, f"synthetic_{n_stations}x{days}-citibike-tripdata.zip"))
+    return {
+        "trips": trips,
+        "n_trips": len(trips),
+        "zip_path": zip_path,
+        "hourly": synthetic.hourly_counts(n_stations, days, seed),
+    }
+
+
+def run_suite(station_counts, days, stages, repeat=3):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_stations in station_counts:
+            data = make_data(n_stations, days, workdir)
+            print(f"Synthetic data: {n_stations} stations x {days} days, {data['n_trips']} trips")
+            for stage in stages:
+                setup, run = STAGES[stage]
+                key = f"{stage}@{n_stations}x{days}d"
+                results[key] = measure(setup, run, data, repeat)
+                r = results[key]
+                print(f"  {key:<32} {r['wall_s']:>9.4f}s  {r['rows_per_s'] or 0:>14,.0f} rows/s  {r['peak_mb']:>9.2f} MB")
+    return results
+
+
+# -----------------------------------
+# 3. Baseline comparison
+# -----------------------------------
+def compare(results, baseline, tolerance=0.25, min_wall_s=0.05):
+    """
+    Regressions: wall time or peak memory more than `tolerance` above the
+    baseline. Wall times under `min_wall_s` are too noisy and only memory
+    is checked for them.
+    """
+    regressions = []
+    for key, r in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if max(r["wall_s"], base["wall_s"]) >= min_wall_s and r["wall_s"] > base["wall_s"] * (1 + tolerance):
+            regressions.append(f"{key}: wall {base['wall_s']:.4f}s -> {r['wall_s']:.4f}s")
+        if r["peak_mb"] > base["peak_mb"] * (1 + tolerance) and r["peak_mb"] - base["peak_mb"] > 1:
+            regressions.append(f"{key}: peak {base['peak_mb']:.2f}MB -> {r['peak_mb']:.2f}MB")
+    return regressions
+
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            return next(line.split(":", 1)[1].strip() for line in f if line.startswith("model name"))
+    except (OSError, StopIteration):
+        return platform.processor()
+
+
+def environment():
+    return {"python": platform.python_version(), "machine": platform.machine(), "cpu": cpu_model(),
+            "cpus": os.cpu_count(), "platform": platform.platform(), "numpy": np.__version__}
+
+
+def main(station_counts=(3, 200), days=30, stages=None, repeat=3, baseline_file=BASELINE_FILE,
+         output=RESULTS_FILE, update_baseline=False, tolerance=0.25):
+    stages = stages or list(STAGES)
+    results = run_suite(station_counts, days, stages, repeat)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+
+    if update_baseline:
+        baseline = {}
+        if os.path.exists(baseline_file):
+            with open(baseline_file) as f:
+                baseline = json.load(f).get("results", {})
+        baseline.update(results)
+        with open(baseline_file, "w") as f:
+            json.dump({"environment": environment(), "results": baseline}, f, indent=2)
+        print(f"Baseline updated: {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print(f"No baseline at {baseline_file}; run with --update-baseline to record one")
+        return 0
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    recorded = baseline.get("environment", {})
+    if any(recorded.get(k) != environment()[k] for k in ("machine", "cpu", "cpus")):
+        # Timings only compare on like hardware; rerun with --update-baseline on a new reference machine
+        print(f"Baseline was recorded on a different machine: {recorded}")
+    regressions = compare(results, baseline.get("results", {}), tolerance)
+    if regressions:
+        print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+        return 1
+    print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths on synthetic Citi Bike data")
+    parser.add_argument("--stations", type=int, action="append",
+                        help="station count to benchmark (repeatable; default 3 and 200, up to ~2000)")
+    parser.add_argument("--days", type=int, default=30, help="days of synthetic history")
+    parser.add_argument("--stage", action="append", choices=list(STAGES), help="only these stages")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage; the fastest is kept")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON to compare against")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to write this run's results")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / memory growth (0.25 = 25%%)")
+    args = parser.parse_args()
+    sys.exit(main(args.stations or [3, 200], args.days, args.stage, args.repeat, args.baseline,
+                  args.output, args.update_baseline, args.tolerance))
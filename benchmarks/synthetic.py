@@ -0,0 +1,89 @@
+# File: benchmarks/synthetic.py
+
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+START = "2025-01-01"
+
+
+# -----------------------------------
+# 1. Station demand profiles
+# -----------------------------------
+def station_names(n_stations):
+    return [f"Synthetic St & {i} Ave" for i in range(n_stations)]
+
+
+def hourly_rates(n_stations, hours, seed=0):
+    """(stations x hours) expected trips: a per-station level times daily and weekly cycles."""
+    rng = np.random.default_rng(seed)
+    level = rng.lognormal(mean=0.5, sigma=0.8, size=(n_stations, 1))
+    t = np.arange(hours)
+    hour_of_day = t % 24
+    daily = 1 + 0.8 * np.exp(-((hour_of_day - 8) ** 2) / 4) + 1.0 * np.exp(-((hour_of_day - 17) ** 2) / 6)
+    daily = daily * np.where((hour_of_day < 6), 0.2, 1.0)
+    weekly = np.where((t // 24) % 7 >= 5, 0.7, 1.0)
+    return level * daily * weekly
+
+
+# -----------------------------------
+# 2. Hourly counts
+# -----------------------------------
+def hourly_counts(n_stations=3, days=30, seed=0, start=START):
+    """Long-format hourly counts like citibike_hourly_trips; zero hours are left out."""
+    hours = days * 24
+    counts = np.random.default_rng(seed + 1).poisson(hourly_rates(n_stations, hours, seed))
+    station_idx, hour_idx = np.nonzero(counts)
+    stations = np.asarray(station_names(n_stations), dtype=object)
+    return pd.DataFrame({
+        "start_station_name": stations[station_idx],
+        "datetime": pd.Timestamp(start) + pd.to_timedelta(hour_idx, unit="h"),
+        "trip_count": counts[station_idx, hour_idx].astype("int64"),
+    })
+
+
+# -----------------------------------
+# 3. Raw trips
+# -----------------------------------
+def raw_trips(n_stations=3, days=30, seed=0, start=START):
+    """
+    Trip rows with the raw Citi Bike CSV columns and string timestamps, drawn
+    from the same hourly counts. About 2% of rows are too short, too long or
+    missing an end station, so cleaning has something to drop.
+    """
+    rng = np.random.default_rng(seed + 2)
+    hourly = hourly_counts(n_stations, days, seed, start)
+    n = int(hourly["trip_count"].sum())
+    stations = np.asarray(station_names(n_stations), dtype=object)
+
+    started = np.repeat(hourly["datetime"].to_numpy(), hourly["trip_count"].to_numpy())
+    started = started + rng.integers(0, 3_600_000, n).astype("timedelta64[ms]")
+    duration_s = rng.gamma(2.0, 420.0, n)
+    bad = rng.random(n)
+    duration_s[bad < 0.01] = 20
+    duration_s[(bad >= 0.01) & (bad < 0.015)] = 4 * 3600
+    ended = started + (duration_s * 1000).astype("timedelta64[ms]")
+    end_station = stations[rng.integers(0, n_stations, n)]
+    end_station[(bad >= 0.015) & (bad < 0.02)] = None
+
+    return pd.DataFrame({
+        "ride_id": np.char.mod("%016X", np.arange(n)),
+        "rideable_type": np.where(rng.random(n) < 0.6, "classic_bike", "electric_bike"),
+        "started_at": pd.Series(started).dt.strftime("%Y-%m-%d %H:%M:%S.%f").str[:-3],
+        "ended_at": pd.Series(ended).dt.strftime("%Y-%m-%d %H:%M:%S.%f").str[:-3],
+        "start_station_name": np.repeat(hourly["start_station_name"].to_numpy(), hourly["trip_count"].to_numpy()),
+        "end_station_name": end_station,
+        "member_casual": np.where(rng.random(n) < 0.8, "member", "casual"),
+    })
+
+
+def write_month_zip(trips, path, rows_per_file=1_000_000):
+    """Write trips as a monthly tripdata zip, split into several CSV members like the real archives."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for part, first in enumerate(range(0, max(len(trips), 1), rows_per_file), start=1):
+            zf.writestr(f"{stem}_{part}.csv", trips.iloc[first:first + rows_per_file].to_csv(index=False))
+    return path
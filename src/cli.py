@@ -0,0 +1,54 @@
+# File: src/cli.py
+
+import argparse
+import importlib
+import sys
+import time
+
+# Subcommand -> (module with a `cli(argv, prog)` function, help text).
+# Modules are imported only when their subcommand runs, so `--help` and
+# every job load just the dependencies they need.
+COMMANDS = {
+    "fetch": ("src.data_engineering.fetch_clean_merge", "download, clean and aggregate monthly trip data"),
+    "aggregate": ("src.data_engineering.aggregate_and_upload_to_hopsworks", "upload hourly counts to the feature store"),
+    "features": ("src.pipelines.feature_pipeline", "build lag features from hourly trip counts"),
+    "train": ("src.pipelines.model_training_pipeline", "train and register the lag-28 LightGBM model(s)"),
+    "infer": ("src.pipelines.inference_pipeline", "predict the next hour(s) of trips for every station"),
+    "backtest": ("src.modeling.backtesting", "rolling-origin backtest of the lag models"),
+    "counts": ("src.common.count_store", "sync hourly counts into the local memory-mapped store"),
+}
+
+
+def import_timed(module_name):
+    """Import `module_name`, printing how long it (and everything it pulls in) took."""
+    already = set(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - start
+    loaded = len(set(sys.modules) - already)
+    print(f"[cli] imported {module_name} in {elapsed:.2f}s ({loaded} new modules)", file=sys.stderr)
+    return module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.cli",
+        description="Citi Bike pipelines. Arguments after the subcommand go to that pipeline; "
+                    "use `<subcommand> --help` for its options."
+    )
+    parser.add_argument("--dry-run", action="store_true",
+                        help="import the subcommand's pipeline and report the import time without running it")
+    parser.add_argument("command", choices=list(COMMANDS), metavar="command",
+                        help="one of: " + ", ".join(f"{name} ({text})" for name, (_, text) in COMMANDS.items()))
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="options passed to the subcommand")
+    args = parser.parse_args(argv)
+
+    module_name, _ = COMMANDS[args.command]
+    module = import_timed(module_name)
+    if args.dry_run:
+        return
+    module.cli(args.args, prog=f"{parser.prog} {args.command}")
+
+
+if __name__ == "__main__":
+    main()
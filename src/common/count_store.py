@@ -0,0 +1,333 @@
+# File: src/common/count_store.py
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.common.schema import LAG_DTYPE, STATION_COL, TARGET_COL, TIME_COL, as_station_category
+
+COUNT_STORE_ROOT = "data/count_store"
+COUNT_DTYPE = np.int32
+HOUR_CHUNK = 24 * 31        # hours added per file growth
+STATION_CHUNK = 256         # spare station columns added per re-layout
+
+
+def hours_since_epoch(times):
+    """Whole epoch hours for naive (UTC) timestamps."""
+    times = pd.to_datetime(pd.Series(times))
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert(None)
+    return times.dt.floor("h").to_numpy().astype("datetime64[h]").astype(np.int64)
+
+
+def count_store_root(root=None):
+    """Store directory from `root` or COUNT_STORE_ROOT; None when no store has been built there."""
+    root = root or os.getenv("COUNT_STORE_ROOT")
+    if root and os.path.exists(os.path.join(root, "meta.json")):
+        return root
+    return None
+
+
+class HourlyCountStore:
+    """
+    Hourly trip counts as a dense (hours x stations) int32 array in
+    `root/counts.bin`, memory-mapped so every process on the host shares
+    one page-cached copy. `root/meta.json` holds the data file's name, the
+    first hour, the number of hours written, the station order and each
+    station's first and last observed hour.
+
+    Rows are hours, so appending hours grows the file at its end without
+    moving data, and the last N hours for all stations are one contiguous
+    block: `lag_matrix` returns a (stations x lags) view of it without
+    copying. Station columns are allocated with spare capacity; running
+    out re-lays the data into a new file that only the next meta.json
+    points to. One writer at a time; readers call `refresh()` to see
+    appended hours (meta.json is replaced atomically after the data is
+    flushed, so it always matches the file it names).
+    """
+
+    def __init__(self, root=COUNT_STORE_ROOT, mode="r"):
+        self.root = root
+        self.mode = mode
+        self.meta_path = os.path.join(root, "meta.json")
+        self.retired_path = None
+        self.refresh()
+
+    # ---------------------------
+    # Files
+    # ---------------------------
+    @classmethod
+    def create(cls, root=COUNT_STORE_ROOT, start=None, hour_capacity=HOUR_CHUNK, station_capacity=STATION_CHUNK):
+        os.makedirs(root, exist_ok=True)
+        meta = {
+            "start_hour": int(hours_since_epoch([start])[0]) if start is not None else None,
+            "data_file": "counts.bin", "layout": 0,
+            "n_hours": 0, "hour_capacity": hour_capacity, "station_capacity": station_capacity,
+            "stations": [], "first_hour": [], "last_hour": [], "dtype": np.dtype(COUNT_DTYPE).name,
+        }
+        with open(os.path.join(root, "counts.bin"), "wb") as f:
+            f.truncate(hour_capacity * station_capacity * np.dtype(COUNT_DTYPE).itemsize)
+        cls._write_meta(os.path.join(root, "meta.json"), meta)
+        return cls(root, mode="r+")
+
+    @staticmethod
+    def _write_meta(path, meta):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def refresh(self):
+        """Re-read the metadata and re-map the file (picks up hours appended by another process)."""
+        for attempt in range(2):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+            self.data_path = os.path.join(self.root, self.meta.get("data_file", "counts.bin"))
+            # The writer removes a re-laid file right after switching meta.json; read it again
+            if os.path.exists(self.data_path) or attempt:
+                break
+        self.station_index = {s: i for i, s in enumerate(self.meta["stations"])}
+        self.first_hour = np.asarray(self.meta["first_hour"], dtype=np.int64)
+        self.last_hour = np.asarray(self.meta["last_hour"], dtype=np.int64)
+        self.counts = np.memmap(self.data_path, dtype=self.meta["dtype"], mode=self.mode,
+                                shape=(self.meta["hour_capacity"], self.meta["station_capacity"]))
+
+    @property
+    def stations(self):
+        return self.meta["stations"]
+
+    @property
+    def n_hours(self):
+        return self.meta["n_hours"]
+
+    @property
+    def start_hour(self):
+        return self.meta["start_hour"]
+
+    def hours(self):
+        """DatetimeIndex of the stored hours."""
+        if self.start_hour is None:
+            return pd.DatetimeIndex([])
+        return pd.DatetimeIndex(np.arange(self.start_hour, self.start_hour + self.n_hours).astype("datetime64[h]"))
+
+    def matrix(self):
+        """(hours x stations) view of everything written."""
+        return self.counts[:self.n_hours, :len(self.stations)]
+
+    # ---------------------------
+    # Appends
+    # ---------------------------
+    def _grow(self, n_hours, n_stations):
+        hour_capacity, station_capacity = self.meta["hour_capacity"], self.meta["station_capacity"]
+        if n_stations > station_capacity:
+            # New column count changes every row's stride: copy into a wider file once.
+            # Readers keep using the old file until meta.json names the new one
+            new_stations = (n_stations // STATION_CHUNK + 1) * STATION_CHUNK
+            new_hours = max(hour_capacity, (n_hours // HOUR_CHUNK + 1) * HOUR_CHUNK)
+            layout = self.meta.get("layout", 0) + 1
+            data_file = f"counts.{layout}.bin"
+            wider = np.memmap(os.path.join(self.root, data_file), dtype=self.meta["dtype"], mode="w+",
+                              shape=(new_hours, new_stations))
+            wider[:self.n_hours, :len(self.stations)] = self.matrix()
+            wider.flush()
+            del wider
+            # Views handed out earlier keep the old mapping; the old file is removed after the switch
+            self.counts = None
+            self.retired_path = self.data_path
+            self.data_path = os.path.join(self.root, data_file)
+            self.meta.update(data_file=data_file, layout=layout, hour_capacity=new_hours,
+                             station_capacity=new_stations)
+        elif n_hours > hour_capacity:
+            # Rows are hours: extending the file leaves existing data where it is
+            new_hours = (n_hours // HOUR_CHUNK + 1) * HOUR_CHUNK
+            self.counts.flush()
+            with open(self.data_path, "r+b") as f:
+                f.truncate(new_hours * station_capacity * np.dtype(self.meta["dtype"]).itemsize)
+            self.meta.update(hour_capacity=new_hours)
+        else:
+            return
+        self.counts = np.memmap(self.data_path, dtype=self.meta["dtype"], mode=self.mode,
+                                shape=(self.meta["hour_capacity"], self.meta["station_capacity"]))
+
+    def append(self, df, station_col=STATION_COL, time_col=TIME_COL, target_col=TARGET_COL):
+        """
+        Write long-format hourly counts in place. Hours after the last one
+        extend the store (hours in between read as 0); hours already stored
+        are overwritten, like an upsert. Returns the number of rows written.
+        """
+        if self.mode == "r":
+            raise PermissionError("HourlyCountStore opened read-only; open with mode='r+' to append")
+        if df.empty:
+            return 0
+        h = hours_since_epoch(df[time_col])
+        if self.start_hour is None:
+            self.meta["start_hour"] = int(h.min())
+        offsets = h - self.start_hour
+        if offsets.min() < 0:
+            raise ValueError(f"Rows before the store's first hour {self.hours()[:1]}; rebuild the store")
+
+        names = df[station_col].astype(str).to_numpy()
+        new = [s for s in pd.unique(names) if s not in self.station_index]
+        n_hours = max(self.n_hours, int(offsets.max()) + 1)
+        self._grow(n_hours, len(self.stations) + len(new))
+        for s in new:
+            self.station_index[s] = len(self.meta["stations"])
+            self.meta["stations"].append(s)
+        cols = np.fromiter((self.station_index[s] for s in names), dtype=np.int64, count=len(names))
+
+        self.counts[offsets, cols] = df[target_col].to_numpy()
+        self.counts.flush()
+
+        # Per-station observed range, used to reproduce create_lag_features' rows
+        first = np.full(len(self.stations), np.iinfo(np.int64).max)
+        last = np.full(len(self.stations), -1)
+        first[:len(self.first_hour)], last[:len(self.last_hour)] = self.first_hour, self.last_hour
+        np.minimum.at(first, cols, offsets)
+        np.maximum.at(last, cols, offsets)
+        self.meta.update(n_hours=n_hours, first_hour=first.tolist(), last_hour=last.tolist())
+        self._write_meta(self.meta_path, self.meta)
+        self.first_hour, self.last_hour = first, last
+        if self.retired_path is not None:
+            os.remove(self.retired_path)
+            self.retired_path = None
+        return len(df)
+
+    # ---------------------------
+    # Reads (views into the map)
+    # ---------------------------
+    def _columns(self, stations):
+        if stations is None:
+            return slice(0, len(self.stations))
+        return np.array([self.station_index[s] for s in stations], dtype=np.int64)
+
+    def hour_offset(self, ts):
+        return int(hours_since_epoch([ts])[0]) - self.start_hour
+
+    def window(self, n_hours, end=None, stations=None):
+        """(n_hours x stations) counts for the hours before `end` (default: after the last stored hour)."""
+        stop = self.n_hours if end is None else self.hour_offset(end)
+        if stop - n_hours < 0 or stop > self.n_hours:
+            raise ValueError(f"{n_hours}h window ending {end} is outside the stored hours")
+        block = self.counts[stop - n_hours:stop]
+        cols = self._columns(stations)
+        return block[:, cols]
+
+    def lag_matrix(self, n_lags=28, target_hour=None, stations=None):
+        """
+        (stations x n_lags) matrix with column k-1 holding lag_k for
+        `target_hour` (default: the hour after the last stored one). For all
+        stations this is a strided view of the map, no copy.
+        """
+        return self.window(n_lags, target_hour, stations)[::-1].T
+
+    def latest_frame(self, n_lags=28, since=None, stations=None):
+        """
+        Each station's lag row at the newest stored hour (hours without trips
+        are 0, like the feature pipeline's grid), shaped like
+        citibike_lag_features: what the inference pipeline predicts from.
+        Only one row per station is gathered.
+        """
+        if self.n_hours <= n_lags:
+            # Empty or still too short for a full lag window
+            return self._lag_frame(np.empty((0, n_lags + 1), dtype=self.counts.dtype), [], [], n_lags)
+        cols = np.arange(len(self.stations)) if stations is None else self._columns(stations)
+        hours = np.full(len(cols), self.n_hours - 1, dtype=np.int64)
+        keep = hours >= self.first_hour[cols] + n_lags
+        if since is not None:
+            keep &= hours >= self.hour_offset(since)
+        cols, hours = cols[keep], hours[keep]
+        windows = np.lib.stride_tricks.sliding_window_view(self.matrix(), n_lags + 1, axis=0)
+        return self._lag_frame(windows[hours - n_lags, cols], hours, cols, n_lags)
+
+    def recent_frame(self, n_hours):
+        """Long-format counts (zeros included) for the last `n_hours` stored hours."""
+        n_hours = min(n_hours, self.n_hours)
+        block = self.window(n_hours)
+        return pd.DataFrame({
+            STATION_COL: np.tile(np.asarray(self.stations, dtype=object), n_hours),
+            TIME_COL: np.repeat(self.hours()[self.n_hours - n_hours:], len(self.stations)),
+            TARGET_COL: block.ravel(),
+        })
+
+    def series(self, station, start=None, end=None):
+        """One station's hourly counts between `start` and `end` (inclusive) as a Series."""
+        if station not in self.station_index:
+            return pd.Series([], index=pd.DatetimeIndex([]), name=TARGET_COL, dtype=self.counts.dtype).rename_axis(TIME_COL)
+        lo = 0 if start is None else max(self.hour_offset(start), 0)
+        hi = self.n_hours if end is None else min(self.hour_offset(end) + 1, self.n_hours)
+        values = self.counts[lo:max(lo, hi), self.station_index[station]]
+        return pd.Series(values, index=self.hours()[lo:max(lo, hi)], name=TARGET_COL).rename_axis(TIME_COL)
+
+    def lag_rows(self, n_lags=28, start=None):
+        """
+        Training rows from every station's first observed hour to the newest
+        stored hour, equal to `create_lag_features(hourly, lags=range(1,
+        n_lags + 1), end=<newest hour>)`, built from sliding-window views of
+        the map instead of a pandas pivot.
+        """
+        if self.n_hours <= n_lags:
+            return self._lag_frame(np.empty((0, n_lags + 1), dtype=self.counts.dtype), [], [], n_lags)
+        counts = self.matrix()
+        windows = np.lib.stride_tricks.sliding_window_view(counts, n_lags + 1, axis=0)  # (hours-n, stations, n+1)
+        row_hour = np.arange(n_lags, self.n_hours)
+        keep = np.broadcast_to(row_hour[:, None] >= self.first_hour[None, :] + n_lags,
+                               (len(row_hour), len(self.stations))).copy()
+        if start is not None:
+            keep &= row_hour[:, None] >= self.hour_offset(start)
+
+        # Station-major output, stations sorted by name like the feature pipeline's frames
+        order = np.argsort(self.stations)
+        keep = keep[:, order].T
+        station_pos, hour_pos = np.nonzero(keep)
+        station_cols = order[station_pos]
+        return self._lag_frame(windows[hour_pos, station_cols], row_hour[hour_pos], station_cols, n_lags)
+
+    def _lag_frame(self, picked, hours, cols, n_lags):
+        """citibike_lag_features-shaped rows from (rows, n_lags + 1) windows, oldest hour first."""
+        frame = pd.DataFrame(picked[:, :n_lags][:, ::-1].astype(LAG_DTYPE),
+                             columns=[f"lag_{k}" for k in range(1, n_lags + 1)])
+        frame.insert(0, TARGET_COL, picked[:, n_lags])
+        hours = np.asarray(hours, dtype=np.int64) + (self.start_hour or 0)
+        frame.insert(0, TIME_COL, hours.astype("datetime64[h]").astype("datetime64[ns]"))
+        names = np.asarray(self.stations, dtype=object)[np.asarray(cols, dtype=np.int64)]
+        frame.insert(0, STATION_COL, as_station_category(pd.Series(names, dtype=object)))
+        return frame
+
+
+# -----------------------------------
+# Sync from the feature store
+# -----------------------------------
+def sync_from_feature_store(store, root=COUNT_STORE_ROOT, lookback_hours=48):
+    """
+    Append citibike_hourly_trips rows from `lookback_hours` before the last
+    stored hour onward (re-writing recent hours picks up late corrections).
+    Builds the store from the full history on first run.
+    """
+    if count_store_root(root):
+        counts = HourlyCountStore(root, mode="r+")
+        since = counts.hours()[-1] - pd.Timedelta(hours=lookback_hours) if counts.n_hours else None
+    else:
+        counts, since = HourlyCountStore.create(root), None
+    filters = [(TIME_COL, ">=", since)] if since is not None else None
+    df = store.read("citibike_hourly_trips", columns=[STATION_COL, TIME_COL, TARGET_COL], filters=filters)
+    written = counts.append(df)
+    print(f"Count store {root}: wrote {written} rows, {counts.n_hours} hours x {len(counts.stations)} stations")
+    return counts
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Sync hourly counts into the local memory-mapped store")
+    parser.add_argument("--root", default=os.getenv("COUNT_STORE_ROOT", COUNT_STORE_ROOT))
+    parser.add_argument("--lookback-hours", type=int, default=48,
+                        help="recent hours re-read on each sync to pick up late corrections")
+    args = parser.parse_args(argv)
+    from src.common.feature_store import get_feature_store
+
+    sync_from_feature_store(get_feature_store(), args.root, args.lookback_hours)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,40 @@
+# File: src/common/downsample.py
+
+import numpy as np
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points that keep the
+    visual shape of the series (x ascending). The first and last points are
+    always kept; each bucket in between contributes the point forming the
+    largest triangle with the previous pick and the next bucket's mean.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nlo, nhi = (hi, int((i + 2) * every) + 1) if i < n_out - 3 else (n - 1, n)
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def lttb_frame(df, x_col, y_cols, n_out):
+    """Downsample `df` (sorted by `x_col`) to about `n_out` rows per column in `y_cols`, keeping their union."""
+    if len(df) <= n_out:
+        return df
+    x = df[x_col].to_numpy()
+    x = x.astype("datetime64[ns]").astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+    keep = np.unique(np.concatenate([lttb_indices(x, df[c].to_numpy(), n_out) for c in y_cols]))
+    return df.iloc[keep]
@@ -0,0 +1,249 @@
+# File: src/common/feature_store.py
+
+import functools
+import json
+import operator
+import os
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from src.common.schema import storage_frame
+
+BACKENDS = ["hopsworks", "local"]
+LOCAL_ROOT = "data/feature_store"
+
+# Feature group definitions shared by every pipeline: (name, version) -> options
+FEATURE_GROUPS = {
+    ("citibike_hourly_trips", 1): dict(
+        primary_key=["start_station_name", "datetime"],
+        event_time="datetime",
+        description="Hourly Citi Bike trip counts for top 3 stations (2024-2025)",
+    ),
+    ("citibike_lag_features", 1): dict(
+        primary_key=["start_station_name", "datetime"],
+        event_time="datetime",
+        description="Lag features (1-28 hours) for trip prediction",
+    ),
+    ("citibike_lag_watermarks", 1): dict(
+        primary_key=["start_station_name"],
+        description="Last hour per station already written to citibike_lag_features",
+    ),
+    ("citibike_predictions", 1): dict(
+        primary_key=["start_station_name", "datetime"],
+        event_time="prediction_time",
+        description="Predicted Citi Bike trip count (1-hour ahead) for each station, keyed by the feature hour",
+    ),
+    ("citibike_predictions", 2): dict(
+        primary_key=["start_station_name", "datetime", "horizon"],
+        event_time="prediction_time",
+        description="Predicted Citi Bike trip counts for hours t+1..t+H after each station's latest hour",
+    ),
+    ("citibike_predictions", 3): dict(
+        primary_key=["start_station_name", "datetime"],
+        event_time="prediction_time",
+        description="Predicted Citi Bike trip count (1-hour ahead) for each station, keyed by the hour predicted",
+    ),
+}
+# 1-hour-ahead predictions keyed by target hour; v1 rows keep the feature hour
+PREDICTIONS_VERSION = 3
+
+_OPS = {
+    "==": operator.eq, "=": operator.eq, "!=": operator.ne,
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+}
+
+
+# -----------------------------------
+# 1. Hopsworks backend
+# -----------------------------------
+@functools.lru_cache(maxsize=None)
+def hopsworks_project(project_name=None):
+    """Log in once per process and project; later calls reuse the handle."""
+    import hopsworks
+
+    load_dotenv()
+    return hopsworks.login(project=project_name or os.getenv("HOPSWORKS_PROJECT"))
+
+
+class HopsworksFeatureGroup:
+    def __init__(self, fg):
+        self.fg = fg
+        self.name = fg.name
+        self.version = fg.version
+        self.primary_key = list(fg.primary_key or [])
+
+    def _condition(self, filters):
+        condition = None
+        for column, op, value in filters:
+            feature = getattr(self.fg, column)
+            if op == "in":
+                term = feature.isin(list(value))
+            else:
+                term = _OPS[op](feature, value)
+            condition = term if condition is None else condition & term
+        return condition
+
+    def read(self, columns=None, filters=None):
+        """Read `columns` (default all) of rows matching every `(column, op, value)` filter."""
+        query = self.fg.select(list(columns)) if columns else self.fg
+        if filters:
+            query = query.filter(self._condition(filters))
+        return query.read()
+
+    def insert(self, df, wait=True, materialize=True):
+        """
+        Upsert `df`; returns the materialization job (None when none was
+        started). With `materialize=False` rows are only queued for the next
+        materialization run, so chunked writes start one job, not one each.
+        """
+        result = self.fg.insert(storage_frame(df), write_options={
+            "wait_for_job": wait, "start_offline_materialization": materialize,
+        })
+        return result[0] if isinstance(result, tuple) else result
+
+    def data_version(self):
+        """Latest commit id for time-travel enabled groups, else None."""
+        try:
+            commits = self.fg.commit_details(limit=1)
+        except Exception:
+            return None
+        return str(max(commits)) if commits else None
+
+
+class HopsworksFeatureStore:
+    backend = "hopsworks"
+
+    def __init__(self, project_name=None):
+        self.project_name = project_name
+        self._groups = {}
+
+    @property
+    def project(self):
+        return hopsworks_project(self.project_name)
+
+    @functools.cached_property
+    def fs(self):
+        return self.project.get_feature_store()
+
+    def get(self, name, version=1, create=True, **options):
+        """Feature group handle, created from FEATURE_GROUPS (or `options`) when missing."""
+        key = (name, version)
+        if key not in self._groups:
+            options = {**FEATURE_GROUPS.get(key, {}), **options}
+            if create and options.get("primary_key"):
+                fg = self.fs.get_or_create_feature_group(name=name, version=version, **options)
+            else:
+                fg = self.fs.get_feature_group(name, version=version)
+            self._groups[key] = HopsworksFeatureGroup(fg)
+        return self._groups[key]
+
+    def read(self, name, version=1, columns=None, filters=None):
+        return self.get(name, version).read(columns, filters)
+
+    def insert(self, name, df, version=1, wait=True):
+        return self.get(name, version).insert(df, wait)
+
+
+# -----------------------------------
+# 2. Local Parquet backend
+# -----------------------------------
+class LocalFeatureGroup:
+    """
+    One Parquet file per feature group version. Inserts upsert on the
+    primary key like Hopsworks does; reads push column selection and
+    filters down to pyarrow.
+    """
+
+    def __init__(self, root, name, version, primary_key=None, event_time=None, description=None):
+        self.name = name
+        self.version = version
+        self.path = os.path.join(root, f"{name}_{version}.parquet")
+        self.meta_path = os.path.join(root, f"{name}_{version}.json")
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"primary_key": primary_key or [], "event_time": event_time, "description": description}
+        self.primary_key = meta["primary_key"]
+        self.event_time = meta["event_time"]
+        self.description = meta.get("description")
+
+    def read(self, columns=None, filters=None):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=list(columns) if columns else self.primary_key)
+        filters = [(c, "=" if op == "==" else op, _parquet_value(v)) for c, op, v in (filters or [])]
+        return pd.read_parquet(self.path, columns=list(columns) if columns else None, filters=filters or None)
+
+    def insert(self, df, wait=True, materialize=True):
+        """Rewrites the file synchronously; there is never a job to wait for."""
+        if os.path.exists(self.path):
+            df = pd.concat([pd.read_parquet(self.path), df], ignore_index=True)
+            if self.primary_key:
+                df = df.drop_duplicates(self.primary_key, keep="last")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, self.path)
+        with open(self.meta_path, "w") as f:
+            json.dump({"primary_key": self.primary_key, "event_time": self.event_time,
+                       "description": self.description}, f, indent=2)
+        return None
+
+    def data_version(self):
+        """Changes whenever the file is rewritten."""
+        if not os.path.exists(self.path):
+            return None
+        stat = os.stat(self.path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _parquet_value(value):
+    if isinstance(value, (list, tuple, set, pd.Index, pd.Series)):
+        return [_parquet_value(v) for v in value]
+    if hasattr(value, "to_pydatetime") or hasattr(value, "isoformat"):
+        return pd.Timestamp(value)
+    return value
+
+
+class LocalFeatureStore:
+    """Offline stand-in for Hopsworks: same operations, data under `root`."""
+
+    backend = "local"
+    project = None
+
+    def __init__(self, root=LOCAL_ROOT):
+        self.root = root
+        self._groups = {}
+
+    def get(self, name, version=1, create=True, **options):
+        key = (name, version)
+        if key not in self._groups:
+            options = {**FEATURE_GROUPS.get(key, {}), **options}
+            self._groups[key] = LocalFeatureGroup(self.root, name, version, **options)
+        return self._groups[key]
+
+    def read(self, name, version=1, columns=None, filters=None):
+        return self.get(name, version).read(columns, filters)
+
+    def insert(self, name, df, version=1, wait=True):
+        return self.get(name, version).insert(df, wait)
+
+
+# -----------------------------------
+# 3. Backend selection
+# -----------------------------------
+@functools.lru_cache(maxsize=None)
+def get_feature_store(backend=None, project_name=None, root=None):
+    """
+    Process-wide feature store. The backend comes from FEATURE_STORE_BACKEND
+    (hopsworks by default, or local) and the local root from
+    FEATURE_STORE_ROOT.
+    """
+    load_dotenv()
+    backend = backend or os.getenv("FEATURE_STORE_BACKEND", "hopsworks")
+    if backend == "hopsworks":
+        return HopsworksFeatureStore(project_name)
+    if backend == "local":
+        return LocalFeatureStore(root or os.getenv("FEATURE_STORE_ROOT", LOCAL_ROOT))
+    raise ValueError(f"Unknown feature store backend: {backend} (expected one of {BACKENDS})")
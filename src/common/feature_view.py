@@ -0,0 +1,91 @@
+# File: src/common/feature_view.py
+
+import os
+
+import pandas as pd
+
+from src.common.schema import STATION_COL, TARGET_COL, TIME_COL, compact_hourly, compact_lag_features
+from src.modeling.utils import create_lag_features
+
+LAG_FEATURE_MODES = ["materialized", "view"]
+MAX_LAG = 28
+
+
+def lag_feature_mode(mode=None):
+    """
+    materialized: lag_1..lag_28 are written to citibike_lag_features (default).
+    view: only the hourly series is stored; lags are derived on read.
+    """
+    # Workflows pass unset repository variables through as ""
+    mode = mode or os.getenv("LAG_FEATURE_MODE") or "materialized"
+    if mode not in LAG_FEATURE_MODES:
+        raise ValueError(f"Unknown LAG_FEATURE_MODE: {mode} (expected one of {LAG_FEATURE_MODES})")
+    return mode
+
+
+def lags_of(features):
+    """[1, 2, 24] for ["lag_1", "lag_2", "lag_24"]; other feature names are ignored."""
+    return [int(f.split("_", 1)[1]) for f in features if f.startswith("lag_")]
+
+
+class LagFeatureView:
+    """
+    Rows shaped like citibike_lag_features, computed from the hourly counts
+    in `source` for any lag set. Each read fetches only the requested hours
+    plus the longest lag's lookback, with three columns instead of 31. The
+    fetched series is kept per data version, so reading several lag subsets
+    (e.g. the top-10 features) costs one store read.
+    """
+
+    def __init__(self, store, source="citibike_hourly_trips", version=1, max_entries=4):
+        self.store = store
+        self.fg = store.get(source, version, create=False)
+        self.max_entries = max_entries
+        self._series = {}
+
+    def series(self, since=None, stations=None):
+        """Compact hourly counts from `since` on (all history when None) for `stations` (all when None)."""
+        version = self.fg.data_version()
+        key = (version, since, tuple(sorted(stations)) if stations is not None else None)
+        if version is not None and key in self._series:
+            return self._series[key]
+
+        filters = []
+        if since is not None:
+            filters.append((TIME_COL, ">=", since))
+        if stations is not None:
+            filters.append((STATION_COL, "in", list(stations)))
+        df = compact_hourly(self.fg.read(columns=[STATION_COL, TIME_COL, TARGET_COL], filters=filters or None))
+
+        if version is not None:
+            if len(self._series) >= self.max_entries:
+                self._series.pop(next(iter(self._series)))
+            self._series[key] = df
+        return df
+
+    def read(self, features, start=None, end=None, stations=None):
+        """
+        Lag rows for hours in [start, end] (open-ended when None). Hours with
+        no trips count as 0 up to the newest hour read, exactly as the feature
+        pipeline materializes them (with `stations`, the newest among those).
+        """
+        features = [f for f in features if f not in (STATION_COL, TIME_COL, TARGET_COL)]
+        lags = lags_of(features) or [0]
+        start = pd.Timestamp(start).floor("h") if start is not None else None
+        since = start - pd.Timedelta(hours=max(lags)) if start is not None else None
+        df = self.series(since, stations)
+        if df.empty:
+            return compact_lag_features(pd.DataFrame(columns=[STATION_COL, TIME_COL, TARGET_COL] + list(features)))
+
+        lagged = create_lag_features(df, lags=[lag for lag in lags if lag > 0], start=since,
+                                     end=df[TIME_COL].max())
+        if start is not None:
+            lagged = lagged[lagged[TIME_COL] >= start]
+        if end is not None:
+            lagged = lagged[lagged[TIME_COL] <= pd.Timestamp(end)]
+        return lagged[[STATION_COL, TIME_COL, TARGET_COL] + list(features)].reset_index(drop=True)
+
+    def latest(self, features, cutoff):
+        """Newest row per station among hours from `cutoff` on: the newest hour of any station."""
+        df = self.read(features, start=cutoff)
+        return df.groupby(STATION_COL, observed=True).tail(1).reset_index(drop=True)
@@ -0,0 +1,152 @@
+# File: src/common/feature_writer.py
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 250_000
+JOB_TIMEOUT_S = 3600
+JOB_POLL_S = 10
+# FEATURE_WRITE_WAIT=1: block on every materialization job like before
+# FEATURE_WRITE_CHUNK_ROWS: rows per insert call
+# FEATURE_WRITE_TIMEOUT_S: how long `finish()` waits for outstanding jobs
+
+
+# -----------------------------------
+# 1. Deltas
+# -----------------------------------
+def after_watermark(df, watermark, time_col="datetime"):
+    """Rows strictly newer than `watermark` (all rows when there is none)."""
+    if watermark is None or pd.isna(watermark):
+        return df
+    return df[pd.to_datetime(df[time_col]) > pd.Timestamp(watermark)]
+
+
+def _key_frame(df, columns):
+    """Key/value columns with comparable dtypes (plain strings, naive datetimes)."""
+    out = pd.DataFrame(index=df.index)
+    for c in columns:
+        col = df[c]
+        if pd.api.types.is_datetime64_any_dtype(col) or c == "datetime":
+            col = pd.to_datetime(col)
+            if col.dt.tz is not None:
+                col = col.dt.tz_convert(None)
+        elif isinstance(col.dtype, pd.CategoricalDtype) or col.dtype == object:
+            col = col.astype(str)
+        out[c] = col.to_numpy()
+    return out
+
+
+def changed_rows(fg, df, compare=None, max_in_values=1000):
+    """
+    Rows of `df` whose primary key is not in `fg` yet, or whose `compare`
+    columns differ from the stored row. Only the key (and `compare`)
+    columns inside `df`'s own key range are read back.
+    """
+    key = list(fg.primary_key)
+    compare = [c for c in (compare or []) if c not in key]
+    if df.empty or not key:
+        return df
+
+    filters = []
+    for c in key:
+        values = df[c]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            filters += [(c, ">=", values.min()), (c, "<=", values.max())]
+        elif values.nunique() <= max_in_values:
+            filters.append((c, "in", [str(v) for v in values.unique()]))
+    existing = fg.read(columns=key + compare, filters=filters or None)
+    if existing.empty:
+        return df
+
+    ours = _key_frame(df, key + compare)
+    theirs = _key_frame(existing.drop_duplicates(key, keep="last"), key + compare)
+    merged = ours.merge(theirs, on=key, how="left", suffixes=("", "_stored"), indicator=True)
+    keep = (merged["_merge"] == "left_only").to_numpy()
+    for c in compare:
+        keep |= merged[c].to_numpy() != merged[f"{c}_stored"].to_numpy()
+    return df[keep]
+
+
+def chunk_frames(df, chunk_rows):
+    """Consecutive slices of at most `chunk_rows` rows."""
+    for start in range(0, len(df), max(int(chunk_rows), 1)):
+        yield df.iloc[start:start + chunk_rows]
+
+
+# -----------------------------------
+# 2. Writer
+# -----------------------------------
+def wait_for_job(job, timeout_s=JOB_TIMEOUT_S, poll_s=JOB_POLL_S):
+    """Poll a Hopsworks job until it ends; returns its final state ("TIMEOUT" if it did not end in time)."""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        state = job.get_final_state()
+        if state != "UNDEFINED":
+            return state
+        if time.monotonic() > deadline:
+            return "TIMEOUT"
+        time.sleep(poll_s)
+
+
+class FeatureWriter:
+    """
+    Inserts only what changed, in bounded chunks, without blocking on the
+    materialization jobs. The rows are accepted when `insert` returns; the
+    offline materialization runs in the background and picks up everything
+    queued since its last run, so only each write's last chunk starts a job.
+    Call `finish()` once at the end of the run to wait for those jobs and
+    fail the run if any of them failed.
+    """
+
+    def __init__(self, wait=None, chunk_rows=None, timeout_s=None):
+        self.wait = wait if wait is not None else os.getenv("FEATURE_WRITE_WAIT") == "1"
+        self.chunk_rows = chunk_rows or int(os.getenv("FEATURE_WRITE_CHUNK_ROWS", CHUNK_ROWS))
+        self.timeout_s = timeout_s or float(os.getenv("FEATURE_WRITE_TIMEOUT_S", JOB_TIMEOUT_S))
+        self.jobs = []
+        self.stats = {}
+
+    def write(self, fg, df, delta=None, compare=None, watermark=None):
+        """
+        Write `df` to `fg` and return the number of rows sent.
+
+        delta=None: send every row (the caller already diffed)
+        delta="pk": skip rows already stored with the same `compare` values
+        delta="watermark": send only rows newer than `watermark`
+        """
+        total = len(df)
+        if delta == "pk":
+            df = changed_rows(fg, df, compare)
+        elif delta == "watermark":
+            df = after_watermark(df, watermark)
+        elif delta is not None:
+            raise ValueError(f"Unknown delta mode: {delta} (expected None, 'pk' or 'watermark')")
+
+        n_chunks = int(np.ceil(len(df) / self.chunk_rows))
+        background = False
+        for i, chunk in enumerate(chunk_frames(df, self.chunk_rows)):
+            last = i == n_chunks - 1
+            job = fg.insert(chunk, wait=self.wait and last, materialize=last)
+            if job is not None and last and not self.wait:
+                self.jobs.append((fg.name, job))
+                background = True
+
+        self.stats[fg.name] = {"rows_in": total, "rows_written": len(df), "chunks": n_chunks}
+        print(f"{fg.name}: wrote {len(df)} of {total} rows in {n_chunks} chunk(s)"
+              + (", materialization running in the background" if background else ""))
+        return len(df)
+
+    def finish(self):
+        """Wait for outstanding materialization jobs; raises if any did not succeed."""
+        failed = []
+        for name, job in self.jobs:
+            state = wait_for_job(job, self.timeout_s)
+            print(f"{name}: materialization {state}")
+            if state != "SUCCEEDED":
+                failed.append(f"{name} ({state})")
+        self.jobs = []
+        if failed:
+            raise RuntimeError(f"Materialization did not succeed for: {', '.join(failed)}; "
+                               "the next materialization run picks up the queued rows")
@@ -0,0 +1,196 @@
+# File: src/common/profiling.py
+
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_DIR = "data/profiling"
+# PROFILE_OUTPUT: JSON-lines file each run's stage report is appended to
+# PROFILE_MLFLOW=1: also log stage metrics to MLflow
+# PROFILE_STAGE=<stage>: dump a cProfile of that stage to PROFILE_DIR
+
+
+def peak_rss_mb(who="self"):
+    """High-water resident set size so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    scale = 2**20 if os.uname().sysname == "Darwin" else 2**10
+    return usage.ru_maxrss / scale
+
+
+def child_cpu_s():
+    """CPU seconds of finished child processes (process pools)."""
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+# -----------------------------------
+# 1. Stage records
+# -----------------------------------
+class Stage:
+    """Timing of one stage; set `rows` inside the block to record how much data it handled."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.status = "ok"
+        self.wall_s = self.cpu_s = self.child_cpu_s = None
+        self.peak_rss_mb = self.rss_growth_mb = self.child_peak_rss_mb = None
+
+    def as_dict(self):
+        return {k: (round(v, 4) if isinstance(v, float) else v) for k, v in vars(self).items()}
+
+
+class StageProfiler:
+    """
+    Collects per-stage wall time, CPU time (own and child processes), peak
+    RSS and row counts for one pipeline run, then reports them as one JSON
+    document. Peak RSS is the process high-water mark at the end of a stage;
+    `rss_growth_mb` is how far the stage raised it.
+    """
+
+    def __init__(self, pipeline, profile_stage=None):
+        self.pipeline = pipeline
+        self.stages = []
+        self.started = datetime.utcnow()
+        self._t0 = time.perf_counter()
+        self.profile_stage = profile_stage if profile_stage is not None else os.getenv("PROFILE_STAGE")
+
+    @contextmanager
+    def stage(self, name):
+        record = Stage(name)
+        profiler = cProfile.Profile() if self.profile_stage == name else None
+        rss_before = peak_rss_mb()
+        wall, cpu, child = time.perf_counter(), time.process_time(), child_cpu_s()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        except BaseException:
+            record.status = "error"
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            record.wall_s = time.perf_counter() - wall
+            record.cpu_s = time.process_time() - cpu
+            record.child_cpu_s = child_cpu_s() - child
+            record.peak_rss_mb = peak_rss_mb()
+            record.rss_growth_mb = record.peak_rss_mb - rss_before if rss_before is not None else None
+            record.child_peak_rss_mb = peak_rss_mb("children")
+            self.stages.append(record)
+            if profiler:
+                self.dump_profile(name, profiler)
+
+    def dump_profile(self, name, profiler, top=20):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{self.pipeline}.{name}.prof")
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        print(f"[profile] cProfile of {self.pipeline}/{name} saved to {path}\n{out.getvalue()}")
+
+    # ---------------------------
+    # Reporting
+    # ---------------------------
+    def as_dict(self):
+        return {
+            "pipeline": self.pipeline,
+            "started_at": self.started.isoformat(timespec="seconds"),
+            "total_wall_s": round(time.perf_counter() - self._t0, 4),
+            "stages": [s.as_dict() for s in self.stages],
+        }
+
+    def report(self, output=None, log_mlflow=None):
+        """Print the run's stages as one JSON line; append it to `output` and log to MLflow if asked."""
+        report = self.as_dict()
+        line = json.dumps(report, default=str)
+        print(f"[profile] {line}")
+
+        output = output or os.getenv("PROFILE_OUTPUT")
+        if output:
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            with open(output, "a") as f:
+                f.write(line + "\n")
+
+        if log_mlflow if log_mlflow is not None else os.getenv("PROFILE_MLFLOW") == "1":
+            self.log_to_mlflow()
+        return report
+
+    def log_to_mlflow(self):
+        """Stage metrics on the active MLflow run, or on a short run of their own."""
+        import mlflow
+
+        metrics = {}
+        for s in self.stages:
+            for key in ("wall_s", "cpu_s", "child_cpu_s", "peak_rss_mb", "rows"):
+                value = getattr(s, key)
+                if value is not None:
+                    metrics[f"stage.{s.name}.{key}"] = float(value)
+        try:
+            if mlflow.active_run():
+                mlflow.log_metrics(metrics)
+            else:
+                with mlflow.start_run(run_name=f"profile_{self.pipeline}"):
+                    mlflow.set_tag("pipeline", self.pipeline)
+                    mlflow.log_metrics(metrics)
+        except Exception as e:
+            print(f"[profile] Could not log stage metrics to MLflow: {e}")
+
+
+# -----------------------------------
+# 2. Module-level helpers
+# -----------------------------------
+_current = None
+
+
+def current_profiler():
+    """The profiler of the running pipeline (a throwaway one outside `profile_pipeline`)."""
+    return _current or StageProfiler("adhoc")
+
+
+def stage(name):
+    """`with stage("read_hourly") as s: ...; s.rows = len(df)` on the running pipeline's profiler."""
+    return current_profiler().stage(name)
+
+
+def profiled(name=None):
+    """Record a function call as a stage; rows come from `len()` of its result when it has one."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name or fn.__name__) as s:
+                result = fn(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    s.rows = len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def profile_pipeline(pipeline):
+    """Decorate a pipeline's `main`: stages inside it are collected and reported when it returns or fails."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _current
+            outer, _current = _current, StageProfiler(pipeline)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current.report()
+                _current = outer
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+# File: src/common/schema.py
+
+import numpy as np
+import pandas as pd
+
+STATION_COL = "start_station_name"
+TIME_COL = "datetime"
+TARGET_COL = "trip_count"
+LAG_DTYPE = np.float32
+TRIP_COLUMNS = ["started_at", "ended_at", "start_station_name", "end_station_name", "trip_duration_min"]
+
+
+# -----------------------------------
+# 1. Column representations
+# -----------------------------------
+def count_dtype(max_value):
+    """Narrowest signed integer type that holds counts up to `max_value`."""
+    for dtype in (np.int16, np.int32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def as_station_category(stations):
+    """Stations as a categorical with sorted categories (int codes + one copy of each name)."""
+    if isinstance(stations.dtype, pd.CategoricalDtype) and stations.cat.categories.is_monotonic_increasing:
+        return stations
+    values = stations.astype(str)
+    return values.astype(pd.CategoricalDtype(sorted(values.unique())))
+
+
+def map_stations(stations, mapping):
+    """`stations.map(mapping)` computed once per category instead of once per row."""
+    if isinstance(stations.dtype, pd.CategoricalDtype):
+        per_category = mapping.reindex(stations.cat.categories).to_numpy()
+        codes = stations.cat.codes.to_numpy()
+        values = per_category[np.where(codes < 0, 0, codes)] if len(per_category) else np.full(len(codes), np.nan)
+        return pd.Series(values, index=stations.index).where(codes >= 0)
+    return stations.map(mapping)
+
+
+# -----------------------------------
+# 2. Frame schemas per stage
+# -----------------------------------
+def compact_hourly(df, station_col=STATION_COL, time_col=TIME_COL, target_col=TARGET_COL):
+    """Hourly counts: categorical station, naive datetime64[ns], narrow integer counts."""
+    df = df.copy()
+    df[station_col] = as_station_category(df[station_col])
+    df[time_col] = pd.to_datetime(df[time_col])
+    if target_col in df and len(df):
+        df[target_col] = df[target_col].astype(count_dtype(int(df[target_col].max())))
+    return df
+
+
+def compact_lag_features(df, station_col=STATION_COL, time_col=TIME_COL, target_col=TARGET_COL):
+    """Lag feature rows: `compact_hourly` plus float32 `lag_*` columns (NaN-capable)."""
+    df = compact_hourly(df, station_col, time_col, target_col)
+    lag_cols = [c for c in df.columns if c.startswith("lag_")]
+    if lag_cols:
+        df[lag_cols] = df[lag_cols].astype(LAG_DTYPE)
+    return df
+
+
+def compact_trips(df):
+    """Cleaned trips: only the columns later stages use, float32 durations."""
+    df = df[[c for c in TRIP_COLUMNS if c in df.columns]]
+    if "trip_duration_min" in df:
+        df = df.assign(trip_duration_min=df["trip_duration_min"].astype(np.float32))
+    return df
+
+
+def storage_frame(df):
+    """
+    Widen compact columns back to the types the v1 Hopsworks feature groups
+    were registered with (string, bigint, double), so inserts keep matching
+    the existing schemas.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            out[col] = s.astype(str)
+        elif pd.api.types.is_integer_dtype(s.dtype) and s.dtype != np.int64:
+            out[col] = s.astype(np.int64)
+        elif pd.api.types.is_float_dtype(s.dtype) and s.dtype != np.float64:
+            out[col] = s.astype(np.float64)
+    return df.assign(**out) if out else df
+
+
+# -----------------------------------
+# 3. Memory report
+# -----------------------------------
+def memory_mb(df):
+    return df.memory_usage(index=True, deep=True).sum() / 2**20
+
+
+def memory_report(stage, df, top=3):
+    """Print and return the deep memory footprint of `df` at `stage`, with its widest columns."""
+    usage = df.memory_usage(index=False, deep=True).sort_values(ascending=False)
+    total = memory_mb(df)
+    widest = ", ".join(f"{c}={b / 2**20:.1f}MB" for c, b in usage.head(top).items())
+    print(f"[memory] {stage}: {len(df)} rows x {df.shape[1]} cols, {total:.1f} MB ({widest})")
+    return total
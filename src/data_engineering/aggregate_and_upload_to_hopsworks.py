@@ -1,50 +1,123 @@
+import argparse
+import os
 import pandas as pd
-import hopsworks
-from pathlib import Path
+from src.common.feature_store import get_feature_store
+from src.common.feature_writer import FeatureWriter
+from src.common.profiling import profile_pipeline, profiled, stage
+from src.common.schema import compact_hourly, memory_report
+
+PROCESSED_DIR = "data/processed/citibike_trips"
+HOURLY_FILE = "data/processed/citibike_hourly_trips.parquet"
+
 
 # -------------------------------
 # Step 1: Load the Cleaned Dataset
 # -------------------------------
-input_file = Path("data/processed/citibike_top3stations_2years.csv")
-# Step 1: Load cleaned CSV and ensure datetime conversion
-df = pd.read_csv(input_file)
-df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
-
-# Explicit conversion
-df['started_at'] = pd.to_datetime(df['started_at'], errors='coerce')
+@profiled()
+def load_trips(dataset_dir=PROCESSED_DIR, stations=None, start_month=None, end_month=None):
+    """
+    Read only `start_station_name` and `started_at` from the partitioned
+    Parquet dataset. Month and station filters prune whole partitions;
+    `started_at` is already a typed timestamp, so no re-parsing is needed.
+    """
+    filters = []
+    if stations is not None:
+        filters.append(("start_station_name", "in", list(stations)))
+    if start_month is not None:
+        filters.append(("month", ">=", int(start_month)))
+    if end_month is not None:
+        filters.append(("month", "<=", int(end_month)))
 
-# Drop rows with invalid/missing dates
-df = df.dropna(subset=["started_at"])
+    df = pd.read_parquet(
+        dataset_dir,
+        columns=["start_station_name", "started_at"],
+        filters=filters or None,
+    )
+    df['start_station_name'] = df['start_station_name'].astype(str).astype("category")
+    return df
 
-# Continue with transformation
-df['datetime'] = df['started_at'].dt.floor('H')
 
 # -------------------------------
 # Step 2: Transform to Hourly Trip Count
 # -------------------------------
-df['datetime'] = df['started_at'].dt.floor('H')
-df_hourly = df.groupby(['start_station_name', 'datetime']).size().reset_index(name='trip_count')
-print(f"Transformed to time series format: {df_hourly.shape}")
+@profiled()
+def hourly_counts(df):
+    df = df.assign(datetime=df['started_at'].dt.floor('h'))
+    counts = df.groupby(['start_station_name', 'datetime'], observed=True).size().reset_index(name='trip_count')
+    return compact_hourly(counts)
 
-# -------------------------------
-# Step 3: Connect to Hopsworks
-# -------------------------------
-project = hopsworks.login(project="meghana_spring25_taxi")  # change if needed
-fs = project.get_feature_store()
 
-# -------------------------------
-# Step 4: Create Feature Group
-# -------------------------------
-feature_group = fs.get_or_create_feature_group(
-    name="citibike_hourly_trips",
-    version=1,
-    description="Hourly Citi Bike trip counts for top 3 stations (2024-2025)",
-    primary_key=["start_station_name", "datetime"],
-    event_time="datetime"
-)
+def read_hourly_file(hourly_file, stations=None, start_month=None, end_month=None):
+    """Pre-aggregated hourly counts, with the same station and month filters as `load_trips`."""
+    filters = []
+    if stations is not None:
+        filters.append(("start_station_name", "in", list(stations)))
+    if start_month is not None:
+        filters.append(("datetime", ">=", pd.Timestamp(f"{start_month}01")))
+    if end_month is not None:
+        filters.append(("datetime", "<", pd.Timestamp(f"{end_month}01") + pd.DateOffset(months=1)))
+    return compact_hourly(pd.read_parquet(hourly_file, filters=filters or None))
 
-# -------------------------------
-# Step 5: Insert Data
-# -------------------------------
-feature_group.insert(df_hourly, write_options={"wait_for_job": True})
-print("Feature group created and data uploaded to Hopsworks!")
+
+@profile_pipeline("aggregate_and_upload")
+def main(dataset_dir=None, stations=None, start_month=None, end_month=None, hourly_file=None):
+    if not hourly_file and dataset_dir is None and not os.path.exists(PROCESSED_DIR) \
+            and os.path.exists(HOURLY_FILE):
+        # The default `fetch --mode hourly` writes only the hourly counts
+        print(f"No trip dataset at {PROCESSED_DIR}, uploading the hourly counts in {HOURLY_FILE}")
+        hourly_file = HOURLY_FILE
+    if hourly_file:
+        # Ingestion already aggregated while parsing; upload its output
+        with stage("read_hourly") as s:
+            df_hourly = read_hourly_file(hourly_file, stations, start_month, end_month)
+            s.rows = len(df_hourly)
+        print(f"Loaded hourly counts from {hourly_file}: {df_hourly.shape}")
+    else:
+        df = load_trips(dataset_dir or PROCESSED_DIR, stations, start_month, end_month)
+        df_hourly = hourly_counts(df)
+        print(f"Transformed to time series format: {df_hourly.shape}")
+
+    memory_report("aggregate/hourly", df_hourly)
+
+    # -------------------------------
+    # Step 3: Connect to the feature store
+    # -------------------------------
+    store = get_feature_store(project_name=os.getenv("HOPSWORKS_PROJECT") or "meghana_spring25_taxi")
+
+    # -------------------------------
+    # Step 4: Create Feature Group
+    # -------------------------------
+    with stage("connect"):
+        # The Hopsworks login happens on first use, here
+        feature_group = store.get("citibike_hourly_trips")
+
+    # -------------------------------
+    # Step 5: Insert new and changed hours only
+    # -------------------------------
+    writer = FeatureWriter()
+    with stage("insert_hourly") as s:
+        s.rows = writer.write(feature_group, df_hourly, delta="pk", compare=["trip_count"])
+    with stage("wait_for_jobs"):
+        writer.finish()
+    print(f"Feature group created and data uploaded to the {store.backend} feature store!")
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Aggregate processed trips to hourly counts and upload them")
+    parser.add_argument("--input", default=None,
+                        help=f"partitioned Parquet dataset directory (default {PROCESSED_DIR}, "
+                             f"or {HOURLY_FILE} when only that exists)")
+    parser.add_argument("--station", action="append", dest="stations", help="only these start stations")
+    parser.add_argument("--start-month", help="first source month to include, e.g. 202401")
+    parser.add_argument("--end-month", help="last source month to include, e.g. 202504")
+    parser.add_argument("--hourly-input", nargs="?", const=HOURLY_FILE, default=None,
+                        help=f"upload pre-aggregated hourly counts instead of --input (default file {HOURLY_FILE}); "
+                             "station and month filters still apply")
+    args = parser.parse_args(argv)
+    if args.hourly_input and args.input:
+        parser.error("--input and --hourly-input are alternative sources; pass only one")
+    main(args.input, args.stations, args.start_month, args.end_month, args.hourly_input)
+
+
+if __name__ == "__main__":
+    cli()
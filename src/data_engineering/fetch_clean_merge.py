@@ -1,75 +1,423 @@
+import argparse
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shutil
 import zipfile
-import io
 import requests
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from src.common.profiling import profile_pipeline, stage
+from src.common.schema import compact_hourly, compact_trips, memory_report
+from src.data_engineering.tripdata_cache import CACHE_DIR, TripdataCache, cleaned_path_for
 
-# Define range
-years = [2024, 2025]
-months = list(range(1, 13))
-dataframes = []
-
-# Download 2 years: Mar 2023 to Feb 2025
-for year in years:
-    for month in months:
-        if (year == 2025 and month > 4):
-            continue  # Skip out-of-range months
-
-        yyyymm = f"{year}{month:02d}"
-        url = f"https://s3.amazonaws.com/tripdata/{yyyymm}-citibike-tripdata.csv.zip"
-
-        try:
-            print(f"[{datetime.now()}] Downloading {url}...")
-            response = requests.get(url)
-            if response.status_code != 200:
-                print(f"Failed to download {yyyymm}, skipping...")
-                print("Trying without .csv")
-                url = f"https://s3.amazonaws.com/tripdata/{yyyymm}-citibike-tripdata.zip"
-                response = requests.get(url)
-                if response.status_code != 200:
-                    print(f"Failed to download {yyyymm} without .csv, skipping...")
-                    continue
-                else:
-                    print(f"Downloaded {yyyymm} without .csv")
-
-            with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-                csv_filename = z.namelist()[0]
-                with z.open(csv_filename) as f:
-                    df = pd.read_csv(f)
-                    df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
-
-                    # Convert datetime fields
-                    df['started_at'] = pd.to_datetime(df['started_at'], errors='coerce')
-                    df['ended_at'] = pd.to_datetime(df['ended_at'], errors='coerce')
-
-                    # Trip duration in minutes
-                    df['trip_duration_min'] = (df['ended_at'] - df['started_at']).dt.total_seconds() / 60
-
-                    # Basic cleaning
-                    df = df.dropna(subset=['started_at', 'ended_at', 'start_station_name', 'end_station_name', 'trip_duration_min'])
-                    df = df[(df['trip_duration_min'] >= 1) & (df['trip_duration_min'] <= 120)]
-
-                    dataframes.append(df)
-
-                    print(f"Loaded {yyyymm}: {len(df)} rows")
-
-        except Exception as e:
-            print(f"Error processing {yyyymm}: {e}")
-            continue
-
-# Combine all months
-print(f"[{datetime.now()}] Combining all months...")
-df_all = pd.concat(dataframes, ignore_index=True)
-print(f"Combined dataset shape: {df_all.shape}")
-
-# Top 3 most frequent start stations
-top_stations = df_all['start_station_name'].value_counts().nlargest(3).index.tolist()
-print(f"Top 3 Start Stations: {top_stations}")
-
-# Filter to top stations
-df_top3 = df_all[df_all['start_station_name'].isin(top_stations)].copy()
-
-# Save to CSV
-output_file = "data/processed/citibike_top3stations_2years.csv"
-df_top3.to_csv(output_file, index=False)
-print(f"Saved cleaned 2-year data to {output_file} with {len(df_top3)} rows.")
+BASE_URL = "https://s3.amazonaws.com/tripdata"
+# Processed trips: Parquet dataset partitioned by source month and start station
+PROCESSED_DIR = "data/processed/citibike_trips"
+PARTITION_COLS = ["month", "start_station_name"]
+# Hourly counts shaped like the citibike_hourly_trips feature group
+HOURLY_FILE = "data/processed/citibike_hourly_trips.parquet"
+
+# Only the columns the pipeline uses, with pinned dtypes
+USECOLS = ["started_at", "ended_at", "start_station_name", "end_station_name"]
+DTYPES = {"start_station_name": "string", "end_station_name": "string",
+          "started_at": "string", "ended_at": "string"}
+DATETIME_FORMAT = "ISO8601"  # e.g. 2024-01-22 18:43:19.012
+CSV_CHUNKSIZE = 500_000
+
+
+def normalize_column(name):
+    return name.strip().lower().replace(" ", "_")
+
+
+# -------------------------------
+# Month range and URLs
+# -------------------------------
+def months_in_range(years=(2024, 2025), last_month_2025=4):
+    months = []
+    for year in years:
+        for month in range(1, 13):
+            if year == 2025 and month > last_month_2025:
+                continue  # Skip out-of-range months
+            months.append(f"{year}{month:02d}")
+    return months
+
+
+def candidate_urls(yyyymm):
+    # Older archives are named *.csv.zip, newer ones drop the .csv
+    return [
+        f"{BASE_URL}/{yyyymm}-citibike-tripdata.csv.zip",
+        f"{BASE_URL}/{yyyymm}-citibike-tripdata.zip",
+    ]
+
+
+# -------------------------------
+# Download (streamed to disk)
+# -------------------------------
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_month(session, yyyymm, cache):
+    """Return the cached archive for one month, downloading it only if it is new."""
+    return cache.fetch(session, yyyymm, candidate_urls(yyyymm))
+
+
+# -------------------------------
+# Parse and clean (chunked)
+# -------------------------------
+def clean_trips(df):
+    df.columns = [normalize_column(c) for c in df.columns]
+
+    # Convert datetime fields
+    df['started_at'] = pd.to_datetime(df['started_at'], format=DATETIME_FORMAT, errors='coerce')
+    df['ended_at'] = pd.to_datetime(df['ended_at'], format=DATETIME_FORMAT, errors='coerce')
+
+    # Trip duration in minutes
+    df['trip_duration_min'] = (df['ended_at'] - df['started_at']).dt.total_seconds() / 60
+
+    # Basic cleaning
+    df = df.dropna(subset=['started_at', 'ended_at', 'start_station_name', 'end_station_name', 'trip_duration_min'])
+    return compact_trips(df[(df['trip_duration_min'] >= 1) & (df['trip_duration_min'] <= 120)])
+
+
+def iter_month_chunks(path, chunksize=CSV_CHUNKSIZE):
+    """Yield cleaned chunks from a cleaned Parquet file or every CSV inside a monthly archive."""
+    if str(path).endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    with zipfile.ZipFile(path) as z:
+        members = [n for n in z.namelist() if n.endswith(".csv") and not n.startswith("__MACOSX")]
+        for member in members:
+            with z.open(member) as f:
+                reader = pd.read_csv(
+                    f,
+                    usecols=lambda c: normalize_column(c) in USECOLS,
+                    dtype=DTYPES,
+                    chunksize=chunksize,
+                )
+                for chunk in reader:
+                    yield clean_trips(chunk)
+
+
+def write_cleaned_parquet(zip_path, chunksize=CSV_CHUNKSIZE):
+    """Parse an archive once into its cached cleaned Parquet; returns the Parquet path."""
+    parquet_path = cleaned_path_for(zip_path)
+    if parquet_path.exists():
+        return parquet_path
+
+    tmp = parquet_path.with_suffix(".parquet.tmp")
+    writer = None
+    try:
+        for chunk in iter_month_chunks(zip_path, chunksize):
+            table = pa.Table.from_pandas(chunk, preserve_index=False,
+                                         schema=writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return None
+    os.replace(tmp, parquet_path)
+    # Output of an older cleaning version is never read again
+    for stale in parquet_path.parent.glob(f"{Path(zip_path).stem}*.parquet"):
+        if stale != parquet_path:
+            stale.unlink(missing_ok=True)
+    return parquet_path
+
+
+def parse_cached_month(parse_fn, zip_path, chunksize=CSV_CHUNKSIZE):
+    """Run `parse_fn` over the month's cleaned Parquet, building it on first use."""
+    parquet_path = write_cleaned_parquet(zip_path, chunksize)
+    if parquet_path is None:
+        return parse_fn(zip_path, chunksize)
+    return parse_fn(parquet_path, chunksize)
+
+
+def count_month_stations(zip_path, chunksize=CSV_CHUNKSIZE):
+    """First pass: running start-station counts for one month, one chunk at a time."""
+    counts = pd.Series(dtype="int64")
+    for chunk in iter_month_chunks(zip_path, chunksize):
+        counts = counts.add(chunk['start_station_name'].value_counts(), fill_value=0)
+    return counts.astype("int64")
+
+
+def filter_month_stations(zip_path, stations, chunksize=CSV_CHUNKSIZE):
+    """Second pass: keep only the selected stations' rows for one month."""
+    kept = [chunk[chunk['start_station_name'].isin(stations)]
+            for chunk in iter_month_chunks(zip_path, chunksize)]
+    kept = [chunk for chunk in kept if not chunk.empty]
+    if not kept:
+        return pd.DataFrame(columns=USECOLS + ["trip_duration_min"])
+    return pd.concat(kept, ignore_index=True)
+
+
+def hourly_month_counts(zip_path, chunksize=CSV_CHUNKSIZE):
+    """Hourly trips per start station for one month, grouped chunk by chunk while parsing."""
+    partials = []
+    for chunk in iter_month_chunks(zip_path, chunksize):
+        hours = chunk['started_at'].dt.floor('h').rename('datetime')
+        partials.append(chunk.groupby([chunk['start_station_name'], hours], observed=True).size())
+    return merge_hourly_counts(partials)
+
+
+def merge_hourly_counts(partials):
+    """Sum partial (start_station_name, datetime) counts from chunks or months."""
+    partials = [p for p in partials if len(p)]
+    if not partials:
+        return pd.Series(dtype="int64", index=pd.MultiIndex.from_arrays(
+            [[], pd.DatetimeIndex([])], names=["start_station_name", "datetime"]), name="trip_count")
+    merged = pd.concat(partials).groupby(level=["start_station_name", "datetime"]).sum()
+    return merged.astype("int64").rename("trip_count")
+
+
+def load_month(zip_path, chunksize=CSV_CHUNKSIZE):
+    chunks = list(iter_month_chunks(zip_path, chunksize))
+    if not chunks:
+        return pd.DataFrame(columns=USECOLS + ["trip_duration_min"])
+    return pd.concat(chunks, ignore_index=True)
+
+
+# -------------------------------
+# Concurrent ingestion
+# -------------------------------
+def ingest_months(months, cache, parse_fn=load_month, download_workers=4,
+                  parse_workers=None, chunksize=CSV_CHUNKSIZE, use_cleaned=True):
+    """
+    Fetch months through the cache in a bounded thread pool over one shared
+    session and hand each archive to a process pool running `parse_fn` over
+    the month's cleaned Parquet (built on first use), or straight over the
+    archive when `use_cleaned` is False. Yields (yyyymm, result) in
+    completion order. After each download the cache is trimmed to its size
+    limit, never evicting one of `months`.
+    """
+    with make_session(download_workers) as session, \
+            ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parsers:
+        pending = {downloads.submit(download_month, session, m, cache): m for m in months}
+        parsing = {}
+        for future in as_completed(pending):
+            yyyymm = pending[future]
+            try:
+                path = future.result()
+            except Exception as e:
+                print(f"Error downloading {yyyymm}: {e}")
+                continue
+            cache.evict(keep=months)
+            if path is None:
+                continue
+            if use_cleaned:
+                parsing[parsers.submit(parse_cached_month, parse_fn, path, chunksize)] = yyyymm
+            else:
+                parsing[parsers.submit(parse_fn, path, chunksize)] = yyyymm
+
+        for future in as_completed(parsing):
+            yyyymm = parsing[future]
+            try:
+                yield yyyymm, future.result()
+            except Exception as e:
+                print(f"Error processing {yyyymm}: {e}")
+
+
+# -------------------------------
+# Processed output
+# -------------------------------
+def write_month_partition(df_month, yyyymm, dataset_dir=PROCESSED_DIR):
+    """Write one source month into the partitioned dataset, replacing that whole month."""
+    # Drop every station of the month first: the selected stations can change between runs
+    shutil.rmtree(os.path.join(dataset_dir, f"month={int(yyyymm)}"), ignore_errors=True)
+    if df_month.empty:
+        return
+    table = pa.Table.from_pandas(df_month.assign(month=int(yyyymm)), preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=dataset_dir,
+        partition_cols=PARTITION_COLS,
+        basename_template=f"{yyyymm}-{{i}}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+
+
+def select_top_stations(counts, top_n=3):
+    return counts.nlargest(top_n).index.tolist()
+
+
+def main_in_memory(months, cache, top_n=3, download_workers=4, parse_workers=None,
+                   chunksize=CSV_CHUNKSIZE, dataset_dir=PROCESSED_DIR):
+    dataframes = []
+    with stage("ingest") as s:
+        for yyyymm, df in ingest_months(months, cache, download_workers=download_workers,
+                                        parse_workers=parse_workers, chunksize=chunksize):
+            dataframes.append(df.assign(month=int(yyyymm)))
+            print(f"Loaded {yyyymm}: {len(df)} rows")
+        s.rows = sum(len(df) for df in dataframes)
+
+    # Combine all months
+    print(f"[{datetime.now()}] Combining all months...")
+    with stage("combine") as s:
+        df_all = pd.concat(dataframes, ignore_index=True)
+        s.rows = len(df_all)
+    print(f"Combined dataset shape: {df_all.shape}")
+
+    # Top N most frequent start stations
+    top_stations = select_top_stations(df_all['start_station_name'].value_counts(), top_n)
+    print(f"Top {top_n} Start Stations: {top_stations}")
+
+    # Filter to top stations
+    df_top = df_all[df_all['start_station_name'].isin(top_stations)].copy()
+
+    # Save as partitioned Parquet
+    with stage("write_trips") as s:
+        for month, df_month in df_top.groupby("month"):
+            write_month_partition(df_month.drop(columns="month"), str(month), dataset_dir)
+        s.rows = len(df_top)
+    print(f"Saved cleaned data to {dataset_dir} with {len(df_top)} rows.")
+
+
+def write_selected_trips(cache, months, stations, parse_workers=None, chunksize=CSV_CHUNKSIZE,
+                         dataset_dir=PROCESSED_DIR):
+    """Re-scan cached months and write only the selected stations' trips as partitions."""
+    total_rows = 0
+    months = sorted(months)
+    with stage("write_trips") as s, ProcessPoolExecutor(max_workers=parse_workers) as parsers:
+        # Archives without a CSV have no cleaned Parquet; read those from the zip like parse_cached_month
+        months = [m for m in months if cache.archive_path(m) is not None]
+        paths = [cache.cleaned_path(m) if cache.cleaned_path(m).exists() else cache.archive_path(m)
+                 for m in months]
+        results = parsers.map(filter_month_stations, paths, [stations] * len(paths),
+                              [chunksize] * len(paths))
+        for yyyymm, df_month in zip(months, results):
+            write_month_partition(df_month, yyyymm, dataset_dir)
+            total_rows += len(df_month)
+            print(f"Filtered {yyyymm}: {len(df_month)} rows")
+        s.rows = total_rows
+
+    print(f"Saved cleaned data to {dataset_dir} with {total_rows} rows.")
+
+
+def main_streaming(months, cache, top_n=3, download_workers=4, parse_workers=None,
+                   chunksize=CSV_CHUNKSIZE, dataset_dir=PROCESSED_DIR):
+    """
+    Two passes over the months held in `cache`: the first keeps only
+    running station counts, the second re-scans each month and writes the
+    selected stations' rows as that month's partitions. Peak memory is one
+    month's chunks.
+    """
+    # Pass 1: station counts only
+    counts = pd.Series(dtype="int64")
+    scanned = []
+    with stage("count_stations") as s:
+        for yyyymm, month_counts in ingest_months(months, cache, parse_fn=count_month_stations,
+                                                  download_workers=download_workers,
+                                                  parse_workers=parse_workers, chunksize=chunksize):
+            counts = counts.add(month_counts, fill_value=0)
+            scanned.append(yyyymm)
+            print(f"Counted {yyyymm}: {int(month_counts.sum())} trips, {len(month_counts)} stations")
+        s.rows = int(counts.sum())
+
+    top_stations = select_top_stations(counts, top_n)
+    print(f"Top {top_n} Start Stations: {top_stations}")
+
+    # Pass 2: re-scan cached months and keep only the selected stations
+    write_selected_trips(cache, scanned, top_stations, parse_workers, chunksize, dataset_dir)
+
+
+def main_hourly(months, cache, top_n=3, keep_trips=False, download_workers=4, parse_workers=None,
+                chunksize=CSV_CHUNKSIZE, dataset_dir=PROCESSED_DIR, hourly_file=HOURLY_FILE):
+    """
+    One pass that groups each parsed chunk into hourly station counts and
+    merges the partial counts across months, so memory scales with
+    station-hours rather than trips. Writes `citibike_hourly_trips`-shaped
+    output. Archives are parsed straight from the zip; only `keep_trips`
+    writes the cleaned trip Parquet, which its second pass then re-scans.
+    """
+    partials = []
+    scanned = []
+    with stage("ingest_hourly") as s:
+        for yyyymm, month_hourly in ingest_months(months, cache, parse_fn=hourly_month_counts,
+                                                  download_workers=download_workers,
+                                                  parse_workers=parse_workers, chunksize=chunksize,
+                                                  use_cleaned=keep_trips):
+            partials.append(month_hourly)
+            scanned.append(yyyymm)
+            print(f"Aggregated {yyyymm}: {int(month_hourly.sum())} trips, {len(month_hourly)} station-hours")
+        s.rows = sum(len(p) for p in partials)
+
+    # Trips that started before midnight at month end land in the same hour from two archives
+    with stage("merge_hourly") as s:
+        hourly = merge_hourly_counts(partials)
+        s.rows = len(hourly)
+
+    station_totals = hourly.groupby(level="start_station_name").sum()
+    top_stations = select_top_stations(station_totals, top_n)
+    print(f"Top {top_n} Start Stations: {top_stations}")
+
+    df_hourly = hourly[hourly.index.get_level_values("start_station_name").isin(top_stations)].reset_index()
+    df_hourly = compact_hourly(df_hourly)
+    memory_report("ingest/hourly", df_hourly)
+    with stage("write_hourly") as s:
+        os.makedirs(os.path.dirname(hourly_file) or ".", exist_ok=True)
+        df_hourly.to_parquet(hourly_file, index=False)
+        s.rows = len(df_hourly)
+    print(f"Saved hourly counts to {hourly_file}: {df_hourly.shape}")
+
+    if keep_trips:
+        write_selected_trips(cache, scanned, top_stations, parse_workers, chunksize, dataset_dir)
+
+
+@profile_pipeline("fetch_clean_merge")
+def main(mode="hourly", top_n=3, cache_dir=CACHE_DIR, cache_max_bytes=None, keep_trips=False,
+         hourly_file=HOURLY_FILE, **kwargs):
+    # Download 2 years: Jan 2024 to Apr 2025
+    months = months_in_range()
+    cache = TripdataCache(cache_dir, max_bytes=cache_max_bytes)
+    if mode == "hourly":
+        main_hourly(months, cache, top_n=top_n, keep_trips=keep_trips, hourly_file=hourly_file, **kwargs)
+    elif mode == "streaming":
+        main_streaming(months, cache, top_n=top_n, **kwargs)
+    else:
+        main_in_memory(months, cache, top_n=top_n, **kwargs)
+    with stage("evict_cache"):
+        cache.evict(keep=months)
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Download, clean and merge Citi Bike monthly trip data")
+    parser.add_argument("--download-workers", type=int, default=4, help="concurrent downloads")
+    parser.add_argument("--parse-workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=CSV_CHUNKSIZE, help="CSV rows parsed per chunk")
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR), help="archive and cleaned Parquet cache")
+    parser.add_argument("--cache-max-gb", type=float, default=None,
+                        help="evict least recently used months beyond this cache size")
+    parser.add_argument("--top-n", type=int, default=3, help="number of busiest start stations to keep")
+    parser.add_argument(
+        "--mode",
+        choices=["hourly", "streaming", "in-memory"],
+        default="hourly",
+        help="hourly: aggregate while parsing the archives (one pass); streaming: two-pass trip-level scan; "
+             "in-memory: concatenate all months before selecting stations"
+    )
+    parser.add_argument("--keep-trips", action="store_true",
+                        help="in hourly mode, also persist the selected stations' trip rows (writes each month's cleaned Parquet)")
+    parser.add_argument("--output", default=PROCESSED_DIR, help="partitioned Parquet dataset directory")
+    parser.add_argument("--hourly-output", default=HOURLY_FILE, help="hourly counts Parquet file")
+    args = parser.parse_args(argv)
+    main(mode=args.mode, top_n=args.top_n, keep_trips=args.keep_trips, download_workers=args.download_workers,
+         parse_workers=args.parse_workers, chunksize=args.chunksize, cache_dir=args.cache_dir,
+         cache_max_bytes=int(args.cache_max_gb * 1e9) if args.cache_max_gb else None,
+         dataset_dir=args.output, hourly_file=args.hourly_output)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+CACHE_DIR = Path("data/cache")
+# Bump when clean_trips or the trip schema changes so cached cleaned Parquet is rebuilt
+CLEAN_VERSION = 1
+
+
+def sha256_file(path, block_bytes=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_bytes), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def url_variant(url):
+    return ".csv.zip" if url.endswith(".csv.zip") else ".zip"
+
+
+def content_range_total(response):
+    """Full size from a `Content-Range: bytes */N` header, or None."""
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def cleaned_path_for(zip_path, version=CLEAN_VERSION):
+    """Cleaned Parquet that belongs to a cached archive (its checksum stem plus the cleaning version)."""
+    zip_path = Path(zip_path)
+    return zip_path.parent.parent / "clean" / f"{zip_path.stem}-v{version}.parquet"
+
+
+class TripdataCache:
+    """
+    On-disk cache of monthly tripdata archives and their cleaned Parquet.
+
+    Layout under `root`:
+        raw/<yyyymm>-<sha12>.zip        downloaded archive, named by checksum
+        clean/<yyyymm>-<sha12>-v<N>.parquet  trips cleaned from that archive by CLEAN_VERSION N
+        partial/<yyyymm>.zip.part       interrupted download, resumed with Range
+        partial/<yyyymm>.zip.part.url   URL that partial download came from
+        manifest.json                   month -> url, sha256, files, last use
+
+    Past months never change, so a month in the manifest whose archive is
+    still on disk is never downloaded again.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.manifest_path = self.root / "manifest.json"
+        self._lock = threading.Lock()
+        for sub in ("raw", "clean", "partial"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    # -------------------------------
+    # Manifest
+    # -------------------------------
+    def _load_manifest(self):
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {"months": {}, "preferred_variant": None}
+
+    def _save_manifest(self):
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def archive_path(self, yyyymm):
+        entry = self.manifest["months"].get(yyyymm)
+        if entry is None:
+            return None
+        path = self.root / entry["zip"]
+        return path if path.exists() else None
+
+    def cleaned_path(self, yyyymm):
+        path = self.archive_path(yyyymm)
+        return cleaned_path_for(path) if path is not None else None
+
+    def order_urls(self, urls, first=None):
+        """Try `first` (the URL a partial download came from), then the variant that last succeeded."""
+        preferred = self.manifest.get("preferred_variant")
+        return sorted(urls, key=lambda url: (url != first, url_variant(url) != preferred))
+
+    # -------------------------------
+    # Download
+    # -------------------------------
+    def fetch(self, session, yyyymm, urls, chunk_bytes=1 << 20):
+        """Return the cached archive for `yyyymm`, downloading it only if missing."""
+        cached = self.archive_path(yyyymm)
+        if cached is not None:
+            self.touch(yyyymm)
+            print(f"Using cached {cached.name}")
+            return cached
+
+        partial = self.root / "partial" / f"{yyyymm}.zip.part"
+        partial_url = partial.with_suffix(".part.url")
+        resume_url = partial_url.read_text() if partial.exists() and partial_url.exists() else None
+        for url in self.order_urls(urls, first=resume_url):
+            print(f"[{datetime.now()}] Downloading {url}...")
+            # Only bytes from this same URL can be resumed
+            offset = partial.stat().st_size if url == resume_url else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            response = session.get(url, stream=True, timeout=60, headers=headers)
+            if response.status_code == 416 and offset:
+                response.close()
+                if content_range_total(response) == offset:
+                    print(f"{yyyymm} was already fully downloaded")
+                    return self._commit_download(yyyymm, url, partial)
+                # Stale partial file that the server can't resume; start this URL over
+                offset = 0
+                response = session.get(url, stream=True, timeout=60)
+            with response:
+                if response.status_code not in (200, 206):
+                    # Any partial download is kept for a later run
+                    print(f"Failed to download {url} ({response.status_code})")
+                    continue
+                resumed = response.status_code == 206 and offset > 0
+                if resumed:
+                    print(f"Resuming {yyyymm} from byte {offset}")
+                # Existing bytes are replaced only now that this URL is answering
+                with open(partial, "ab" if resumed else "wb") as f:
+                    partial_url.write_text(url)
+                    resume_url = url
+                    for chunk in response.iter_content(chunk_size=chunk_bytes):
+                        f.write(chunk)
+
+            return self._commit_download(yyyymm, url, partial)
+
+        print(f"Failed to download {yyyymm}, skipping...")
+        return None
+
+    def _commit_download(self, yyyymm, url, partial):
+        sha = sha256_file(partial)
+        target = self.root / "raw" / f"{yyyymm}-{sha[:12]}.zip"
+        os.replace(partial, target)
+        partial.with_suffix(".part.url").unlink(missing_ok=True)
+        with self._lock:
+            self.manifest["months"][yyyymm] = {
+                "url": url,
+                "sha256": sha,
+                "zip": str(target.relative_to(self.root)),
+                "parquet": str(cleaned_path_for(target).relative_to(self.root)),
+                "last_used": time.time(),
+            }
+            self.manifest["preferred_variant"] = url_variant(url)
+            self._save_manifest()
+        return target
+
+    # -------------------------------
+    # Usage tracking and eviction
+    # -------------------------------
+    def touch(self, yyyymm):
+        with self._lock:
+            self.manifest["months"][yyyymm]["last_used"] = time.time()
+            self._save_manifest()
+
+    def _entry_files(self, entry):
+        """The month's archive and its cleaned Parquet of any cleaning version."""
+        stem = Path(entry["zip"]).stem
+        return [self.root / entry["zip"]] + sorted((self.root / "clean").glob(f"{stem}*.parquet"))
+
+    def _entry_bytes(self, entry):
+        return sum(path.stat().st_size for path in self._entry_files(entry) if path.exists())
+
+    def size_bytes(self):
+        return sum(self._entry_bytes(entry) for entry in self.manifest["months"].values())
+
+    def evict(self, max_bytes=None, keep=()):
+        """Remove least recently used months until the cache fits in `max_bytes`, never those in `keep`."""
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        if max_bytes is None:
+            return []
+
+        evicted, keep = [], set(keep)
+        with self._lock:
+            months = self.manifest["months"]
+            total = sum(self._entry_bytes(entry) for entry in months.values())
+            for yyyymm in sorted(months, key=lambda m: months[m]["last_used"]):
+                if total <= max_bytes:
+                    break
+                if yyyymm in keep:
+                    continue
+                entry = months.pop(yyyymm)
+                total -= self._entry_bytes(entry)
+                for path in self._entry_files(entry):
+                    path.unlink(missing_ok=True)
+                evicted.append(yyyymm)
+            self._save_manifest()
+
+        if evicted:
+            print(f"Evicted {len(evicted)} months from cache: {evicted}")
+        return evicted
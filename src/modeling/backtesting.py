@@ -0,0 +1,215 @@
+# File: src/modeling/backtesting.py
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.linear_model import LinearRegression
+
+from src.modeling.multi_station import LAG_FEATURES
+
+BACKTEST_RESULTS = "backtest_results.csv"
+
+# Model configs compared by default: name -> (estimator, features)
+DEFAULT_CONFIGS = {
+    "lag1_linear": (LinearRegression(), ["lag_1"]),
+    "lag28_lightgbm": (lgb.LGBMRegressor(random_state=42, verbose=-1), LAG_FEATURES),
+    "lag_daily_lightgbm": (lgb.LGBMRegressor(random_state=42, verbose=-1),
+                           ["lag_1", "lag_2", "lag_3", "lag_23", "lag_24", "lag_25"]),
+}
+
+
+# -----------------------------------
+# 1. Rolling-origin folds
+# -----------------------------------
+def rolling_origin_folds(first_hour, last_hour, n_folds=4, test_hours=168, step_hours=None, min_train_hours=336):
+    """
+    (train_end, test_end) pairs on the hour axis, newest fold last. Each fold
+    trains on everything before `train_end` and tests on the following
+    `test_hours`; origins move back by `step_hours` (default: `test_hours`).
+    """
+    step_hours = step_hours or test_hours
+    folds = []
+    for k in range(n_folds):
+        test_end = last_hour + 1 - k * step_hours
+        train_end = test_end - test_hours
+        if train_end - first_hour < min_train_hours:
+            break
+        folds.append((int(train_end), int(test_end)))
+    return folds[::-1]
+
+
+# -----------------------------------
+# 2. Shared feature matrix
+# -----------------------------------
+class SharedFeatureMatrix:
+    """
+    Lag features, target and hour index for all stations saved as .npy files.
+    Rows are sorted by station then hour, so a station is one contiguous row
+    range and a fold is a slice inside it. Workers open the files with
+    `mmap_mode="r"`: the OS shares the pages and nothing is pickled per task.
+    """
+
+    def __init__(self, root, features, stations, offsets):
+        self.root = root
+        self.features = list(features)
+        self.stations = list(stations)
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, df, root, features=LAG_FEATURES, target_col="trip_count",
+              station_col="start_station_name", time_col="datetime"):
+        df = df.sort_values([station_col, time_col])
+        stations, counts = np.unique(df[station_col].astype(str).to_numpy(), return_counts=True)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        os.makedirs(root, exist_ok=True)
+        np.save(os.path.join(root, "X.npy"), df[features].to_numpy(dtype=np.float32))
+        np.save(os.path.join(root, "y.npy"), df[target_col].to_numpy(dtype=np.float32))
+        hours = pd.to_datetime(df[time_col]).to_numpy().astype("datetime64[h]").astype(np.int64)
+        np.save(os.path.join(root, "hours.npy"), hours)
+        return cls(root, features, stations, offsets)
+
+    def open(self):
+        return {
+            name: np.load(os.path.join(self.root, f"{name}.npy"), mmap_mode="r")
+            for name in ("X", "y", "hours")
+        }
+
+
+_SHARED = {}
+
+
+def _init_worker(matrix):
+    _SHARED.update(matrix.open())
+    _SHARED["features"] = matrix.features
+
+
+def _evaluate(fold, train_end, test_end, station, start, stop, config_name, estimator, features):
+    X, y, hours = _SHARED["X"], _SHARED["y"], _SHARED["hours"]
+    station_hours = hours[start:stop]
+    split = start + int(np.searchsorted(station_hours, train_end))
+    end = start + int(np.searchsorted(station_hours, test_end))
+    row = {"fold": fold, "train_end": train_end, "station": station, "config": config_name,
+           "train_rows": split - start, "test_rows": end - split, "mae": np.nan}
+    if row["train_rows"] == 0 or row["test_rows"] == 0:
+        return row
+
+    columns = [_SHARED["features"].index(f) for f in features]
+    model = clone(estimator)
+    if "n_jobs" in model.get_params():
+        model.set_params(n_jobs=1)
+    model.fit(X[start:split, columns], y[start:split])
+    y_pred = model.predict(X[split:end, columns])
+    row["mae"] = float(np.mean(np.abs(y[split:end] - y_pred)))
+    return row
+
+
+# -----------------------------------
+# 3. Folds x stations x configs in a process pool
+# -----------------------------------
+def run_backtest(df, configs=None, n_folds=4, test_hours=168, step_hours=None, min_train_hours=336,
+                 n_workers=None, workdir=None, station_col="start_station_name", time_col="datetime"):
+    """Evaluate every config on every station and fold; returns one row per evaluation."""
+    configs = configs or DEFAULT_CONFIGS
+    features = sorted({f for _, fs in configs.values() for f in fs}, key=LAG_FEATURES.index)
+
+    with tempfile.TemporaryDirectory(dir=workdir) as root:
+        matrix = SharedFeatureMatrix.build(df, root, features, station_col=station_col, time_col=time_col)
+        hours = matrix.open()["hours"]
+        folds = rolling_origin_folds(int(hours.min()), int(hours.max()), n_folds, test_hours,
+                                     step_hours, min_train_hours)
+        if not folds:
+            raise ValueError("Not enough history for a single backtest fold")
+
+        tasks = [
+            (fold, train_end, test_end, station, int(matrix.offsets[i]), int(matrix.offsets[i + 1]),
+             name, estimator, fs)
+            for fold, (train_end, test_end) in enumerate(folds)
+            for i, station in enumerate(matrix.stations)
+            for name, (estimator, fs) in configs.items()
+        ]
+
+        n_workers = n_workers or os.cpu_count() or 1
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(matrix,)) as pool:
+            rows = list(pool.map(_evaluate, *zip(*tasks), chunksize=max(1, len(tasks) // (4 * n_workers))))
+
+    results = pd.DataFrame(rows)
+    results["train_end"] = pd.to_datetime(results["train_end"].to_numpy().astype("datetime64[h]"))
+    print(f"Backtested {len(configs)} configs x {len(matrix.stations)} stations x {len(folds)} folds "
+          f"with {n_workers} workers")
+    return results
+
+
+def summarize(results):
+    """Mean/max MAE per config across all folds and stations, best first."""
+    return (results.dropna(subset=["mae"])
+            .groupby("config")["mae"].agg(["mean", "std", "max", "count"])
+            .sort_values("mean"))
+
+
+def log_backtest(results, summary):
+    import mlflow
+
+    for config, stats in summary.iterrows():
+        with mlflow.start_run(run_name=f"backtest_{config}"):
+            mlflow.log_param("config", config)
+            mlflow.log_param("n_folds", results["fold"].nunique())
+            mlflow.log_param("n_stations", results["station"].nunique())
+            mlflow.log_metric("mae", stats["mean"])
+            mlflow.log_metric("mae_std", stats["std"])
+            mlflow.log_metric("mae_max", stats["max"])
+            mlflow.log_text(results[results["config"] == config].to_csv(index=False), BACKTEST_RESULTS)
+    print("Backtest results logged to MLflow")
+
+
+def main(n_folds=4, test_hours=168, step_hours=None, n_workers=None, output=BACKTEST_RESULTS):
+    from src.modeling.utils import create_lag_features, load_hourly_data_from_hopsworks, setup_dagshub_mlflow
+
+    # ---------------------------
+    # 1. Setup DagsHub MLflow
+    # ---------------------------
+    setup_dagshub_mlflow(experiment_name="citibike_trip_prediction_backtest")
+
+    # ---------------------------
+    # 2. Load and Prepare Data
+    # ---------------------------
+    df = load_hourly_data_from_hopsworks()
+    df_lagged = create_lag_features(df, lags=list(range(1, 29)), end=df["datetime"].max())
+
+    # ---------------------------
+    # 3. Walk-forward evaluation
+    # ---------------------------
+    results = run_backtest(df_lagged, n_folds=n_folds, test_hours=test_hours, step_hours=step_hours,
+                           n_workers=n_workers)
+    summary = summarize(results)
+    print("Backtest summary:\n", summary)
+    results.to_csv(output, index=False)
+
+    # ---------------------------
+    # 4. Log to MLflow (DagsHub)
+    # ---------------------------
+    log_backtest(results, summary)
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Rolling-origin backtest of the lag models over all stations")
+    parser.add_argument("--folds", type=int, default=4, help="number of rolling origins")
+    parser.add_argument("--test-hours", type=int, default=168, help="hours evaluated per fold")
+    parser.add_argument("--step-hours", type=int, default=None, help="hours between origins (default: --test-hours)")
+    parser.add_argument("--workers", type=int, default=None, help="evaluation processes")
+    parser.add_argument("--output", default=BACKTEST_RESULTS, help="CSV file for the per-evaluation results")
+    args = parser.parse_args(argv)
+    main(args.folds, args.test_hours, args.step_hours, args.workers, args.output)
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,64 +1,113 @@
+import argparse
 import pandas as pd
-import lightgbm as lgb
 from src.modeling.utils import (
-    load_hourly_data_from_hopsworks,
-    create_lag_features,
     train_test_split_by_time,
     setup_dagshub_mlflow,
     log_to_mlflow
 )
+from src.modeling.multi_station import (
+    LAG_FEATURES,
+    add_strategy_argument,
+    train_per_station,
+    train_test_split_per_station
+)
+from src.modeling.training_cache import (
+    TrainingDataCache,
+    cache_key,
+    load_lag_features,
+    top_features as rank_features,
+    train_booster
+)
+
+REDUCED_BUNDLE_PATH = "models/top10_lag_station_bundle.pkl"
+
+
+def main_all_stations(df_lagged):
+    train_df, test_df = train_test_split_per_station(df_lagged)
+
+    # Rank lags by importance summed over every station's model
+    full_bundle = train_per_station(train_df, features=LAG_FEATURES)
+    importances = sum(
+        pd.Series(model.feature_importances_, index=LAG_FEATURES)
+        for model in full_bundle.station_models.values()
+    )
+    top_features = importances.sort_values(ascending=False).head(10).index.tolist()
+    print(f"Top 10 Features across {len(full_bundle.stations)} stations: {top_features}")
+
+    reduced_bundle = train_per_station(train_df, features=top_features)
+    reduced_bundle.save(REDUCED_BUNDLE_PATH)
+    log_to_mlflow(model=None, y_true=test_df["trip_count"], y_pred=reduced_bundle.predict(test_df),
+                  artifact_path=REDUCED_BUNDLE_PATH, params={"top_features": ",".join(top_features)})
+    print("Feature-reduced per-station LightGBM models complete and logged to DagsHub.")
+
+
+def main(strategy="single"):
+    # ---------------------------
+    # 1. Setup DagsHub MLflow
+    # ---------------------------
+    setup_dagshub_mlflow(experiment_name="citibike_trip_prediction_reduced")
+
+    # ---------------------------
+    # 2. Load Data and Generate Lag Features
+    # ---------------------------
+    cache = TrainingDataCache()
+    data_key, df_lagged = load_lag_features(list(range(1, 29)), cache=cache)  # lag_1 to lag_28
+
+    if strategy == "per_station":
+        main_all_stations(df_lagged)
+        return
+
+    # Use one station for training (same as before)
+    station = df_lagged['start_station_name'].unique()[0]
+    df_station = df_lagged[df_lagged['start_station_name'] == station].copy()
+
+    print(f"Using station: {station} — {len(df_station)} rows")
+
+    # ---------------------------
+    # 3. Train/Test Split
+    # ---------------------------
+    train_df, test_df = train_test_split_by_time(df_station)
+
+    X_train_full = train_df[[f"lag_{i}" for i in range(1, 29)]]
+    y_train = train_df["trip_count"]
+    X_test_full = test_df[[f"lag_{i}" for i in range(1, 29)]]
+    y_test = test_df["trip_count"]
+
+    # ---------------------------
+    # 4. Train Full Model to Get Feature Importances
+    # ---------------------------
+    # Same cached bins as lag_model_lightgbm.py for this station and split
+    train_set = cache.dataset(cache_key(data_key, station=str(station), split="time_0.8"), "train_lag28",
+                              lambda: (X_train_full, y_train))
+    full_model = train_booster(train_set)
+
+    # Get top 10 features
+    top_features = rank_features(full_model, n=10)
+    print(f"Top 10 Features: {top_features}")
+
+    # ---------------------------
+    # 5. Retrain Model with Reduced Features
+    # ---------------------------
+    # Masking the other lags reuses the full Dataset instead of re-binning a subset
+    reduced_model = train_booster(train_set, keep=top_features)
+    y_pred = reduced_model.predict(X_test_full)
+
+    # ---------------------------
+    # 6. Log to MLflow (DagsHub)
+    # ---------------------------
+    # The booster still takes all 28 lags as input; only the top 10 carry splits
+    log_to_mlflow(model=reduced_model, y_true=y_test, y_pred=y_pred, model_name="top10_lag_lightgbm",
+                  params={"top_features": ",".join(top_features), "n_inputs": len(X_test_full.columns)})
+
+    print("Feature-reduced LightGBM model complete and logged to DagsHub.")
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Train LightGBM on the 10 most important lags")
+    add_strategy_argument(parser, choices=["single", "per_station"])
+    args = parser.parse_args(argv)
+    main(strategy=args.strategy)
+
 
-# ---------------------------
-# 1. Setup DagsHub MLflow
-# ---------------------------
-setup_dagshub_mlflow(experiment_name="citibike_trip_prediction_reduced")
-
-# ---------------------------
-# 2. Load Data and Generate Lag Features
-# ---------------------------
-df = load_hourly_data_from_hopsworks()
-df_lagged = create_lag_features(df, lags=list(range(1, 29)))  # lag_1 to lag_28
-
-# Use one station for training (same as before)
-station = df_lagged['start_station_name'].unique()[0]
-df_station = df_lagged[df_lagged['start_station_name'] == station].copy()
-
-print(f"Using station: {station} — {len(df_station)} rows")
-
-# ---------------------------
-# 3. Train/Test Split
-# ---------------------------
-train_df, test_df = train_test_split_by_time(df_station)
-
-X_train_full = train_df[[f"lag_{i}" for i in range(1, 29)]]
-y_train = train_df["trip_count"]
-X_test_full = test_df[[f"lag_{i}" for i in range(1, 29)]]
-y_test = test_df["trip_count"]
-
-# ---------------------------
-# 4. Train Full Model to Get Feature Importances
-# ---------------------------
-full_model = lgb.LGBMRegressor(random_state=42)
-full_model.fit(X_train_full, y_train)
-
-# Get top 10 features
-importances = pd.Series(full_model.feature_importances_, index=X_train_full.columns)
-top_features = importances.sort_values(ascending=False).head(10).index.tolist()
-print(f"Top 10 Features: {top_features}")
-
-# ---------------------------
-# 5. Retrain Model with Reduced Features
-# ---------------------------
-X_train_reduced = X_train_full[top_features]
-X_test_reduced = X_test_full[top_features]
-
-reduced_model = lgb.LGBMRegressor(random_state=42)
-reduced_model.fit(X_train_reduced, y_train)
-y_pred = reduced_model.predict(X_test_reduced)
-
-# ---------------------------
-# 6. Log to MLflow (DagsHub)
-# ---------------------------
-log_to_mlflow(model=reduced_model, y_true=y_test, y_pred=y_pred, model_name="top10_lag_lightgbm")
-
-print("Feature-reduced LightGBM model complete and logged to DagsHub.")
\ No newline at end of file
+if __name__ == "__main__":
+    cli()
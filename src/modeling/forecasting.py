@@ -0,0 +1,138 @@
+# File: src/modeling/forecasting.py
+
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.modeling.multi_station import LAG_FEATURES, train_bundle
+
+DIRECT_MODEL_PATH = "models/direct_multi_horizon.pkl"
+DIRECT_MODEL_NAME = "citibike_lag28_direct_multi_horizon"
+HORIZON_STRATEGIES = ["recursive", "direct"]
+
+
+# -----------------------------------
+# 1. Lag window for the next hour
+# -----------------------------------
+def next_hour_lags(latest_df, features=LAG_FEATURES, target_col="trip_count"):
+    """
+    Lag matrix for the hour after each row: the row's own count becomes
+    lag_1 and every other lag moves back by one hour.
+    """
+    X = np.empty((len(latest_df), len(features)), dtype=np.float64)
+    X[:, 0] = latest_df[target_col].to_numpy(dtype=np.float64)
+    X[:, 1:] = latest_df[features[:-1]].to_numpy(dtype=np.float64)
+    return X
+
+
+def _frame(X, stations, features, station_col):
+    frame = pd.DataFrame(X, columns=features, copy=False)
+    frame.insert(0, station_col, stations)
+    return frame
+
+
+# -----------------------------------
+# 2. Recursive strategy
+# -----------------------------------
+def recursive_forecast(predict, stations, X, horizon, features=LAG_FEATURES,
+                       station_col="start_station_name", clip_negative=True):
+    """
+    Forecast `horizon` hours for every station at once. Each step is a single
+    `predict` call over the whole (stations x lags) matrix; the prediction is
+    then fed back as lag_1 by shifting the window in place.
+    Returns a (stations x horizon) array.
+    """
+    X = np.array(X, dtype=np.float64, copy=True)
+    stations = np.asarray(stations)
+    out = np.empty((len(X), horizon), dtype=np.float64)
+    for step in range(horizon):
+        y = np.asarray(predict(_frame(X, stations, features, station_col)), dtype=np.float64)
+        if clip_negative:
+            np.maximum(y, 0, out=y)
+        out[:, step] = y
+        X[:, 1:] = X[:, :-1]
+        X[:, 0] = y
+    return out
+
+
+# -----------------------------------
+# 3. Direct multi-output strategy
+# -----------------------------------
+class DirectMultiHorizonModel:
+    """One station bundle per horizon; horizon h maps the next-hour lags to hour t+h."""
+
+    def __init__(self, bundles, features=LAG_FEATURES, station_col="start_station_name"):
+        self.bundles = bundles
+        self.features = list(features)
+        self.station_col = station_col
+
+    @property
+    def horizon(self):
+        return len(self.bundles)
+
+    def predict_matrix(self, stations, X):
+        frame = _frame(np.asarray(X, dtype=np.float64), np.asarray(stations), self.features, self.station_col)
+        return np.column_stack([bundle.predict(frame) for bundle in self.bundles])
+
+    def save(self, path=DIRECT_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump(self, path)
+        return path
+
+    @staticmethod
+    def load(path=DIRECT_MODEL_PATH):
+        return joblib.load(path)
+
+
+def direct_targets(df, horizon, target_col="trip_count", station_col="start_station_name"):
+    """
+    Add `target_h<k>` = count k-1 hours after each row, for k = 1..horizon.
+    Expects the dense hourly grid produced by `create_lag_features`.
+    """
+    df = df.sort_values([station_col, "datetime"]).reset_index(drop=True)
+    grouped = df.groupby(station_col, observed=True)[target_col]
+    for k in range(1, horizon + 1):
+        df[f"target_h{k}"] = grouped.shift(-(k - 1))
+    return df
+
+
+def train_direct(df, horizon=24, strategy="global", features=LAG_FEATURES, **train_kwargs):
+    """Fit one model bundle per horizon step on rows that have all `horizon` targets."""
+    df = direct_targets(df, horizon).dropna(subset=[f"target_h{horizon}"])
+    bundles = []
+    for k in range(1, horizon + 1):
+        bundles.append(train_bundle(df, strategy, features=features, target_col=f"target_h{k}", **train_kwargs))
+        print(f"Trained direct horizon {k}/{horizon}")
+    return DirectMultiHorizonModel(bundles, features)
+
+
+def load_direct_model(project=None):
+    """Best registered direct model, falling back to the local copy."""
+    if project is not None:
+        try:
+            entry = project.get_model_registry().get_best_model(DIRECT_MODEL_NAME, "mae", "min")
+            return DirectMultiHorizonModel.load(os.path.join(entry.download(), os.path.basename(DIRECT_MODEL_PATH)))
+        except Exception as e:
+            print(f"No registered direct multi-horizon model available ({e})")
+    return DirectMultiHorizonModel.load(DIRECT_MODEL_PATH)
+
+
+# -----------------------------------
+# 4. Output rows
+# -----------------------------------
+def forecast_frame(latest_df, preds, prediction_time=None, station_col="start_station_name"):
+    """Long-format rows: one per station and horizon, keyed by the feature hour and horizon."""
+    n, horizon = preds.shape
+    base = pd.to_datetime(latest_df["datetime"]).to_numpy()
+    steps = np.arange(1, horizon + 1)
+    out = pd.DataFrame({
+        station_col: np.repeat(latest_df[station_col].to_numpy(), horizon),
+        "datetime": np.repeat(base, horizon),
+        "horizon": np.tile(steps, n).astype("int32"),
+        "prediction": preds.reshape(-1),
+    })
+    out["target_datetime"] = out["datetime"] + pd.to_timedelta(out["horizon"], unit="h")
+    out["prediction_time"] = prediction_time if prediction_time is not None else pd.Timestamp.utcnow().tz_localize(None)
+    return out
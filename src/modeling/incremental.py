@@ -0,0 +1,180 @@
+# File: src/modeling/incremental.py
+
+import copy
+import hashlib
+import json
+import os
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from src.modeling.multi_station import StationModelBundle, station_mae
+
+TRAINING_MODES = ["full", "incremental"]
+VALID_HOURS = 24 * 7            # newest week is held out to compare versions
+INCREMENTAL_ROUNDS = 50         # trees added per incremental update
+INCREMENTAL_LEARNING_RATE = 0.01  # small steps: a week of rows should adjust the model, not override it
+MAX_BOOST_ROUNDS = 1000         # more trees than this in any model -> full retrain
+MAX_MAE_INCREASE = 0.20         # validation MAE this far above the last full retrain's -> full retrain
+MAX_UPDATES_SINCE_FULL = 12     # incremental updates in a row before a full retrain is forced
+STATE_KEYS = ["trained_until_hour", "baseline_mae", "boost_rounds", "updates_since_full"]
+
+
+# -----------------------------------
+# 1. Training state kept with each model version
+# -----------------------------------
+def training_state(trained_until, baseline_mae, boost_rounds, updates_since_full=0, station=None):
+    """
+    What an incremental run needs to know about the model it continues:
+    the last training hour, the last full retrain's MAE on its newest week
+    (comparable to an update's validation week), the tree count and, for a
+    single-station model, which station. Stored as registry metrics
+    (numbers only) and in a local sidecar.
+    """
+    state = {
+        "trained_until_hour": int(np.datetime64(pd.Timestamp(trained_until), "h").astype(np.int64)),
+        "baseline_mae": float(baseline_mae),
+        "boost_rounds": int(boost_rounds),
+        "updates_since_full": int(updates_since_full),
+    }
+    if station is not None:
+        state["station_key"] = station_key(station)
+    return state
+
+
+def station_key(station):
+    """Station name as a number that survives a registry metric (48 bits, exact in a float)."""
+    return int(hashlib.sha256(str(station).encode()).hexdigest()[:12], 16)
+
+
+def trained_until(state):
+    return pd.Timestamp(np.datetime64(int(state["trained_until_hour"]), "h"))
+
+
+def state_path(model_path):
+    return os.path.splitext(model_path)[0] + ".state.json"
+
+
+def save_state(model_path, state):
+    with open(state_path(model_path), "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def load_previous(project, name, model_path):
+    """
+    (model, state, source) for the latest registered version of `name`,
+    else the local copy at `model_path`; None when there is no model or it
+    was trained before training state was recorded.
+    """
+    if project is not None:
+        try:
+            versions = project.get_model_registry().get_models(name)
+            entry = max(versions, key=lambda m: m.version)
+            state = {k: entry.training_metrics.get(k) for k in STATE_KEYS}
+            if None in state.values():
+                print(f"{name} v{entry.version} has no training state, a full retrain is needed")
+                return None
+            if entry.training_metrics.get("station_key") is not None:
+                state["station_key"] = int(entry.training_metrics["station_key"])
+            model = joblib.load(os.path.join(entry.download(), os.path.basename(model_path)))
+            return model, state, f"{name} v{entry.version}"
+        except Exception as e:
+            print(f"No registered {name} available ({e})")
+
+    if os.path.exists(model_path) and os.path.exists(state_path(model_path)):
+        with open(state_path(model_path)) as f:
+            state = json.load(f)
+        if any(k not in state for k in STATE_KEYS):
+            print(f"{state_path(model_path)} has no complete training state, a full retrain is needed")
+            return None
+        return joblib.load(model_path), state, model_path
+    return None
+
+
+# -----------------------------------
+# 2. New data since the last version
+# -----------------------------------
+def split_new_hours(df, since, valid_hours=VALID_HOURS, time_col="datetime"):
+    """
+    (new_train, valid): the newest `valid_hours` are held out for comparing
+    versions; rows after `since` and before them are what the next update
+    trains on. The held-out hours become training data the following week.
+    """
+    times = pd.to_datetime(df[time_col])
+    valid_start = times.max() - pd.Timedelta(hours=valid_hours - 1)
+    return df[(times > since) & (times < valid_start)], df[times >= valid_start]
+
+
+def newest_hours(df, hours=VALID_HOURS, time_col="datetime"):
+    """Rows in the newest `hours` hours: the window an update is validated on."""
+    times = pd.to_datetime(df[time_col])
+    return df[times >= times.max() - pd.Timedelta(hours=hours - 1)]
+
+
+def last_training_hour(train, station_col="start_station_name", time_col="datetime"):
+    """Earliest per-station last training hour: every station's rows after it count as new."""
+    return pd.to_datetime(train.groupby(station_col, observed=True)[time_col].max()).min()
+
+
+# -----------------------------------
+# 3. Continued boosting
+# -----------------------------------
+def boost_rounds(bundle):
+    models = list(bundle.station_models.values()) + ([bundle.global_model] if bundle.global_model else [])
+    return max(m.booster_.current_iteration() for m in models)
+
+
+def continue_boosting(model, X, y, rounds=INCREMENTAL_ROUNDS, learning_rate=INCREMENTAL_LEARNING_RATE):
+    """A new LGBMRegressor with `rounds` more trees fitted to (X, y) on top of `model`'s."""
+    params = {**model.get_params(), "n_estimators": rounds, "learning_rate": learning_rate}
+    updated = lgb.LGBMRegressor(**params)
+    updated.fit(X, y, init_model=model.booster_)
+    return updated
+
+
+def continue_bundle(bundle, new_train, rounds=INCREMENTAL_ROUNDS, learning_rate=INCREMENTAL_LEARNING_RATE,
+                    target_col="trip_count"):
+    """
+    Copy of `bundle` with every model boosted further on `new_train` only.
+    Stations the bundle does not know need a full retrain (raises KeyError).
+    """
+    updated = copy.copy(bundle)
+    if bundle.strategy == "global":
+        unknown = set(new_train[bundle.station_col].astype(str)) - set(bundle.stations)
+        if unknown:
+            raise KeyError(f"new stations {sorted(unknown)}")
+        updated.global_model = continue_boosting(bundle.global_model, bundle._global_matrix(new_train),
+                                                 new_train[target_col], rounds, learning_rate)
+        return updated
+
+    updated.station_models = dict(bundle.station_models)
+    for station, g in new_train.groupby(bundle.station_col, observed=True):
+        model = bundle.station_models[str(station)]
+        updated.station_models[str(station)] = continue_boosting(model, g[bundle.features], g[target_col], rounds,
+                                                                learning_rate)
+    return updated
+
+
+def full_retrain_reason(state, mae, rounds, max_mae_increase=MAX_MAE_INCREASE, max_boost_rounds=MAX_BOOST_ROUNDS,
+                        max_updates_since_full=MAX_UPDATES_SINCE_FULL):
+    """Why the updated model should be replaced by a full retrain, or None to keep it."""
+    if state["updates_since_full"] >= max_updates_since_full:
+        return (f"{state['updates_since_full']} incremental updates since the last full retrain "
+                f"reach the limit of {max_updates_since_full}")
+    if rounds > max_boost_rounds:
+        return f"{rounds} boosting rounds exceed the limit of {max_boost_rounds}"
+    if mae > state["baseline_mae"] * (1 + max_mae_increase):
+        return (f"validation MAE {mae:.4f} drifted more than {max_mae_increase:.0%} above "
+                f"the last full retrain's {state['baseline_mae']:.4f} on its newest week")
+    return None
+
+
+def as_bundle(model, station, features):
+    """Wrap the single-station model so it updates and evaluates like a bundle."""
+    return StationModelBundle(features, "per_station", station_models={str(station): model})
+
+
+def bundle_mae(bundle, valid):
+    return station_mae(bundle, valid)[0]
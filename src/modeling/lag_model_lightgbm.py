@@ -1,28 +1,49 @@
 import pandas as pd
-import lightgbm as lgb
 from src.modeling.utils import (
-    load_hourly_data_from_hopsworks,
-    create_lag_features,
     train_test_split_by_time,
     setup_dagshub_mlflow,
     log_to_mlflow
 )
+from src.modeling.multi_station import (
+    BUNDLE_PATH,
+    add_strategy_argument,
+    station_mae,
+    train_bundle,
+    train_test_split_per_station
+)
+from src.modeling.training_cache import TrainingDataCache, cache_key, load_lag_features, train_booster
+import argparse
+import mlflow
 import joblib
 import os
 
-def main():
+def main(strategy="single", n_workers=None, threads_per_worker=1):
     # ---------------------------
     # 1. Setup DagsHub MLflow
     # ---------------------------
     setup_dagshub_mlflow(experiment_name="citibike_trip_prediction_lag28")
 
     # ---------------------------
-    # 2. Load and Prepare Data
+    # 2. Load and Prepare Data (cached per data version)
     # ---------------------------
-    df = load_hourly_data_from_hopsworks()
-    df_lagged = create_lag_features(df, lags=list(range(1, 29)))
+    cache = TrainingDataCache()
+    data_key, df_lagged = load_lag_features(list(range(1, 29)), cache=cache)
+
+    if strategy != "single":
+        # All stations: per-station models in a process pool, or one global model
+        train_df, test_df = train_test_split_per_station(df_lagged)
+        bundle = train_bundle(train_df, strategy, n_workers=n_workers, threads_per_worker=threads_per_worker)
+        mae, per_station = station_mae(bundle, test_df)
+        with mlflow.start_run(run_name=f"lag28_{strategy}"):
+            mlflow.log_param("strategy", strategy)
+            mlflow.log_metric("mae", mae)
+            mlflow.log_dict(per_station.to_dict(), "station_mae.json")
+        print(f"MLflow logged: MAE = {mae:.4f} over {len(per_station)} stations")
+        bundle.save(BUNDLE_PATH)
+        print(f"Model bundle saved to {BUNDLE_PATH}")
+        return
 
-    # Use just one station for now
+    # Use just one station
     station = df_lagged['start_station_name'].unique()[0]
     df_station = df_lagged[df_lagged['start_station_name'] == station].copy()
 
@@ -39,10 +60,11 @@ def main():
     y_test = test_df["trip_count"]
 
     # ---------------------------
-    # 4. Train Model
+    # 4. Train Model on cached, pre-binned data
     # ---------------------------
-    model = lgb.LGBMRegressor(random_state=42)
-    model.fit(X_train, y_train)
+    train_set = cache.dataset(cache_key(data_key, station=str(station), split="time_0.8"), "train_lag28",
+                              lambda: (X_train, y_train))
+    model = train_booster(train_set)
     y_pred = model.predict(X_test)
 
     # ---------------------------
@@ -60,5 +82,14 @@ def main():
 # ------------------------------------------
 # Optional CLI entry point
 # ------------------------------------------
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Train the lag-28 LightGBM model")
+    add_strategy_argument(parser)
+    parser.add_argument("--workers", type=int, default=None, help="training processes for per_station")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="LightGBM threads per process")
+    args = parser.parse_args(argv)
+    main(args.strategy, args.workers, args.threads_per_worker)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
\ No newline at end of file
@@ -0,0 +1,194 @@
+# File: src/modeling/multi_station.py
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error
+
+LAG_FEATURES = [f"lag_{i}" for i in range(1, 29)]
+BUNDLE_PATH = "models/station_bundle.pkl"
+BUNDLE_MODEL_NAME = "citibike_lag28_station_bundle"
+STRATEGIES = ["single", "per_station", "global"]
+STRATEGY_HELP = {
+    "single": "first station only",
+    "per_station": "one model per station in a process pool",
+    "global": "one model with the station as a categorical feature",
+}
+
+
+def add_strategy_argument(parser, default="single", choices=STRATEGIES):
+    """The `--strategy` flag every training entry point shares."""
+    parser.add_argument("--strategy", choices=choices, default=default,
+                        help="; ".join(f"{name}: {STRATEGY_HELP[name]}" for name in choices))
+    return parser
+
+
+# -----------------------------------
+# 1. Station -> model bundle
+# -----------------------------------
+class StationModelBundle:
+    """
+    Models for every station behind one `predict(df)` call.
+
+    `per_station` bundles hold one fitted model per station; `global` bundles
+    hold a single model that takes the station as a categorical feature.
+    Inference loads the bundle once and predicts all stations in one call.
+    """
+
+    def __init__(self, features, strategy, station_models=None, global_model=None,
+                 stations=None, station_col="start_station_name"):
+        self.features = list(features)
+        self.strategy = strategy
+        self.station_models = station_models or {}
+        self.global_model = global_model
+        self.stations = list(stations if stations is not None else self.station_models)
+        self.station_col = station_col
+
+    def _global_matrix(self, df):
+        X = df[self.features].copy()
+        X[self.station_col] = pd.Categorical(df[self.station_col].astype(str), categories=self.stations)
+        return X
+
+    def predict(self, df):
+        """Predict every row of `df`; stations without a model get NaN."""
+        if self.strategy == "global":
+            return self.global_model.predict(self._global_matrix(df))
+
+        preds = np.full(len(df), np.nan)
+        stations = df[self.station_col].astype(str).to_numpy()
+        for station in np.unique(stations):
+            model = self.station_models.get(station)
+            if model is None:
+                print(f"No model for station {station}, skipping")
+                continue
+            mask = stations == station
+            preds[mask] = model.predict(df.loc[mask, self.features])
+        return preds
+
+    def save(self, path=BUNDLE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump(self, path)
+        return path
+
+    @staticmethod
+    def load(path=BUNDLE_PATH):
+        return joblib.load(path)
+
+
+def load_predictor(project=None, single_model_path="models/best_model.pkl", features=LAG_FEATURES):
+    """
+    Return a `predict(df)` callable for inference. Prefers the best registered
+    station bundle, then a local bundle, then the legacy single-station model.
+    """
+    if project is not None:
+        try:
+            entry = project.get_model_registry().get_best_model(BUNDLE_MODEL_NAME, "mae", "min")
+            bundle = StationModelBundle.load(os.path.join(entry.download(), os.path.basename(BUNDLE_PATH)))
+            print(f"Loaded {bundle.strategy} bundle v{entry.version} for {len(bundle.stations)} stations")
+            return bundle.predict
+        except Exception as e:
+            print(f"No registered model bundle available ({e})")
+
+    if os.path.exists(BUNDLE_PATH):
+        bundle = StationModelBundle.load(BUNDLE_PATH)
+        print(f"Loaded local {bundle.strategy} bundle for {len(bundle.stations)} stations")
+        return bundle.predict
+
+    model = joblib.load(single_model_path)
+    print(f"Loaded single-station model from {single_model_path}")
+    return lambda df: model.predict(df[features])
+
+
+# -----------------------------------
+# 2. Training strategies
+# -----------------------------------
+def default_estimator(n_threads=1):
+    return lgb.LGBMRegressor(random_state=42, n_jobs=n_threads, verbose=-1)
+
+
+def _fit_station(station, X, y, estimator, n_threads):
+    model = clone(estimator)
+    if "n_jobs" in model.get_params():
+        model.set_params(n_jobs=n_threads)
+    model.fit(X, y)
+    return station, model
+
+
+def train_per_station(df, features=LAG_FEATURES, estimator=None, n_workers=None, threads_per_worker=1,
+                      target_col="trip_count", station_col="start_station_name"):
+    """
+    Fit one model per station in a process pool. Each worker gets its own
+    station slice and trains with `threads_per_worker` threads, so
+    `n_workers * threads_per_worker` should not exceed the available cores.
+    """
+    estimator = estimator if estimator is not None else default_estimator()
+    n_workers = n_workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    groups = df.groupby(station_col, sort=True, observed=True)
+
+    # spawn avoids forking a parent that already started OpenMP threads
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx) as pool:
+        futures = [
+            pool.submit(_fit_station, str(station), g[features], g[target_col], estimator, threads_per_worker)
+            for station, g in groups
+        ]
+        station_models = dict(f.result() for f in futures)
+
+    print(f"Trained {len(station_models)} per-station models with {n_workers} workers "
+          f"x {threads_per_worker} threads")
+    return StationModelBundle(features, "per_station", station_models=station_models, station_col=station_col)
+
+
+def train_global(df, features=LAG_FEATURES, estimator=None, n_threads=None,
+                 target_col="trip_count", station_col="start_station_name"):
+    """Fit a single model over all stations with the station as a categorical feature."""
+    estimator = clone(estimator if estimator is not None else default_estimator())
+    if "n_jobs" in estimator.get_params():
+        estimator.set_params(n_jobs=n_threads or os.cpu_count() or 1)
+
+    stations = sorted(df[station_col].astype(str).unique())
+    bundle = StationModelBundle(features, "global", stations=stations, station_col=station_col)
+    estimator.fit(bundle._global_matrix(df), df[target_col])
+    bundle.global_model = estimator
+    print(f"Trained global model over {len(stations)} stations")
+    return bundle
+
+
+def train_bundle(df, strategy, features=LAG_FEATURES, estimator=None, n_workers=None, threads_per_worker=1,
+                 target_col="trip_count"):
+    if strategy == "per_station":
+        return train_per_station(df, features, estimator, n_workers, threads_per_worker, target_col)
+    if strategy == "global":
+        return train_global(df, features, estimator, target_col=target_col)
+    raise ValueError(f"Unknown multi-station strategy: {strategy}")
+
+
+# -----------------------------------
+# 3. Per-station split and evaluation
+# -----------------------------------
+def train_test_split_per_station(df, test_fraction=0.2, station_col="start_station_name", time_col="datetime"):
+    """Hold out the last `test_fraction` of each station's hours."""
+    df = df.sort_values([station_col, time_col])
+    position = df.groupby(station_col, observed=True).cumcount()
+    size = df.groupby(station_col, observed=True)[time_col].transform("size")
+    is_test = position >= (size * (1 - test_fraction)).astype(int)
+    return df[~is_test], df[is_test]
+
+
+def station_mae(bundle, test_df, target_col="trip_count"):
+    """MAE per station plus the overall MAE across all test rows."""
+    preds = bundle.predict(test_df)
+    scored = pd.DataFrame({
+        "station": test_df[bundle.station_col].astype(str).to_numpy(),
+        "y_true": test_df[target_col].to_numpy(),
+        "y_pred": preds,
+    }).dropna()
+    per_station = scored.groupby("station").apply(lambda g: mean_absolute_error(g["y_true"], g["y_pred"]))
+    overall = mean_absolute_error(scored["y_true"], scored["y_pred"])
+    return overall, per_station
@@ -0,0 +1,127 @@
+# File: src/modeling/training_cache.py
+
+import hashlib
+import json
+import os
+
+import lightgbm as lgb
+import pandas as pd
+
+from src.modeling.multi_station import LAG_FEATURES
+
+CACHE_ROOT = "data/training_cache"
+SCHEMA_VERSION = 2  # bump when create_lag_features changes its output
+
+# Dataset parameters are baked into the saved bins and must match at train time
+DATASET_PARAMS = {"max_bin": 255, "verbose": -1}
+# Same model as LGBMRegressor(random_state=42) with its defaults
+TRAIN_PARAMS = {**DATASET_PARAMS, "objective": "regression", "learning_rate": 0.1, "num_leaves": 31, "seed": 42}
+NUM_BOOST_ROUND = 100
+
+
+# -----------------------------------
+# 1. Cache keys
+# -----------------------------------
+def frame_fingerprint(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()[:16]
+
+
+def cache_key(data_version, **spec):
+    """Hash of the source data version and everything that shapes the features."""
+    payload = json.dumps({"data": data_version, "schema": SCHEMA_VERSION, **spec}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+# -----------------------------------
+# 2. Parquet features and LightGBM Dataset binaries
+# -----------------------------------
+class TrainingDataCache:
+    """
+    `root/<key>/features.parquet` holds a lag feature frame and
+    `root/<key>/<name>.bin` the constructed (pre-binned) LightGBM Datasets
+    built from it. Experiments sharing a key skip loading, lag building
+    and binning.
+    """
+
+    def __init__(self, root=CACHE_ROOT):
+        self.root = root
+
+    def path(self, key, name):
+        return os.path.join(self.root, key, name)
+
+    def features(self, key, build_fn):
+        path = self.path(key, "features.parquet")
+        if os.path.exists(path):
+            print(f"Training cache hit: {path}")
+            return pd.read_parquet(path)
+        df = build_fn()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        return df
+
+    def dataset(self, key, name, build_fn):
+        """Constructed `lgb.Dataset` for `build_fn() -> (X, y)`, loaded from its binary when cached."""
+        path = self.path(key, f"{name}.bin")
+        if os.path.exists(path):
+            print(f"Training cache hit: {path}")
+            return lgb.Dataset(path, params=DATASET_PARAMS).construct()
+        X, y = build_fn()
+        dataset = lgb.Dataset(X, y, feature_name=list(X.columns), params=DATASET_PARAMS).construct()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        dataset.save_binary(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return dataset
+
+
+# -----------------------------------
+# 3. Training on cached bins
+# -----------------------------------
+def feature_mask(features, keep):
+    """Zero split gain for features outside `keep`, so a subset reuses the full Dataset's bins."""
+    keep = set(keep)
+    return {"feature_contri": [1.0 if f in keep else 0.0 for f in features]}
+
+
+def train_booster(dataset, keep=None, params=None, num_boost_round=NUM_BOOST_ROUND):
+    params = {**TRAIN_PARAMS, **(params or {})}
+    if keep is not None:
+        params.update(feature_mask(dataset.get_feature_name(), keep))
+    return lgb.train(params, dataset, num_boost_round=num_boost_round)
+
+
+def top_features(booster, n=10):
+    importances = pd.Series(booster.feature_importance(importance_type="split"), index=booster.feature_name())
+    return importances.sort_values(ascending=False).head(n).index.tolist()
+
+
+# -----------------------------------
+# 4. Shared lag features for the experiment scripts
+# -----------------------------------
+def load_lag_features(lags=None, feature_group_name="citibike_hourly_trips", version=1, cache=None):
+    """
+    Lag features over `feature_group_name`, cached under a key built from
+    the group's data version. Returns (key, df). Without a cheap data
+    version, the hourly rows are read and fingerprinted instead, which
+    still skips the lag build and binning.
+    """
+    from src.common.feature_store import get_feature_store
+    from src.modeling.utils import create_lag_features, load_hourly_data_from_hopsworks
+
+    lags = list(lags) if lags is not None else [int(f.split("_")[1]) for f in LAG_FEATURES]
+    cache = cache or TrainingDataCache()
+    data_version = get_feature_store().get(feature_group_name, version, create=False).data_version()
+
+    df = None
+    if data_version is None:
+        df = load_hourly_data_from_hopsworks(feature_group_name, version)
+        data_version = frame_fingerprint(df)
+
+    key = cache_key(data_version, source=f"{feature_group_name}_v{version}", lags=lags)
+
+    def build():
+        hourly = df if df is not None else load_hourly_data_from_hopsworks(feature_group_name, version)
+        return create_lag_features(hourly, lags=lags, end=hourly["datetime"].max())
+
+    return key, cache.features(key, build)
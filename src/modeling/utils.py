@@ -1,29 +1,23 @@
 # File: src/modeling/utils.py
 
+import numpy as np
 import pandas as pd
-import mlflow
-import mlflow.sklearn
 import os
-from sklearn.metrics import mean_absolute_error
 from dotenv import load_dotenv
-import hopsworks
-# Load .env once
-load_dotenv()
+from src.common.feature_store import get_feature_store
+from src.common.schema import LAG_DTYPE, compact_hourly
+
+# mlflow, lightgbm and sklearn are imported inside the functions that use them,
+# so the feature pipeline can import the lag helpers without paying for them
 
 # -----------------------------------
 # 1. Load Citi Bike data from Hopsworks
 # -----------------------------------
-def load_hourly_data_from_hopsworks(feature_group_name="citibike_hourly_trips", version=1):
-
-    # Set environment variable for the API key
-    os.environ["HOPSWORKS_API_KEY"] = os.getenv("HOPSWORKS_API_KEY")
-
-    # Login will now pick up the API key and use the default host
-    project = hopsworks.login(project=os.getenv("HOPSWORKS_PROJECT"))
+def load_hourly_data_from_hopsworks(feature_group_name="citibike_hourly_trips", version=1, filters=None):
 
-    fs = project.get_feature_store()
-    fg = fs.get_feature_group(feature_group_name, version=version)
-    df = fg.read()
+    # The store logs in once per process and reuses the handle on later calls
+    store = get_feature_store()
+    df = store.read(feature_group_name, version=version, filters=filters)
     df['datetime'] = pd.to_datetime(df['datetime'])
     df = df.sort_values(['start_station_name', 'datetime']).reset_index(drop=True)
 
@@ -32,24 +26,126 @@ def load_hourly_data_from_hopsworks(feature_group_name="citibike_hourly_trips",
 # -----------------------------------
 # 2. Create lag features
 # -----------------------------------
-def create_lag_features(df, lags=[1], target_col="trip_count"):
-    for lag in lags:
-        df[f"lag_{lag}"] = df.groupby('start_station_name')[target_col].shift(lag)
-    return df.dropna()
+def densify_hourly(df, target_col="trip_count", station_col="start_station_name",
+                   time_col="datetime", start=None, end=None):
+    """
+    Reindex every station onto a contiguous hourly grid, filling hours with
+    no trips with 0. The grid runs from each station's first to last hour,
+    optionally widened to `start` / `end`. `start` may also be a Series of
+    per-station start hours; stations missing from it are not widened.
+    Returns a new frame sorted by station and time.
+    """
+    hourly = df[[station_col, time_col, target_col]].copy()
+    hourly[time_col] = pd.to_datetime(hourly[time_col])
+    tz = hourly[time_col].dt.tz
+    if tz is not None:
+        hourly[time_col] = hourly[time_col].dt.tz_convert(None)
+    hourly[time_col] = hourly[time_col].dt.floor("h")
+    hourly = hourly.groupby([station_col, time_col], sort=True, observed=True)[target_col].sum()
+
+    bounds = hourly.reset_index().groupby(station_col, sort=True, observed=True)[time_col].agg(["min", "max"])
+    if isinstance(start, pd.Series):
+        per_station = pd.to_datetime(start).dt.floor("h").reindex(bounds.index.astype(str)).to_numpy()
+        bounds["min"] = np.where(pd.isna(per_station), bounds["min"].to_numpy(),
+                                 np.minimum(bounds["min"].to_numpy(), per_station))
+    elif start is not None:
+        bounds["min"] = bounds["min"].clip(upper=_naive_utc(start).floor("h"))
+    if end is not None:
+        bounds["max"] = bounds["max"].clip(lower=_naive_utc(end).floor("h"))
+
+    one_hour = np.timedelta64(1, "h")
+    lengths = ((bounds["max"] - bounds["min"]) // pd.Timedelta(hours=1)).to_numpy(dtype=np.int64) + 1
+    seg_start = np.cumsum(lengths) - lengths
+    offsets = np.arange(lengths.sum()) - np.repeat(seg_start, lengths)
+
+    stations = np.repeat(bounds.index.to_numpy(), lengths)
+    times = np.repeat(bounds["min"].to_numpy(), lengths) + offsets * one_hour
+
+    # Scatter the observed counts into their grid positions
+    values = np.zeros(lengths.sum(), dtype=hourly.dtype if hourly.dtype.kind in "iuf" else np.float64)
+    obs_station = hourly.index.get_level_values(0)
+    obs_time = hourly.index.get_level_values(1).to_numpy()
+    station_pos = bounds.index.get_indexer(obs_station)
+    pos = seg_start[station_pos] + (obs_time - bounds["min"].to_numpy()[station_pos]) // one_hour
+    values[pos] = hourly.to_numpy()
+
+    dense = pd.DataFrame({station_col: stations, time_col: times, target_col: values})
+    if tz is not None:
+        dense[time_col] = dense[time_col].dt.tz_localize("UTC").dt.tz_convert(tz)
+    return dense
+
+
+def _naive_utc(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_convert(None) if ts.tz is not None else ts
+
+
+def create_lag_features(df, lags=[1], target_col="trip_count", station_col="start_station_name",
+                        time_col="datetime", start=None, end=None, dropna=True):
+    """
+    Build `lag_<k>` columns for every k in `lags` in a single vectorized pass.
+
+    Each station is first reindexed onto a dense hourly grid (see
+    `densify_hourly`), so `lag_k` is always the count k hours earlier, with
+    0 for hours that had no trips. Rows whose longest lag would reach before
+    the start of the station's grid are dropped unless `dropna=False`, in
+    which case those lags are NaN. The input frame is not modified.
+
+    Output uses the compact schema (see `src.common.schema`): categorical
+    station, narrow integer counts and float32 lags.
+    """
+    lags = sorted(set(int(lag) for lag in lags))
+    dense = densify_hourly(df, target_col=target_col, station_col=station_col,
+                           time_col=time_col, start=start, end=end)
+
+    dense = compact_hourly(dense, station_col, time_col, target_col)
+    values = dense[target_col].to_numpy(dtype=LAG_DTYPE)
+    codes = dense[station_col].cat.codes.to_numpy()
+    row = np.arange(len(dense))
+    # Position of the first row of each row's station segment
+    seg_first = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+    row_seg_start = np.repeat(seg_first, np.diff(np.r_[seg_first, len(dense)]))
+
+    # (rows x lags) matrix of source positions, gathered in one shot
+    src = row[:, None] - np.asarray(lags, dtype=np.int64)[None, :]
+    valid = src >= row_seg_start[:, None]
+    lag_matrix = np.where(valid, values[np.clip(src, 0, None)], LAG_DTYPE(np.nan))
+
+    lagged = pd.concat(
+        [dense, pd.DataFrame(lag_matrix, columns=[f"lag_{lag}" for lag in lags], index=dense.index)],
+        axis=1
+    )
+
+    if dropna and lags:
+        lagged = lagged[valid[:, -1]].reset_index(drop=True)
+
+    return lagged
 
 # -----------------------------------
 # 3. Time-based train/test split
 # -----------------------------------
-def train_test_split_by_time(df, test_fraction=0.2):
-    split_index = int(len(df) * (1 - test_fraction))
-    train = df.iloc[:split_index].copy()
-    test = df.iloc[split_index:].copy()
-    return train, test
+def train_test_split_by_time(df, test_fraction=0.2, time_col="datetime"):
+    """
+    Split at a single time cutoff so every station is held out over the same
+    hours. The cutoff is the first of the last `test_fraction` distinct hours.
+    Time-sorted input is split with positional slices; otherwise with masks.
+    """
+    times = df[time_col]
+    hours = np.unique(times.to_numpy())
+    cutoff = hours[min(int(len(hours) * (1 - test_fraction)), len(hours) - 1)]
+    if times.is_monotonic_increasing:
+        split_index = int(times.searchsorted(cutoff, side="left"))
+        return df.iloc[:split_index], df.iloc[split_index:]
+    is_test = (times >= cutoff).to_numpy()
+    return df[~is_test], df[is_test]
 
 # -----------------------------------
 # 4. Configure DagsHub MLflow from .env
 # -----------------------------------
 def setup_dagshub_mlflow(experiment_name):
+    import mlflow
+
+    load_dotenv()
     username = os.getenv("DAGSHUB_USERNAME")
     repo = os.getenv("DAGSHUB_REPO")
     token = os.getenv("DAGSHUB_TOKEN")
@@ -67,13 +163,26 @@ def setup_dagshub_mlflow(experiment_name):
 # -----------------------------------
 # 5. Log metrics & model to MLflow
 # -----------------------------------
-def log_to_mlflow(model, y_true, y_pred, model_name=None):
+def log_to_mlflow(model, y_true, y_pred, model_name=None, artifact_path=None, params=None):
+    """Log the MAE and `params` with the model, or with a saved model file (`artifact_path`) such as a station bundle."""
+    import lightgbm as lgb
+    import mlflow
+    import mlflow.lightgbm
+    import mlflow.sklearn
+    from sklearn.metrics import mean_absolute_error
+
     mae = mean_absolute_error(y_true, y_pred)
 
     with mlflow.start_run():
         mlflow.log_metric("mae", mae)
-        if model_name:
+        for name, value in (params or {}).items():
+            mlflow.log_param(name, value)
+        if model_name and isinstance(model, lgb.Booster):
+            mlflow.lightgbm.log_model(model, model_name)
+        elif model_name:
             mlflow.sklearn.log_model(model, model_name)
+        if artifact_path:
+            mlflow.log_artifact(artifact_path)
 
     print(f"MLflow logged: MAE = {mae:.4f}")
     return mae
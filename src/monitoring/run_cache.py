@@ -0,0 +1,157 @@
+# File: src/monitoring/run_cache.py
+
+import json
+import os
+import time
+
+import pandas as pd
+
+RUN_CACHE_FILE = "data/monitoring/mlflow_runs.parquet"
+EXPERIMENTS = [
+    "citibike_trip_prediction_lag28",
+    "citibike_trip_prediction_baseline",
+    "citibike_trip_prediction_reduced",
+    "citibike_trip_prediction_backtest",
+]
+KEEP_PREFIXES = ("metrics.", "params.")
+KEEP_COLUMNS = ["run_id", "experiment_id", "status", "start_time", "end_time", "tags.mlflow.runName"]
+UNFINISHED = ("RUNNING", "SCHEDULED")
+
+
+class MlflowRunCache:
+    """
+    Local Parquet copy of run metrics and params for several experiments.
+
+    `refresh()` asks the tracking server only for runs that started after
+    the newest cached run of each experiment (plus any cached runs that
+    were still running), page by page with `max_results`. Dashboards read
+    from the cache and never issue unfiltered searches.
+    """
+
+    def __init__(self, path=RUN_CACHE_FILE, min_refresh_interval_s=60):
+        self.path = path
+        self.state_path = os.path.splitext(path)[0] + ".json"
+        self.min_refresh_interval_s = min_refresh_interval_s
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {"experiment_ids": {}, "refreshed_at": {}}
+
+    def _save(self, runs):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        runs.to_parquet(tmp, index=False)
+        os.replace(tmp, self.path)
+        with open(self.state_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+
+    def load(self, experiments=None):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=["experiment_name"] + KEEP_COLUMNS)
+        runs = pd.read_parquet(self.path)
+        if experiments is not None:
+            runs = runs[runs["experiment_name"].isin(list(experiments))]
+        return runs
+
+    # ---------------------------
+    # Incremental fetch
+    # ---------------------------
+    def _experiment_id(self, mlflow, name):
+        ids = self.state["experiment_ids"]
+        if name not in ids:
+            experiment = mlflow.get_experiment_by_name(name)
+            if experiment is None:
+                return None
+            ids[name] = experiment.experiment_id
+        return ids[name]
+
+    @staticmethod
+    def _trim(df, name):
+        keep = [c for c in df.columns if c in KEEP_COLUMNS or c.startswith(KEEP_PREFIXES)]
+        df = df[keep].copy()
+        df.insert(0, "experiment_name", name)
+        for col in ("start_time", "end_time"):
+            if col in df:
+                df[col] = pd.to_datetime(df[col], utc=True)
+        return df
+
+    def _search_new(self, mlflow, experiment_id, since_ms, max_results):
+        # Pages overlap on the boundary millisecond so runs sharing a start time are not skipped
+        pages, seen, op = [], set(), ">"
+        while True:
+            page = mlflow.search_runs(
+                experiment_ids=[experiment_id],
+                filter_string=f"attributes.start_time {op} {since_ms}",
+                order_by=["attributes.start_time ASC"],
+                max_results=max_results,
+            )
+            new = page[~page["run_id"].isin(seen)] if not page.empty else page
+            if new.empty:
+                break
+            pages.append(new)
+            seen.update(new["run_id"])
+            if len(page) < max_results:
+                break
+            newest_ms = int(pd.to_datetime(page["start_time"], utc=True).max().value // 1_000_000)
+            # A full page stuck on one millisecond has to move past it
+            op = ">" if newest_ms == since_ms else ">="
+            since_ms = newest_ms
+        return pages
+
+    def _search_unfinished(self, mlflow, experiment_id, run_ids, max_results):
+        if not run_ids:
+            return []
+        quoted = ", ".join(f"'{r}'" for r in run_ids)
+        return [mlflow.search_runs(
+            experiment_ids=[experiment_id],
+            filter_string=f"attributes.run_id IN ({quoted})",
+            max_results=max_results,
+        )]
+
+    def refresh(self, experiments=EXPERIMENTS, max_results=200, force=False):
+        """Fetch new and still-running runs per experiment; returns the number of rows fetched."""
+        import mlflow
+
+        runs = self.load()
+        fetched = []
+        now = time.time()
+        for name in experiments:
+            last = self.state["refreshed_at"].get(name, 0)
+            if not force and now - last < self.min_refresh_interval_s:
+                continue
+            experiment_id = self._experiment_id(mlflow, name)
+            if experiment_id is None:
+                print(f"MLflow experiment {name} not found, skipping")
+                continue
+
+            cached = runs[runs["experiment_name"] == name]
+            since_ms = int(cached["start_time"].max().value // 1_000_000) if len(cached) else 0
+            unfinished = cached.loc[cached["status"].isin(UNFINISHED), "run_id"].tolist()
+
+            pages = self._search_new(mlflow, experiment_id, since_ms, max_results)
+            pages += self._search_unfinished(mlflow, experiment_id, unfinished, max_results)
+            fetched += [self._trim(p, name) for p in pages if not p.empty]
+            self.state["refreshed_at"][name] = now
+
+        n_new = sum(len(f) for f in fetched)
+        if fetched:
+            runs = pd.concat([r for r in [runs] + fetched if not r.empty], ignore_index=True)
+            runs = runs.drop_duplicates("run_id", keep="last").sort_values("start_time").reset_index(drop=True)
+        self._save(runs)
+        print(f"MLflow run cache: fetched {n_new} runs, {len(runs)} cached")
+        return n_new
+
+
+def latest_runs(runs, metric="metrics.mae", per_experiment=10):
+    """Newest `per_experiment` finished runs with `metric`, labelled like the old dashboard."""
+    if runs.empty or metric not in runs:
+        return runs.iloc[0:0]
+    runs = runs.dropna(subset=[metric])
+    runs = runs[runs["status"] == "FINISHED"] if "status" in runs else runs
+    runs = runs.sort_values("start_time").groupby("experiment_name").tail(per_experiment).copy()
+    names = runs["tags.mlflow.runName"] if "tags.mlflow.runName" in runs else pd.Series(index=runs.index, dtype=object)
+    runs["Version"] = names.fillna(runs["run_id"].str[:8])
+    return runs
@@ -1,51 +1,235 @@
 # File: src/feature_pipeline.py
 
+import argparse
 import pandas as pd
 import os
 from dotenv import load_dotenv
-import hopsworks
+from src.common.feature_store import get_feature_store
+from src.common.feature_view import lag_feature_mode
+from src.common.feature_writer import FeatureWriter
+from src.common.profiling import profile_pipeline, stage
+from src.common.schema import compact_hourly, map_stations, memory_report
 from src.modeling.utils import create_lag_features
 
-# -------------------------------
-# Step 1: Load environment vars
-# -------------------------------
-load_dotenv()
-api_key = os.getenv("HOPSWORKS_API_KEY")
-project_name = os.getenv("HOPSWORKS_PROJECT")
+LAGS = list(range(1, 29))
+MAX_LAG = max(LAGS)
+STALE_AFTER_HOURS = 24 * 7      # watermarks further behind the newest are read per station
 
-if not api_key or not project_name:
-    raise EnvironmentError("Missing HOPSWORKS_API_KEY or HOPSWORKS_PROJECT in .env")
 
 # -------------------------------
-# Step 2: Connect to Hopsworks
+# Watermark helpers
 # -------------------------------
-os.environ["HOPSWORKS_API_KEY"] = api_key
-project = hopsworks.login(project=project_name)
-fs = project.get_feature_store()
+def read_watermarks(fg_watermarks, fg_lag):
+    """Return a Series of the last lag-feature hour per station (empty if unknown)."""
+    try:
+        df_wm = fg_watermarks.read()
+    except Exception:
+        df_wm = pd.DataFrame()
 
-# -------------------------------
-# Step 3: Load raw hourly trip data
-# -------------------------------
-fg_raw = fs.get_feature_group("citibike_hourly_trips", version=1)
-df_raw = fg_raw.read()
-df_raw['datetime'] = pd.to_datetime(df_raw['datetime'])
+    if df_wm.empty and fg_lag is not None:
+        # Bootstrap once from the existing lag table (key columns only)
+        try:
+            keys = fg_lag.read(columns=["start_station_name", "datetime"])
+            keys['datetime'] = pd.to_datetime(keys['datetime'])
+            df_wm = keys.groupby("start_station_name", as_index=False, observed=True)["datetime"].max()
+            df_wm = df_wm.rename(columns={"datetime": "watermark"})
+        except Exception:
+            df_wm = pd.DataFrame()
 
-# -------------------------------
-# Step 4: Create lag features
-# -------------------------------
-df_lagged = create_lag_features(df_raw, lags=list(range(1, 29)))
-print(f"Created lag features: {df_lagged.shape}")
+    if df_wm.empty:
+        return pd.Series(dtype="datetime64[ns]")
 
-# -------------------------------
-# Step 5: Save to new Feature Group
-# -------------------------------
-fg_lag = fs.get_or_create_feature_group(
-    name="citibike_lag_features",
-    version=1,
-    primary_key=["start_station_name", "datetime"],
-    event_time="datetime",
-    description="Lag features (1-28 hours) for trip prediction"
-)
-
-fg_lag.insert(df_lagged, write_options={"wait_for_job": True})
-print("Lag features saved to Hopsworks: citibike_lag_features_v1")
+    return pd.to_datetime(df_wm.set_index("start_station_name")["watermark"])
+
+
+def confirm_watermarks(fg_lag, watermarks):
+    """
+    Keep only watermarks backed by a row in citibike_lag_features. View mode
+    advances the same watermarks without writing lag rows, so after switching
+    back a station can be ahead of its lags; it rewinds to its newest lag row
+    (or to a full history read when it has none).
+    """
+    if watermarks.empty:
+        return watermarks
+    # Exact (station, watermark) lookups: tiny, however old the watermarks are
+    keys = fg_lag.read(columns=["start_station_name", "datetime"],
+                       filters=[("start_station_name", "in", list(watermarks.index)),
+                                ("datetime", "in", list(watermarks.unique()))])
+    found = set(zip(keys["start_station_name"].astype(str), pd.to_datetime(keys["datetime"])))
+    ahead = [s for s, wm in watermarks.items() if (s, wm) not in found]
+    if not ahead:
+        return watermarks
+
+    keys = fg_lag.read(columns=["start_station_name", "datetime"], filters=[("start_station_name", "in", ahead)])
+    keys["datetime"] = pd.to_datetime(keys["datetime"])
+    rewound = keys.groupby(keys["start_station_name"].astype(str))["datetime"].max()
+    print(f"{len(ahead)} watermarks are ahead of citibike_lag_features (advanced in view mode), "
+          f"rewinding them to their newest lag row")
+    return pd.concat([watermarks.drop(ahead), rewound]).rename("watermark")
+
+
+def active_watermarks(watermarks, stale_after_hours=STALE_AFTER_HOURS):
+    """Watermarks within `stale_after_hours` of the newest one."""
+    return watermarks[watermarks >= watermarks.max() - pd.Timedelta(hours=stale_after_hours)]
+
+
+def read_new_hours(fg_raw, watermarks, stale_after_hours=STALE_AFTER_HOURS):
+    """
+    Read only the hours after the watermarks plus the lag lookback. Stations
+    whose watermark trails the newest by more than `stale_after_hours` (e.g.
+    a station that stopped reporting) are read on their own, so they do not
+    pull the shared scan back to their last trip on every run.
+    """
+    active = active_watermarks(watermarks, stale_after_hours)
+    stale = watermarks.drop(active.index)
+    lookback = pd.Timedelta(hours=MAX_LAG)
+    df_new = fg_raw.read(filters=[("datetime", ">=", active.min() - lookback)])
+    df_new['datetime'] = pd.to_datetime(df_new['datetime'])
+
+    # Stations without a watermark need their full history
+    unseen = sorted(set(df_new['start_station_name'].astype(str)) - set(watermarks.index))
+    parts = [df_new[~df_new['start_station_name'].astype(str).isin(unseen + list(stale.index))]]
+    if unseen:
+        parts.append(fg_raw.read(filters=[("start_station_name", "in", unseen)]))
+    if not stale.empty:
+        parts.append(fg_raw.read(filters=[("start_station_name", "in", list(stale.index)),
+                                          ("datetime", ">=", stale.min() - lookback)]))
+    df_new = pd.concat(parts, ignore_index=True)
+    df_new['datetime'] = pd.to_datetime(df_new['datetime'])
+
+    return df_new.sort_values(['start_station_name', 'datetime']).reset_index(drop=True)
+
+
+def hourly_watermarks(fg_raw, watermarks):
+    """View mode: each station's newest hourly row, where it moved past the watermark."""
+    filters = [("datetime", ">", watermarks.min())] if not watermarks.empty else None
+    keys = fg_raw.read(columns=["start_station_name", "datetime"], filters=filters)
+    keys['datetime'] = pd.to_datetime(keys['datetime'])
+    latest = keys.groupby("start_station_name", observed=True)["datetime"].max()
+    previous = watermarks.reindex(latest.index.astype(str))
+    latest = latest[previous.isna().to_numpy() | (latest.to_numpy() > previous.to_numpy())]
+    return latest.rename("watermark").reset_index()
+
+
+def keep_after_watermark(df_lagged, watermarks):
+    """Drop lag rows that were already written in a previous run."""
+    station_wm = map_stations(df_lagged['start_station_name'], watermarks)
+    return df_lagged[station_wm.isna() | (df_lagged['datetime'] > station_wm)]
+
+
+@profile_pipeline("feature_pipeline")
+def main(mode="incremental"):
+    # -------------------------------
+    # Step 1: Load environment vars
+    # -------------------------------
+    load_dotenv()
+    store = get_feature_store()
+    if store.backend == "hopsworks" and not (os.getenv("HOPSWORKS_API_KEY") and os.getenv("HOPSWORKS_PROJECT")):
+        raise EnvironmentError("Missing HOPSWORKS_API_KEY or HOPSWORKS_PROJECT in .env")
+
+    # -------------------------------
+    # Step 2: Connect to the feature store
+    # -------------------------------
+    view_mode = lag_feature_mode() == "view"
+    writer = FeatureWriter()
+    with stage("connect"):
+        # In view mode lags are derived on read and citibike_lag_features is not written
+        fg_lag = None if view_mode else store.get("citibike_lag_features")
+        fg_watermarks = store.get("citibike_lag_watermarks")
+        fg_raw = store.get("citibike_hourly_trips", create=False)
+
+    # -------------------------------
+    # Step 3: Load raw hourly trip data
+    # -------------------------------
+    watermarks = pd.Series(dtype="datetime64[ns]")
+    grid_start = None
+    if mode == "incremental":
+        with stage("read_watermarks") as s:
+            watermarks = read_watermarks(fg_watermarks, fg_lag)
+            if not view_mode:
+                watermarks = confirm_watermarks(fg_lag, watermarks)
+            s.rows = len(watermarks)
+        if watermarks.empty:
+            print("No watermarks found, falling back to a full rebuild")
+            mode = "full"
+
+    if view_mode:
+        with stage("advance_watermarks") as s:
+            new_wm = hourly_watermarks(fg_raw, watermarks)
+            s.rows = len(new_wm)
+            if not new_wm.empty:
+                new_wm["updated_at"] = pd.Timestamp.utcnow().tz_localize(None)
+                writer.write(fg_watermarks, new_wm, delta="pk", compare=["watermark"])
+        with stage("wait_for_jobs"):
+            writer.finish()
+        print(f"LAG_FEATURE_MODE=view: lags are computed on read, watermarks advanced for {len(new_wm)} stations")
+        return
+
+    with stage("read_hourly") as s:
+        if mode == "incremental":
+            df_raw = compact_hourly(read_new_hours(fg_raw, watermarks))
+            # Each station's grid reaches back to its own watermark's lookback;
+            # stations without a watermark start at their first observed hour
+            grid_start = watermarks - pd.Timedelta(hours=MAX_LAG)
+            print(f"Incremental read from {active_watermarks(watermarks).min()} minus {MAX_LAG}h lookback "
+                  f"({len(watermarks) - len(active_watermarks(watermarks))} stale stations read separately): "
+                  f"{df_raw.shape}")
+        else:
+            df_raw = compact_hourly(fg_raw.read())
+            print(f"Full read of citibike_hourly_trips: {df_raw.shape}")
+        s.rows = len(df_raw)
+    memory_report("feature_pipeline/hourly", df_raw)
+
+    # -------------------------------
+    # Step 4: Create lag features
+    # -------------------------------
+    with stage("lag_features") as s:
+        # Hours with no trips are filled with 0 from the start of each station's lookback window
+        # up to the newest hour of any station, so a station that goes quiet still gets current rows
+        grid_end = df_raw['datetime'].max() if not df_raw.empty else None
+        df_lagged = create_lag_features(df_raw, lags=LAGS, start=grid_start, end=grid_end)
+        df_lagged = keep_after_watermark(df_lagged, watermarks)
+        s.rows = len(df_lagged)
+    print(f"Created lag features: {df_lagged.shape}")
+    memory_report("feature_pipeline/lag_features", df_lagged)
+
+    if df_lagged.empty:
+        print("No new hours to write, lag features are up to date")
+        return
+
+    # -------------------------------
+    # Step 5: Upsert new rows and advance watermarks
+    # -------------------------------
+    with stage("insert_lag_features") as s:
+        # Incremental rows are already past each station's watermark; a full
+        # rebuild only re-sends rows whose values changed
+        delta = "pk" if mode == "full" else None
+        compare = ["trip_count"] + [f"lag_{lag}" for lag in LAGS]
+        s.rows = writer.write(fg_lag, df_lagged, delta=delta, compare=compare)
+    print(f"Lag features saved to the {store.backend} feature store: citibike_lag_features_v1")
+
+    with stage("insert_watermarks") as s:
+        new_wm = df_lagged.groupby("start_station_name", as_index=False, observed=True)["datetime"].max()
+        new_wm = new_wm.rename(columns={"datetime": "watermark"})
+        new_wm["updated_at"] = pd.Timestamp.utcnow().tz_localize(None)
+        s.rows = writer.write(fg_watermarks, new_wm, delta="pk", compare=["watermark"])
+    print(f"Watermarks advanced for {len(new_wm)} stations")
+
+    with stage("wait_for_jobs"):
+        writer.finish()
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Build lag features from hourly trip counts")
+    parser.add_argument(
+        "--mode",
+        choices=["incremental", "full"],
+        default=os.getenv("FEATURE_PIPELINE_MODE", "incremental"),
+        help="incremental reads only new hours per station; full recomputes the whole table"
+    )
+    args = parser.parse_args(argv)
+    main(mode=args.mode)
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,54 +1,205 @@
+import argparse
 import os
 import pandas as pd
-import joblib
 from dotenv import load_dotenv
-import hopsworks
 from datetime import datetime
+from src.common.count_store import HourlyCountStore, count_store_root
+from src.common.feature_store import PREDICTIONS_VERSION, get_feature_store
+from src.common.feature_view import LagFeatureView, lag_feature_mode
+from src.common.feature_writer import FeatureWriter
+from src.common.profiling import profile_pipeline, stage
+from src.common.schema import compact_lag_features, memory_report
+from src.modeling.multi_station import load_predictor
+from src.modeling.forecasting import (
+    HORIZON_STRATEGIES,
+    forecast_frame,
+    load_direct_model,
+    next_hour_lags,
+    recursive_forecast
+)
+
+FEATURES = [f"lag_{i}" for i in range(1, 29)]
+WINDOW_HOURS = 28
 
-# ---------------------------
-# Step 1: Load environment
-# ---------------------------
-load_dotenv()
-os.environ["HOPSWORKS_API_KEY"] = os.getenv("HOPSWORKS_API_KEY")
-project = hopsworks.login(project=os.getenv("HOPSWORKS_PROJECT"))
-fs = project.get_feature_store()
 
 # ---------------------------
-# Step 2: Load lag feature data
+# Time-bounded feature reads
 # ---------------------------
-fg_lag = fs.get_feature_group("citibike_lag_features", version=1)
-df = fg_lag.read()
-df['datetime'] = pd.to_datetime(df['datetime'])
+def read_station_watermarks(store):
+    """Latest lag-feature hour per station, as maintained by the feature pipeline."""
+    try:
+        df_wm = store.read("citibike_lag_watermarks")
+        return pd.to_datetime(df_wm.set_index("start_station_name")["watermark"])
+    except Exception as e:
+        print(f"No station watermarks available ({e})")
+        return pd.Series(dtype="datetime64[ns]")
 
-# Use only the latest record for each station
-latest_df = df.sort_values("datetime").groupby("start_station_name").tail(1)
-features = [f"lag_{i}" for i in range(1, 29)]
 
-# ---------------------------
-# Step 3: Load best model
-# ---------------------------
-model = joblib.load("models/best_model.pkl")
+def window_start(watermarks, window_hours=WINDOW_HOURS, now=None):
+    """Oldest hour to read: the stalest station's latest hour, capped at `window_hours` back."""
+    newest = watermarks.max() if not watermarks.empty else pd.Timestamp(now or datetime.utcnow()).floor("h")
+    cap = newest - pd.Timedelta(hours=window_hours)
+    if watermarks.empty:
+        return cap
+    return max(watermarks.min(), cap)
 
-# ---------------------------
-# Step 4: Make predictions
-# ---------------------------
-latest_df["prediction"] = model.predict(latest_df[features])
-latest_df["prediction_time"] = datetime.utcnow()
 
-predictions_df = latest_df[["start_station_name", "datetime", "prediction", "prediction_time"]]
+def latest_rows(df):
+    """Keep the newest lag row per station."""
+    df = compact_lag_features(df)
+    return df.sort_values("datetime").groupby("start_station_name", observed=True).tail(1)
 
-print("Predictions:\n", predictions_df)
 
-# ---------------------------
-# Step 5: Save predictions to Hopsworks
-# ---------------------------
-fg_preds = fs.get_or_create_feature_group(
-    name="citibike_predictions",
-    version=1,
-    primary_key=["start_station_name", "datetime"],
-    event_time="prediction_time",
-    description="Predicted Citi Bike trip count (1-hour ahead) for each station"
-)
+def read_latest_features(fg_lag, cutoff):
+    df = fg_lag.read(filters=[("datetime", ">=", cutoff)])
+    return latest_rows(df)
+
+
+def read_latest_features_from_snapshot(path, cutoff):
+    """Same read against a local Parquet snapshot of citibike_lag_features."""
+    df = pd.read_parquet(path, filters=[("datetime", ">=", pd.Timestamp(cutoff))])
+    return latest_rows(df)
+
+
+def drop_already_predicted(latest_df, fg_preds, cutoff, offset_hours=0):
+    """
+    Skip stations whose latest hour already has a row in citibike_predictions
+    (keyed `offset_hours` after the latest hour: v3 rows carry the target hour).
+    """
+    try:
+        done = fg_preds.read(columns=["start_station_name", "datetime"], filters=[("datetime", ">=", cutoff)])
+    except Exception as e:
+        print(f"Could not read existing predictions ({e}), predicting all stations")
+        return latest_df
+    if done.empty:
+        return latest_df
+
+    done['datetime'] = pd.to_datetime(done['datetime'])
+    ours = latest_df[["start_station_name", "datetime"]].assign(
+        datetime=pd.to_datetime(latest_df["datetime"]) + pd.Timedelta(hours=offset_hours))
+    keys = ours.merge(done.drop_duplicates(), on=["start_station_name", "datetime"],
+                           how="left", indicator=True)
+    skipped = int((keys["_merge"] == "both").sum())
+    if skipped:
+        print(f"Skipping {skipped} stations already predicted for their latest hour")
+    return latest_df[(keys["_merge"] == "left_only").to_numpy()].copy()
+
+
+def get_predictions_fg(store, horizon=1):
+    """
+    v3 holds 1-hour-ahead rows keyed by the hour predicted (v1 has the older
+    rows keyed by the feature hour); multi-horizon runs write to v2, keyed by
+    the feature hour and horizon.
+    """
+    return store.get("citibike_predictions", version=PREDICTIONS_VERSION if horizon == 1 else 2)
+
+
+def next_hour_frame(latest_df, preds, prediction_time=None):
+    """v3 rows: one per station for the hour after its latest row."""
+    return pd.DataFrame({
+        "start_station_name": latest_df["start_station_name"].to_numpy(),
+        "datetime": pd.to_datetime(latest_df["datetime"]).to_numpy() + pd.Timedelta(hours=1),
+        "prediction": preds[:, 0],
+        "prediction_time": prediction_time if prediction_time is not None else datetime.utcnow(),
+    })
+
+
+def predict_horizons(latest_df, project, horizon, strategy="recursive"):
+    """(stations x horizon) forecasts for every station in one batch."""
+    X = next_hour_lags(latest_df, FEATURES)
+    stations = latest_df["start_station_name"].astype(str).to_numpy()
+    if strategy == "direct":
+        model = load_direct_model(project)
+        if model.horizon < horizon:
+            raise ValueError(f"Direct model covers {model.horizon} hours, {horizon} requested")
+        return model.predict_matrix(stations, X)[:, :horizon]
+    predict = load_predictor(project, features=FEATURES)
+    return recursive_forecast(predict, stations, X, horizon, FEATURES)
+
+
+@profile_pipeline("inference_pipeline")
+def main(window_hours=WINDOW_HOURS, snapshot=None, horizon=1, strategy="recursive"):
+    # ---------------------------
+    # Step 1: Load environment
+    # ---------------------------
+    load_dotenv()
+    with stage("connect"):
+        store = get_feature_store()
+        project = store.project
+        fg_preds = get_predictions_fg(store, horizon)
+
+    # ---------------------------
+    # Step 2: Load the latest lag row per station (bounded window)
+    # ---------------------------
+    with stage("read_latest_features") as s:
+        watermarks = read_station_watermarks(store)
+        cutoff = window_start(watermarks, window_hours)
+        if snapshot:
+            latest_df = read_latest_features_from_snapshot(snapshot, cutoff)
+        elif count_store_root():
+            # One gathered row per station out of the local memory-mapped counts
+            latest_df = HourlyCountStore(count_store_root()).latest_frame(len(FEATURES), since=cutoff)
+        elif lag_feature_mode() == "view":
+            # Only the hourly series since cutoff minus the longest lag is read
+            latest_df = latest_rows(LagFeatureView(store).read(FEATURES, start=cutoff))
+        else:
+            fg_lag = store.get("citibike_lag_features", create=False)
+            latest_df = read_latest_features(fg_lag, cutoff)
+        s.rows = len(latest_df)
+    print(f"Read lag features since {cutoff}: {len(latest_df)} stations")
+    memory_report("inference/latest_features", latest_df)
+
+    stale = sorted(set(watermarks.index) - set(latest_df["start_station_name"]))
+    if stale:
+        print(f"{len(stale)} stations have no lag rows in the last {window_hours}h: {stale}")
+
+    with stage("drop_already_predicted") as s:
+        latest_df = drop_already_predicted(latest_df, fg_preds, cutoff, offset_hours=1 if horizon == 1 else 0)
+        s.rows = len(latest_df)
+    if latest_df.empty:
+        print("All stations already have predictions for their latest hour")
+        return
+
+    # ---------------------------
+    # Step 3-4: Forecast t+1..t+horizon for all stations at once
+    # ---------------------------
+    with stage("forecast") as s:
+        # Every horizon starts from the hour after each station's latest row
+        preds = predict_horizons(latest_df, project, horizon, strategy)
+        if horizon > 1:
+            predictions_df = forecast_frame(latest_df, preds, datetime.utcnow())
+        else:
+            predictions_df = next_hour_frame(latest_df, preds, datetime.utcnow())
+        s.rows = len(predictions_df)
+
+    print("Predictions:\n", predictions_df)
+
+    # ---------------------------
+    # Step 5: Save predictions to the feature store
+    # ---------------------------
+    # Rows for already-predicted hours were dropped in Step 2, so every row is new
+    writer = FeatureWriter()
+    with stage("insert_predictions") as s:
+        s.rows = writer.write(fg_preds, predictions_df)
+    print(f"Predictions saved to {store.backend} feature group: citibike_predictions_v{fg_preds.version}")
+    with stage("wait_for_jobs"):
+        writer.finish()
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Predict the next hour(s) of trips for every station")
+    parser.add_argument("--window-hours", type=int, default=WINDOW_HOURS,
+                        help="how far back to look for each station's latest lag row")
+    parser.add_argument("--snapshot", default=None,
+                        help="local Parquet snapshot of citibike_lag_features to read instead of Hopsworks")
+    parser.add_argument("--horizon", type=int, default=int(os.getenv("FORECAST_HORIZON", "1")),
+                        help="hours ahead to forecast; 1 writes citibike_predictions v3, "
+                             "above 1 writes v2 with a horizon column")
+    parser.add_argument("--strategy", choices=HORIZON_STRATEGIES, default="recursive",
+                        help="recursive: feed each step back as lag_1; direct: one trained model per horizon")
+    args = parser.parse_args(argv)
+    main(args.window_hours, args.snapshot, args.horizon, args.strategy)
+
 
-fg_preds.insert(predictions_df, write_options={"wait_for_job": True})
-print("Predictions saved to Hopsworks Feature Group: citibike_predictions_v1")
\ No newline at end of file
+if __name__ == "__main__":
+    cli()
@@ -1,97 +1,394 @@
 # File: pipelines/model_training_pipeline.py
 
+import argparse
 import os
-import pandas as pd
 import lightgbm as lgb
 from dotenv import load_dotenv
 from sklearn.metrics import mean_absolute_error
-import hopsworks
 import mlflow
 import mlflow.sklearn
 import joblib
-from hsml.schema import Schema
-from hsml.model_schema import ModelSchema
-
-# ---------------------------
-# Step 1: Load environment variables
-# ---------------------------
-load_dotenv()
-
-# For Hopsworks
-os.environ["HOPSWORKS_API_KEY"] = os.getenv("HOPSWORKS_API_KEY")
-project_name = os.getenv("HOPSWORKS_PROJECT")
-
-# For DagsHub MLflow
-os.environ["MLFLOW_TRACKING_USERNAME"] = os.getenv("DAGSHUB_USERNAME")
-os.environ["MLFLOW_TRACKING_PASSWORD"] = os.getenv("DAGSHUB_TOKEN")
-mlflow.set_tracking_uri(f"https://dagshub.com/{os.getenv('DAGSHUB_USERNAME')}/{os.getenv('DAGSHUB_REPO')}.mlflow")
-mlflow.set_experiment("citibike_trip_prediction_lag28")
-
-# ---------------------------
-# Step 2: Connect to Hopsworks & load lagged data
-# ---------------------------
-project = hopsworks.login(project=project_name)
-fs = project.get_feature_store()
-
-fg = fs.get_feature_group("citibike_lag_features", version=1)
-df = fg.read()
-df['datetime'] = pd.to_datetime(df['datetime'])
-
-# Focus on one station
-station = df['start_station_name'].unique()[0]
-df_station = df[df['start_station_name'] == station].copy()
-df_station = df_station.sort_values("datetime")
-
-# ---------------------------
-# Step 3: Train/test split
-# ---------------------------
-split_index = int(len(df_station) * 0.8)
-train = df_station.iloc[:split_index]
-test = df_station.iloc[split_index:]
-
-X_train = train[[f"lag_{i}" for i in range(1, 29)]]
-y_train = train["trip_count"]
-X_test = test[[f"lag_{i}" for i in range(1, 29)]]
-y_test = test["trip_count"]
-
-# ---------------------------
-# Step 4: Train LightGBM model
-# ---------------------------
-model = lgb.LGBMRegressor(random_state=42)
-model.fit(X_train, y_train)
-y_pred = model.predict(X_test)
-
-mae = mean_absolute_error(y_test, y_pred)
-
-# ---------------------------
-# Step 5: Log metrics to MLflow (DagsHub)
-# ---------------------------
-with mlflow.start_run():
-    mlflow.log_metric("mae", mae)
-    mlflow.sklearn.log_model(model, "lightgbm_lag28_model")
-    print(f"MAE logged to MLflow: {mae:.4f}")
-
-# ---------------------------
-# Step 6: Save model locally
-# ---------------------------
-os.makedirs("models", exist_ok=True)
-joblib.dump(model, "models/best_model.pkl")
-
-# ---------------------------
-# Step 7: Register model to Hopsworks Model Registry
-# ---------------------------
-mr = project.get_model_registry()
-input_example = X_test.iloc[:1]
-schema = Schema(input_example)
-
-model_registry_entry = mr.python.create_model(
-    name="citibike_lag28_lightgbm",
-    metrics={"mae": mae},
-    description="LightGBM model with 28 lag features",
-    input_example=input_example,
-    model_schema=ModelSchema(schema)
+from src.modeling.multi_station import (
+    BUNDLE_MODEL_NAME,
+    BUNDLE_PATH,
+    LAG_FEATURES,
+    add_strategy_argument,
+    station_mae,
+    train_bundle,
+    train_test_split_per_station
 )
+from src.common.feature_store import get_feature_store
+from src.common.count_store import HourlyCountStore, count_store_root
+from src.common.feature_view import lag_feature_mode
+from src.common.profiling import profile_pipeline, stage
+from src.common.schema import compact_lag_features, memory_report
+from src.modeling.training_cache import TrainingDataCache, cache_key, load_lag_features
+from src.modeling.forecasting import DIRECT_MODEL_NAME, DIRECT_MODEL_PATH, direct_targets, train_direct
+from src.modeling.incremental import (
+    INCREMENTAL_ROUNDS,
+    MAX_BOOST_ROUNDS,
+    MAX_MAE_INCREASE,
+    MAX_UPDATES_SINCE_FULL,
+    TRAINING_MODES,
+    as_bundle,
+    boost_rounds,
+    bundle_mae,
+    continue_bundle,
+    full_retrain_reason,
+    last_training_hour,
+    load_previous,
+    newest_hours,
+    save_state,
+    split_new_hours,
+    station_key,
+    trained_until,
+    training_state
+)
+
+SINGLE_MODEL_NAME = "citibike_lag28_lightgbm"
+SINGLE_MODEL_PATH = "models/best_model.pkl"
+
+
+def register_model(project, name, path, mae, description, input_example, metrics=None):
+    """
+    Register a saved model file; skipped when the feature store has no
+    Hopsworks project. `metrics` (numbers) are stored next to the MAE.
+    """
+    if project is None:
+        print(f"No model registry for this feature store backend, kept {name} at {path}")
+        return
+    from hsml.model_schema import ModelSchema
+    from hsml.schema import Schema
+
+    mr = project.get_model_registry()
+    model_registry_entry = mr.python.create_model(
+        name=name,
+        metrics={"mae": mae, **(metrics or {})},
+        description=description,
+        input_example=input_example,
+        model_schema=ModelSchema(Schema(input_example))
+    )
+    model_registry_entry.save(path)
+    print(f"Model saved to Hopsworks Model Registry as '{name}'")
+
+
+def read_training_features(store, cache):
+    """
+    The full lag table, through TrainingDataCache when its source has a data
+    version: a rerun on unchanged data skips the feature-store read. Lag rows
+    from the local count store are memory-mapped already and are not copied.
+    """
+    if count_store_root():
+        return HourlyCountStore(count_store_root()).lag_rows(len(LAG_FEATURES))
+    if lag_feature_mode() == "view":
+        # Same rows as LagFeatureView.read(LAG_FEATURES), keyed by the hourly group's version
+        _, df = load_lag_features(cache=cache)
+        return compact_lag_features(df)
+    fg = store.get("citibike_lag_features", create=False)
+    data_version = fg.data_version()
+    if data_version is None:
+        return compact_lag_features(fg.read())
+    key = cache_key(data_version, source=f"{fg.name}_v{fg.version}")
+    return compact_lag_features(cache.features(key, fg.read))
+
+
+def single_station_frame(df):
+    # Focus on one station
+    station = df['start_station_name'].unique()[0]
+    df_station = df[df['start_station_name'] == station].copy()
+    return station, df_station.sort_values("datetime")
+
+
+def train_single_station(df, project):
+    station, df_station = single_station_frame(df)
+
+    # ---------------------------
+    # Step 3: Train/test split
+    # ---------------------------
+    split_index = int(len(df_station) * 0.8)
+    train = df_station.iloc[:split_index]
+    test = df_station.iloc[split_index:]
+
+    X_train = train[LAG_FEATURES]
+    y_train = train["trip_count"]
+    X_test = test[LAG_FEATURES]
+    y_test = test["trip_count"]
+
+    # ---------------------------
+    # Step 4: Train LightGBM model
+    # ---------------------------
+    with stage("train_single") as s:
+        model = lgb.LGBMRegressor(random_state=42)
+        model.fit(X_train, y_train)
+        y_pred = model.predict(X_test)
+        s.rows = len(X_train)
+
+    mae = mean_absolute_error(y_test, y_pred)
+
+    # ---------------------------
+    # Step 5: Log metrics to MLflow (DagsHub)
+    # ---------------------------
+    with mlflow.start_run():
+        mlflow.log_metric("mae", mae)
+        mlflow.sklearn.log_model(model, "lightgbm_lag28_model")
+        print(f"MAE logged to MLflow: {mae:.4f}")
+
+    # ---------------------------
+    # Step 6: Save model locally
+    # ---------------------------
+    os.makedirs("models", exist_ok=True)
+    joblib.dump(model, SINGLE_MODEL_PATH)
+    week = newest_hours(test)
+    baseline_mae = mean_absolute_error(week["trip_count"], model.predict(week[LAG_FEATURES]))
+    state = training_state(train["datetime"].max(), baseline_mae, model.booster_.current_iteration(),
+                           station=station)
+    save_state(SINGLE_MODEL_PATH, state)
+
+    # ---------------------------
+    # Step 7: Register model to Hopsworks Model Registry
+    # ---------------------------
+    with stage("register"):
+        register_model(project, SINGLE_MODEL_NAME, SINGLE_MODEL_PATH, mae,
+                       "LightGBM model with 28 lag features", X_test.iloc[:1], metrics=state)
+
+
+def train_all_stations(df, project, strategy, n_workers=None, threads_per_worker=1):
+    # ---------------------------
+    # Step 3: Per-station train/test split
+    # ---------------------------
+    with stage("split") as s:
+        train, test = train_test_split_per_station(df)
+        s.rows = len(train)
+
+    # ---------------------------
+    # Step 4: Train a model bundle covering every station
+    # ---------------------------
+    with stage(f"train_{strategy}") as s:
+        bundle = train_bundle(train, strategy, n_workers=n_workers, threads_per_worker=threads_per_worker)
+        s.rows = len(train)
+    with stage("evaluate") as s:
+        mae, per_station = station_mae(bundle, test)
+        s.rows = len(test)
+
+    # ---------------------------
+    # Step 5: Log metrics to MLflow (DagsHub)
+    # ---------------------------
+    with mlflow.start_run(run_name=f"lag28_{strategy}"):
+        mlflow.log_param("strategy", strategy)
+        mlflow.log_param("n_stations", len(per_station))
+        mlflow.log_metric("mae", mae)
+        mlflow.log_metric("mae_station_max", per_station.max())
+        mlflow.log_dict(per_station.to_dict(), "station_mae.json")
+        print(f"MAE logged to MLflow: {mae:.4f} over {len(per_station)} stations")
+
+    # ---------------------------
+    # Step 6: Save bundle locally
+    # ---------------------------
+    with stage("save"):
+        bundle.save(BUNDLE_PATH)
+        baseline_mae = bundle_mae(bundle, newest_hours(test))
+        state = training_state(last_training_hour(train), baseline_mae, boost_rounds(bundle))
+        save_state(BUNDLE_PATH, state)
+
+    # ---------------------------
+    # Step 7: Register bundle to Hopsworks Model Registry
+    # ---------------------------
+    with stage("register"):
+        register_model(project, BUNDLE_MODEL_NAME, BUNDLE_PATH, mae,
+                       f"LightGBM lag-28 models for all stations ({strategy})",
+                       test[["start_station_name"] + LAG_FEATURES].iloc[:1], metrics=state)
+
+
+def train_full(df, project, strategy, n_workers=None, threads_per_worker=1):
+    if strategy == "single":
+        train_single_station(df, project)
+    else:
+        train_all_stations(df, project, strategy, n_workers, threads_per_worker)
+
+
+def train_incremental(df, project, strategy, rounds=INCREMENTAL_ROUNDS, max_mae_increase=MAX_MAE_INCREASE,
+                      max_boost_rounds=MAX_BOOST_ROUNDS, n_workers=None, threads_per_worker=1,
+                      max_updates_since_full=MAX_UPDATES_SINCE_FULL):
+    """
+    Continue boosting the current model version on the hours it has not
+    seen, so the cost follows the new data rather than the whole history.
+    Falls back to a full retrain when there is nothing to continue, when
+    new stations appear, or on too many trees, too many updates in a row
+    or too much MAE drift.
+    """
+    single = strategy == "single"
+    name, path = (SINGLE_MODEL_NAME, SINGLE_MODEL_PATH) if single else (BUNDLE_MODEL_NAME, BUNDLE_PATH)
+    if single:
+        station, df = single_station_frame(df)
+
+    # ---------------------------
+    # Step 3: Load the current model version and its training state
+    # ---------------------------
+    with stage("load_previous"):
+        previous = load_previous(project, name, path)
+    if previous is None:
+        print("No model with training state to continue, running a full retrain")
+        return train_full(df, project, strategy, n_workers, threads_per_worker)
+    model, state, source = previous
+    if single and state.get("station_key") != station_key(station):
+        print(f"{source} was trained for another station than {station}, running a full retrain")
+        return train_full(df, project, strategy, n_workers, threads_per_worker)
+    bundle = as_bundle(model, station, LAG_FEATURES) if single else model
+    if bundle.strategy != ("per_station" if single else strategy):
+        print(f"{source} is a {bundle.strategy} bundle, running a full {strategy} retrain")
+        return train_full(df, project, strategy, n_workers, threads_per_worker)
+
+    # ---------------------------
+    # Step 4: Hours since the last version, newest week held out
+    # ---------------------------
+    new_train, valid = split_new_hours(df, trained_until(state))
+    if new_train.empty:
+        print(f"No new hours since {trained_until(state)}, keeping {source}")
+        return
+    print(f"Continuing {source}: {len(new_train)} new rows after {trained_until(state)}, "
+          f"{len(valid)} validation rows")
+
+    # ---------------------------
+    # Step 5: Add trees fitted to the new hours only
+    # ---------------------------
+    with stage(f"continue_{strategy}") as s:
+        try:
+            updated = continue_bundle(bundle, new_train, rounds)
+        except KeyError as e:
+            print(f"{e.args[0]} need their full history, running a full retrain")
+            return train_full(df, project, strategy, n_workers, threads_per_worker)
+        s.rows = len(new_train)
+
+    # ---------------------------
+    # Step 6: Compare with the previous version on the same hours
+    # ---------------------------
+    with stage("evaluate") as s:
+        previous_mae = bundle_mae(bundle, valid)
+        mae = bundle_mae(updated, valid)
+        s.rows = len(valid)
+    rounds_total = boost_rounds(updated)
+    reason = full_retrain_reason(state, mae, rounds_total, max_mae_increase, max_boost_rounds,
+                                 max_updates_since_full)
+
+    with mlflow.start_run(run_name=f"lag28_{strategy}_incremental"):
+        mlflow.log_param("strategy", strategy)
+        mlflow.log_param("mode", "incremental")
+        mlflow.log_param("previous_version", source)
+        mlflow.log_param("new_rows", len(new_train))
+        mlflow.log_metric("mae", mae)
+        mlflow.log_metric("previous_mae", previous_mae)
+        mlflow.log_metric("boost_rounds", rounds_total)
+        print(f"Incremental MAE {mae:.4f} vs previous {previous_mae:.4f} ({rounds_total} rounds)")
+
+    if reason:
+        print(f"Full retrain: {reason}")
+        return train_full(df, project, strategy, n_workers, threads_per_worker)
+    if mae > previous_mae:
+        print(f"Update did not beat {source} on the validation week, keeping it")
+        return
+
+    # ---------------------------
+    # Step 7: Save and register the updated version
+    # ---------------------------
+    state = training_state(last_training_hour(new_train), state["baseline_mae"], rounds_total,
+                           state["updates_since_full"] + 1, station=station if single else None)
+    with stage("save"):
+        if single:
+            joblib.dump(updated.station_models[str(station)], path)
+        else:
+            updated.save(path)
+        save_state(path, state)
+    with stage("register"):
+        register_model(project, name, path, mae,
+                       f"LightGBM lag-28 model(s), incremental update {state['updates_since_full']} "
+                       f"on {source}", valid[(["start_station_name"] if not single else []) + LAG_FEATURES].iloc[:1],
+                       metrics=state)
+
+
+def train_direct_horizons(df, project, horizon, n_threads=None):
+    # ---------------------------
+    # Direct multi-horizon models (one global model per hour ahead)
+    # ---------------------------
+    train, test = train_test_split_per_station(df)
+    model = train_direct(train, horizon, "global")
+    test = direct_targets(test, horizon).dropna(subset=[f"target_h{horizon}"])
+    mae, _ = station_mae(model.bundles[-1], test, target_col=f"target_h{horizon}")
+
+    with mlflow.start_run(run_name=f"lag28_direct_h{horizon}"):
+        mlflow.log_param("strategy", "direct")
+        mlflow.log_param("horizon", horizon)
+        mlflow.log_metric("mae", mae)
+        print(f"Direct t+{horizon} MAE logged to MLflow: {mae:.4f}")
+
+    model.save(DIRECT_MODEL_PATH)
+    register_model(project, DIRECT_MODEL_NAME, DIRECT_MODEL_PATH, mae,
+                   f"LightGBM lag-28 direct models for horizons 1..{horizon}",
+                   test[["start_station_name"] + LAG_FEATURES].iloc[:1])
+
+
+@profile_pipeline("model_training_pipeline")
+def main(strategy="per_station", n_workers=None, threads_per_worker=1, direct_horizon=0, mode="full",
+         incremental_rounds=INCREMENTAL_ROUNDS, max_mae_increase=MAX_MAE_INCREASE, max_boost_rounds=MAX_BOOST_ROUNDS,
+         max_updates_since_full=MAX_UPDATES_SINCE_FULL):
+    # ---------------------------
+    # Step 1: Load environment variables
+    # ---------------------------
+    load_dotenv()
+
+    # For DagsHub MLflow
+    os.environ["MLFLOW_TRACKING_USERNAME"] = os.getenv("DAGSHUB_USERNAME")
+    os.environ["MLFLOW_TRACKING_PASSWORD"] = os.getenv("DAGSHUB_TOKEN")
+    mlflow.set_tracking_uri(f"https://dagshub.com/{os.getenv('DAGSHUB_USERNAME')}/{os.getenv('DAGSHUB_REPO')}.mlflow")
+    mlflow.set_experiment("citibike_trip_prediction_lag28")
+
+    # ---------------------------
+    # Step 2: Connect to the feature store & load lagged data
+    # ---------------------------
+    with stage("read_lag_features") as s:
+        store = get_feature_store()
+        project = store.project
+        df = read_training_features(store, TrainingDataCache())
+        s.rows = len(df)
+    memory_report("training/lag_features", df)
+
+    if mode == "incremental":
+        train_incremental(df, project, strategy, incremental_rounds, max_mae_increase, max_boost_rounds,
+                          n_workers, threads_per_worker, max_updates_since_full)
+    else:
+        train_full(df, project, strategy, n_workers, threads_per_worker)
+
+    if direct_horizon:
+        with stage(f"train_direct_h{direct_horizon}") as s:
+            train_direct_horizons(df, project, direct_horizon)
+            s.rows = len(df)
+
+
+def cli(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Train the lag-28 LightGBM model(s)")
+    add_strategy_argument(parser, default="per_station")
+    parser.add_argument("--workers", type=int, default=None, help="training processes for per_station")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="LightGBM threads per process")
+    parser.add_argument("--direct-horizon", type=int, default=0,
+                        help="also train direct multi-horizon models for hours 1..N (0 to skip)")
+    parser.add_argument(
+        "--mode",
+        choices=TRAINING_MODES,
+        default=os.getenv("TRAINING_MODE") or "full",
+        help="full: refit on the whole history; incremental: continue boosting the current "
+             "version on new hours only, with a full retrain as fallback"
+    )
+    parser.add_argument("--incremental-rounds", type=int, default=INCREMENTAL_ROUNDS,
+                        help="trees added per incremental update")
+    parser.add_argument("--max-mae-increase", type=float, default=MAX_MAE_INCREASE,
+                        help="retrain fully when validation MAE exceeds the last full retrain's by this fraction")
+    parser.add_argument("--max-boost-rounds", type=int, default=MAX_BOOST_ROUNDS,
+                        help="retrain fully once a model would have more trees than this")
+    parser.add_argument("--max-updates-since-full", type=int, default=MAX_UPDATES_SINCE_FULL,
+                        help="retrain fully after this many incremental updates in a row")
+    args = parser.parse_args(argv)
+    main(args.strategy, args.workers, args.threads_per_worker, args.direct_horizon, args.mode,
+         args.incremental_rounds, args.max_mae_increase, args.max_boost_rounds, args.max_updates_since_full)
 
 
-model_registry_entry.save("models/best_model.pkl")
-print("Model saved to Hopsworks Model Registry as 'citibike_lag28_lightgbm'")
\ No newline at end of file
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,188 @@
+# File: src/serving/lag_buffer.py
+
+import numpy as np
+import pandas as pd
+
+ONE_HOUR = np.timedelta64(1, "h")
+
+
+def hour_number(ts):
+    """
+    Whole hours since the epoch for a timestamp (naive timestamps are taken
+    as UTC). Integers are already hour numbers and are returned unchanged.
+    """
+    if isinstance(ts, (int, np.integer)):
+        return int(ts)
+    ts = pd.Timestamp(ts)
+    if ts.tz is not None:
+        ts = ts.tz_convert(None)
+    return int(np.datetime64(ts.floor("h"), "h").astype(np.int64))
+
+
+class StationLagBuffer:
+    """
+    Fixed-size ring buffer of the last `history` hourly counts for every
+    station (by default exactly `n_lags`).
+
+    All stations share one hourly clock. Hour `h` lives in column
+    `h % history`, so advancing the clock only zeroes the columns of the
+    skipped hours and writes the new counts; nothing is shifted. Stations
+    missing from an hourly update had no trips that hour and read as 0.
+    Keeping more history than `n_lags` allows lag rows for recent past hours
+    to be rebuilt after a late correction.
+    """
+
+    def __init__(self, n_lags=28, capacity=64, dtype=np.float32, history=None):
+        self.n_lags = n_lags
+        self.history = max(history or n_lags, n_lags)
+        self.values = np.zeros((capacity, self.history), dtype=dtype)
+        self.index = {}
+        self.current_hour = None
+
+    # -------------------------------
+    # Station rows
+    # -------------------------------
+    @property
+    def stations(self):
+        return list(self.index)
+
+    def add_stations(self, stations):
+        """Register stations (all-zero history) so they appear in every later hourly update."""
+        self._rows(list(stations))
+
+    def _rows(self, stations, create=True):
+        rows = np.empty(len(stations), dtype=np.int64)
+        for i, station in enumerate(stations):
+            row = self.index.get(station)
+            if row is None:
+                if not create:
+                    rows[i] = -1
+                    continue
+                row = len(self.index)
+                if row >= len(self.values):
+                    grown = np.zeros((2 * len(self.values), self.history), dtype=self.values.dtype)
+                    grown[:len(self.values)] = self.values
+                    self.values = grown
+                self.index[station] = row
+            rows[i] = row
+        return rows
+
+    # -------------------------------
+    # Updates
+    # -------------------------------
+    def push_hour(self, hour, counts):
+        """
+        Record the finished counts for `hour` ({station: count} or a Series).
+        A newer hour advances the clock for every station; an hour still inside
+        the window overwrites that hour's counts (late correction); older hours
+        are ignored. Returns False if the update was too old to apply.
+        """
+        h = hour_number(hour)
+        counts = pd.Series(counts, dtype="float64")
+        rows = self._rows(list(counts.index))
+        n_active = len(self.index)
+
+        if self.current_hour is None:
+            self.current_hour = h
+        elif h > self.current_hour:
+            skipped = np.arange(self.current_hour + 1, min(h, self.current_hour + self.history) + 1)
+            self.values[:n_active, skipped % self.history] = 0
+            self.current_hour = h
+        elif h <= self.current_hour - self.history:
+            return False
+
+        self.values[rows, h % self.history] = counts.to_numpy()
+        return True
+
+    def increment(self, station, hour, amount=1):
+        """Add to one station's count for an hour still inside the window (late event)."""
+        h = hour_number(hour)
+        if self.current_hour is None or h > self.current_hour or h <= self.current_hour - self.history:
+            return False
+        row = self._rows([station])[0]
+        self.values[row, h % self.history] += amount
+        return True
+
+    def load_frame(self, df, station_col="start_station_name", time_col="datetime", target_col="trip_count"):
+        """Warm-start from long-format hourly counts; only the last `history` hours are kept."""
+        hours = pd.to_datetime(df[time_col])
+        if hours.dt.tz is not None:
+            hours = hours.dt.tz_convert(None)
+        h = hours.dt.floor("h").to_numpy().astype("datetime64[h]").astype(np.int64)
+        if len(h) == 0:
+            return
+
+        newest = int(h.max())
+        if self.current_hour is not None and self.current_hour > newest:
+            newest = self.current_hour
+        recent = h > newest - self.history
+        rows = self._rows(list(df.loc[recent, station_col]))
+
+        # Hours inside the new window that were never written read as 0
+        if self.current_hour is None or newest >= self.current_hour + self.history:
+            self.values[:len(self.index)] = 0
+        elif newest > self.current_hour:
+            skipped = np.arange(self.current_hour + 1, newest + 1)
+            self.values[:len(self.index), skipped % self.history] = 0
+        self.current_hour = newest
+        self.values[rows, h[recent] % self.history] = df.loc[recent, target_col].to_numpy()
+
+    # -------------------------------
+    # Reads
+    # -------------------------------
+    def target_hour(self):
+        """The hour the current buffer predicts: one after the last recorded hour."""
+        if self.current_hour is None:
+            return None
+        return pd.Timestamp(np.datetime64(self.current_hour + 1, "h"))
+
+    def _target(self, target_hour):
+        if target_hour is None:
+            return self.current_hour + 1
+        return hour_number(target_hour)
+
+    def counts_at(self, hour, stations=None):
+        """Counts for one hour inside the window (0 for unknown stations or future hours)."""
+        stations = self.stations if stations is None else list(stations)
+        h = self._target(hour)
+        out = np.zeros(len(stations), dtype=self.values.dtype)
+        if self.current_hour is None or h > self.current_hour:
+            return out
+        if h <= self.current_hour - self.history:
+            raise ValueError(f"Hour {hour} is older than the buffer's {self.history}h history")
+        rows = self._rows(stations, create=False)
+        known = rows >= 0
+        out[known] = self.values[rows[known], h % self.history]
+        return out
+
+    def lag_matrix(self, stations=None, target_hour=None):
+        """
+        (stations x n_lags) matrix with column k-1 holding lag_k relative to
+        `target_hour` (default `target_hour()`). Hours after the last recorded
+        one read as 0; unknown stations raise KeyError rather than getting
+        all-zero lags that look like a quiet station.
+        """
+        stations = self.stations if stations is None else list(stations)
+        unknown = [s for s in stations if s not in self.index]
+        if unknown:
+            raise KeyError(f"Unknown stations: {unknown}")
+        out = np.zeros((len(stations), self.n_lags), dtype=self.values.dtype)
+        if self.current_hour is None:
+            return out
+
+        target = self._target(target_hour)
+        hours = target - np.arange(1, self.n_lags + 1)
+        if hours.min() <= self.current_hour - self.history:
+            raise ValueError(f"Lags for {target_hour} reach past the buffer's {self.history}h history")
+        recorded = hours <= self.current_hour
+        rows = self._rows(stations, create=False)
+        cols = hours[recorded] % self.history
+        out[:, recorded] = self.values[rows[:, None], cols[None, :]]
+        return out
+
+    def lag_frame(self, stations=None, target_hour=None, station_col="start_station_name"):
+        stations = self.stations if stations is None else list(stations)
+        frame = pd.DataFrame(self.lag_matrix(stations, target_hour),
+                             columns=[f"lag_{k}" for k in range(1, self.n_lags + 1)])
+        frame.insert(0, station_col, stations)
+        return frame
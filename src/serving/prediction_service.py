@@ -0,0 +1,163 @@
+# File: src/serving/prediction_service.py
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from src.common.count_store import HourlyCountStore, count_store_root
+from src.modeling.multi_station import LAG_FEATURES, load_predictor
+from src.serving.lag_buffer import StationLagBuffer
+
+
+# -----------------------------------
+# 1. In-process prediction service
+# -----------------------------------
+class PredictionService:
+    """
+    Resident predictor: the model is loaded once and per-station lag windows
+    live in a `StationLagBuffer`, so a prediction for any set of stations is
+    one matrix gather plus one `predict` call.
+    """
+
+    def __init__(self, predict, n_lags=len(LAG_FEATURES)):
+        self.predict_fn = predict
+        self.buffer = StationLagBuffer(n_lags=n_lags)
+        self._lock = threading.Lock()
+
+    def warm_start(self, df):
+        """Fill the buffers from long-format hourly counts (citibike_hourly_trips shape)."""
+        with self._lock:
+            self.buffer.load_frame(df)
+        print(f"Warm-started {len(self.buffer.stations)} stations up to {self.buffer.target_hour()}")
+
+    def observe(self, hour, counts):
+        """Record finished hourly counts ({station: count}); returns False if too old to apply."""
+        with self._lock:
+            return self.buffer.push_hour(hour, counts)
+
+    def predict(self, stations=None):
+        """Next-hour predictions for `stations` (default: every known station); KeyError for unknown ones."""
+        with self._lock:
+            features = self.buffer.lag_frame(stations)
+            target_hour = self.buffer.target_hour()
+        features["prediction"] = self.predict_fn(features) if len(features) else []
+        features["datetime"] = target_hour
+        return features[["start_station_name", "datetime", "prediction"]]
+
+
+# -----------------------------------
+# 2. Warm-start sources
+# -----------------------------------
+def load_hourly_snapshot(path, n_lags=len(LAG_FEATURES)):
+    """Last `n_lags` hours from a local Parquet snapshot of citibike_hourly_trips."""
+    df = pd.read_parquet(path, columns=["start_station_name", "datetime", "trip_count"])
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    return df[df['datetime'] > df['datetime'].max() - pd.Timedelta(hours=n_lags)]
+
+
+def load_hourly_from_hopsworks(store, n_lags=len(LAG_FEATURES), lookback_hours=24 * 7):
+    """Recent hours from citibike_hourly_trips; the buffer keeps only the last `n_lags`."""
+    since = pd.Timestamp(datetime.utcnow()).floor("h") - pd.Timedelta(hours=lookback_hours + n_lags)
+    df = store.read("citibike_hourly_trips", filters=[("datetime", ">=", since)])
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    return df
+
+
+def load_hourly_from_count_store(root, n_lags=len(LAG_FEATURES)):
+    """Last `n_lags` hours from the local memory-mapped count store (no network)."""
+    return HourlyCountStore(root).recent_frame(n_lags)
+
+
+# -----------------------------------
+# 3. HTTP front end
+# -----------------------------------
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"stations": len(service.buffer.stations),
+                                 "target_hour": service.buffer.target_hour()})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                payload = self._body()
+                if self.path == "/predict":
+                    start = time.perf_counter()
+                    preds = service.predict(payload.get("stations"))
+                    self._send(200, {
+                        "target_hour": service.buffer.target_hour(),
+                        "predictions": dict(zip(preds["start_station_name"], preds["prediction"].astype(float))),
+                        "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+                    })
+                elif self.path == "/observe":
+                    applied = service.observe(payload["hour"], payload["counts"])
+                    self._send(200, {"applied": applied, "target_hour": service.buffer.target_hour()})
+                else:
+                    self._send(404, {"error": "not found"})
+            except (KeyError, ValueError) as e:
+                # Unknown stations land here too: a 400 rather than predictions from all-zero lags
+                self._send(400, {"error": str(e.args[0]) if e.args else str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(service, host="0.0.0.0", port=8080):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Prediction service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(snapshot=None, host="0.0.0.0", port=8080):
+    project = None
+    store = None
+    counts_root = None if snapshot else count_store_root()
+    if not snapshot:
+        from src.common.feature_store import get_feature_store
+        store = get_feature_store()
+        project = store.project
+
+    service = PredictionService(load_predictor(project))
+    if snapshot:
+        service.warm_start(load_hourly_snapshot(snapshot))
+    elif counts_root:
+        service.warm_start(load_hourly_from_count_store(counts_root))
+    else:
+        service.warm_start(load_hourly_from_hopsworks(store))
+    serve(service, host, port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident next-hour prediction service")
+    parser.add_argument("--snapshot", default=None,
+                        help="warm-start from a local Parquet snapshot of citibike_hourly_trips (offline)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    main(args.snapshot, args.host, args.port)
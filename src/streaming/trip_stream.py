@@ -0,0 +1,337 @@
+# File: src/streaming/trip_stream.py
+
+import argparse
+import json
+import os
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from src.common.feature_view import lag_feature_mode
+from src.modeling.multi_station import LAG_FEATURES
+from src.serving.lag_buffer import StationLagBuffer, hour_number
+
+TOPIC = "citibike_trip_starts"
+HOUR_NS = 3600 * 10**9
+
+
+def hour_timestamp(h):
+    return pd.Timestamp(np.datetime64(int(h), "h"))
+
+
+# -----------------------------------
+# 1. Tumbling hourly windows -> hourly counts and lag rows
+# -----------------------------------
+class TripStreamProcessor:
+    """
+    Turns trip-start events into finished hourly counts per station and the
+    matching lag-feature rows.
+
+    Events are counted in tumbling one-hour windows. The watermark trails the
+    newest event time by `allowed_lateness`; a window is finished once the
+    watermark passes its end, also when it saw no trips. Events that arrive
+    after their hour was emitted are applied as corrections if the hour is
+    within `correction_hours`, which re-emits that hour and the lag rows
+    that depend on it. Older events are dropped and counted in `late_dropped`.
+    Events stamped more than `max_future_skew` past `clock()` (wall-clock
+    time) are dropped and counted in `future_dropped`: one corrupt timestamp
+    would otherwise move the watermark years ahead.
+    """
+
+    def __init__(self, n_lags=len(LAG_FEATURES), allowed_lateness=pd.Timedelta(minutes=15),
+                 correction_hours=24, buffer=None, max_future_skew=pd.Timedelta(hours=1), clock=None):
+        self.n_lags = n_lags
+        self.allowed_lateness_ns = pd.Timedelta(allowed_lateness).value
+        self.correction_hours = correction_hours
+        self.max_future_skew_ns = pd.Timedelta(max_future_skew).value
+        self.clock = clock or (lambda: pd.Timestamp.utcnow().tz_localize(None))
+        self.buffer = buffer or StationLagBuffer(n_lags=n_lags, history=n_lags + correction_hours)
+        self.open_windows = defaultdict(Counter)
+        self.corrected_hours = set()
+        self.max_event_ns = None
+        self.late_dropped = 0
+        self.future_dropped = 0
+
+    def warm_start(self, df):
+        """Load recent citibike_hourly_trips rows so the first lag rows have full history."""
+        self.buffer.load_frame(df)
+
+    @property
+    def watermark_ns(self):
+        if self.max_event_ns is None:
+            return None
+        return self.max_event_ns - self.allowed_lateness_ns
+
+    def process(self, station, started_at):
+        """Add one trip-start event; returns the event's hour number, or None if it was dropped as future."""
+        ts = pd.Timestamp(started_at)
+        if ts.tz is not None:
+            ts = ts.tz_convert(None)
+        if ts.value > pd.Timestamp(self.clock()).value + self.max_future_skew_ns:
+            self.future_dropped += 1
+            return None
+        h = hour_number(ts)
+        self.max_event_ns = ts.value if self.max_event_ns is None else max(self.max_event_ns, ts.value)
+
+        emitted_up_to = self.buffer.current_hour
+        if emitted_up_to is not None and h <= emitted_up_to:
+            if h > emitted_up_to - self.correction_hours and self.buffer.increment(station, h):
+                self.corrected_hours.add(h)
+            else:
+                self.late_dropped += 1
+        else:
+            self.open_windows[h][station] += 1
+        return h
+
+    def _lag_rows(self, hour, stations):
+        lags = self.buffer.lag_frame(stations, target_hour=hour)
+        lags.insert(1, "datetime", hour_timestamp(hour))
+        lags.insert(2, "trip_count", self.buffer.counts_at(hour, stations).astype("int64"))
+        return lags
+
+    def _hourly_rows(self, hour, stations):
+        counts = self.buffer.counts_at(hour, stations).astype("int64")
+        rows = pd.DataFrame({"start_station_name": stations, "datetime": hour_timestamp(hour), "trip_count": counts})
+        return rows[rows["trip_count"] > 0]
+
+    def advance(self, flush=False):
+        """
+        Emit every window the watermark has passed (all open windows when
+        `flush` is set) plus pending corrections. Returns
+        (hourly_rows, lag_rows) shaped like citibike_hourly_trips and
+        citibike_lag_features.
+        """
+        watermark = self.watermark_ns
+        finished = sorted(
+            h for h in self.open_windows
+            if flush or (watermark is not None and (h + 1) * HOUR_NS <= watermark)
+        )
+
+        hourly, lagged, emitted = [], [], set()
+        current = self.buffer.current_hour
+        for h in [h for h in finished if current is not None and h <= current]:
+            # Window reopened by a late event for an hour already emitted
+            for station, n in self.open_windows.pop(h).items():
+                if self.buffer.increment(station, h, n):
+                    self.corrected_hours.add(h)
+                else:
+                    self.late_dropped += n
+
+        # Every hour the watermark has passed is emitted, also hours with no trips at all
+        new_hours = [h for h in finished if current is None or h > current]
+        if watermark is not None and (current is not None or new_hours):
+            new_hours.append(watermark // HOUR_NS - 1)
+        first = current + 1 if current is not None else min(new_hours, default=0)
+        for h in range(first, max(new_hours, default=first - 1) + 1):
+            counts = self.open_windows.pop(h, Counter())
+            self.buffer.add_stations(counts)
+            stations = self.buffer.stations
+            self.buffer.push_hour(h, dict(counts))
+            hourly.append(self._hourly_rows(h, stations))
+            lagged.append(self._lag_rows(h, stations))
+            emitted.add(h)
+
+        # Corrections: re-emit the hour and every lag row that includes it
+        current = self.buffer.current_hour
+        for h in sorted(self.corrected_hours):
+            stations = self.buffer.stations
+            hourly.append(self._hourly_rows(h, stations))
+            for target in range(h, min(h + self.n_lags, current) + 1):
+                if target not in emitted:
+                    lagged.append(self._lag_rows(target, stations))
+        self.corrected_hours.clear()
+
+        hourly_df = pd.concat(hourly, ignore_index=True) if hourly else pd.DataFrame(
+            columns=["start_station_name", "datetime", "trip_count"])
+        lag_df = pd.concat(lagged, ignore_index=True) if lagged else pd.DataFrame(
+            columns=["start_station_name", "datetime", "trip_count"] + LAG_FEATURES[:self.n_lags])
+        if not lag_df.empty:
+            lag_df = lag_df.drop_duplicates(["start_station_name", "datetime"], keep="last")
+        return hourly_df, lag_df
+
+    def open_hours(self):
+        return sorted(self.open_windows)
+
+
+# -----------------------------------
+# 2. Feature-group sink (batched, non-blocking)
+# -----------------------------------
+class FeatureGroupSink:
+    """Writes finished hours and lag rows to the feature store without waiting on materialization jobs."""
+
+    def __init__(self, store, wait_for_job=False):
+        self.fg_hourly = store.get("citibike_hourly_trips")
+        # In view mode lags are derived on read, so only the hourly rows are stored
+        self.fg_lag = store.get("citibike_lag_features") if lag_feature_mode() == "materialized" else None
+        self.fg_watermarks = store.get("citibike_lag_watermarks")
+        self.wait = wait_for_job
+
+    def write(self, hourly_df, lag_df):
+        if self.fg_lag is None:
+            lag_df = lag_df.iloc[0:0]
+        if not hourly_df.empty:
+            self.fg_hourly.insert(hourly_df, wait=self.wait)
+        if not lag_df.empty:
+            self.fg_lag.insert(lag_df, wait=self.wait)
+        # Watermarks follow the lag rows, or the hourly rows when lags are not stored
+        written = lag_df if self.fg_lag is not None else hourly_df
+        if not written.empty:
+            wm = written.groupby("start_station_name", as_index=False, observed=True)["datetime"].max()
+            wm = wm.rename(columns={"datetime": "watermark"})
+            wm["updated_at"] = pd.Timestamp.utcnow().tz_localize(None)
+            self.fg_watermarks.insert(wm, wait=self.wait)
+        print(f"Wrote {len(hourly_df)} hourly rows and {len(lag_df)} lag rows")
+
+
+# -----------------------------------
+# 3. Consumer loop with batched commits
+# -----------------------------------
+def parse_event(value):
+    event = json.loads(value)
+    return event["start_station_name"], event["started_at"]
+
+
+class OffsetTracker:
+    """
+    Commit positions that never skip an event still sitting in an open
+    window: per partition, the smallest offset of any unemitted hour, or
+    the next offset if everything consumed has been emitted.
+    """
+
+    def __init__(self):
+        self.next_offset = {}
+        self.open_min = defaultdict(dict)
+
+    def record(self, topic, partition, offset, hour):
+        """`hour` is None for events that were dropped: they never hold back the commit."""
+        key = (topic, partition)
+        self.next_offset[key] = offset + 1
+        if hour is not None:
+            self.open_min[key].setdefault(hour, offset)
+
+    def positions(self, open_hours):
+        open_hours = set(open_hours)
+        positions = {}
+        for key, nxt in self.next_offset.items():
+            hours = self.open_min[key]
+            for h in [h for h in hours if h not in open_hours]:
+                del hours[h]
+            positions[key] = min(hours.values()) if hours else nxt
+        return positions
+
+
+def run_stream(consumer, processor, sink, batch_size=500, flush_interval_s=30.0, max_batches=None,
+               commit=None):
+    """
+    Poll `consumer` in batches, fold events into `processor`, and every
+    `flush_interval_s` emit finished hours to `sink` and commit offsets.
+    `consumer` only needs `consume(num_messages, timeout)`; `commit(positions)`
+    defaults to a confluent-kafka offset commit, so tests can pass mocks.
+    """
+    tracker = OffsetTracker()
+    commit = commit or (lambda positions: commit_offsets(consumer, positions))
+    last_flush = time.monotonic()
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            messages = consumer.consume(num_messages=batch_size, timeout=1.0)
+            batches += 1
+            for msg in messages:
+                if msg.error():
+                    print(f"Consumer error: {msg.error()}")
+                    continue
+                try:
+                    station, started_at = parse_event(msg.value())
+                except (ValueError, KeyError) as e:
+                    print(f"Skipping malformed event at offset {msg.offset()}: {e}")
+                    continue
+                h = processor.process(station, started_at)
+                tracker.record(msg.topic(), msg.partition(), msg.offset(), h)
+
+            if time.monotonic() - last_flush >= flush_interval_s:
+                flush(processor, sink, tracker, commit)
+                last_flush = time.monotonic()
+    finally:
+        flush(processor, sink, tracker, commit)
+
+
+def flush(processor, sink, tracker, commit):
+    hourly_df, lag_df = processor.advance()
+    if not hourly_df.empty or not lag_df.empty:
+        sink.write(hourly_df, lag_df)
+    positions = tracker.positions(processor.open_hours())
+    if positions:
+        commit(positions)
+    if processor.late_dropped:
+        print(f"Dropped {processor.late_dropped} events older than the correction window so far")
+    if processor.future_dropped:
+        print(f"Dropped {processor.future_dropped} events stamped too far in the future so far")
+
+
+def commit_offsets(consumer, positions):
+    from confluent_kafka import TopicPartition
+    consumer.commit(offsets=[TopicPartition(topic, partition, offset)
+                             for (topic, partition), offset in positions.items()],
+                    asynchronous=False)
+
+
+def make_consumer(topic=TOPIC, group_id="citibike-hourly-features"):
+    from confluent_kafka import Consumer
+    config = {
+        "bootstrap.servers": os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+        "group.id": os.getenv("KAFKA_GROUP_ID", group_id),
+        "enable.auto.commit": False,
+        "auto.offset.reset": "earliest",
+    }
+    if os.getenv("KAFKA_SASL_USERNAME"):
+        config.update({
+            "security.protocol": "SASL_SSL",
+            "sasl.mechanisms": "PLAIN",
+            "sasl.username": os.getenv("KAFKA_SASL_USERNAME"),
+            "sasl.password": os.getenv("KAFKA_SASL_PASSWORD"),
+        })
+    consumer = Consumer(config)
+    consumer.subscribe([topic])
+    return consumer
+
+
+def main(topic=TOPIC, allowed_lateness_min=15, correction_hours=24, flush_interval_s=30.0, batch_size=500,
+         max_future_skew_min=60):
+    from src.common.feature_store import get_feature_store
+    from src.serving.prediction_service import load_hourly_from_hopsworks
+
+    load_dotenv()
+    store = get_feature_store()
+
+    processor = TripStreamProcessor(allowed_lateness=pd.Timedelta(minutes=allowed_lateness_min),
+                                    correction_hours=correction_hours,
+                                    max_future_skew=pd.Timedelta(minutes=max_future_skew_min))
+    processor.warm_start(load_hourly_from_hopsworks(store, n_lags=processor.buffer.history))
+
+    consumer = make_consumer(topic)
+    try:
+        run_stream(consumer, processor, FeatureGroupSink(store), batch_size=batch_size,
+                   flush_interval_s=flush_interval_s)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        consumer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream trip-start events into hourly counts and lag features")
+    parser.add_argument("--topic", default=os.getenv("KAFKA_TOPIC", TOPIC))
+    parser.add_argument("--allowed-lateness-min", type=int, default=15,
+                        help="how long after an hour ends to wait for its events")
+    parser.add_argument("--correction-hours", type=int, default=24,
+                        help="late events up to this many hours old update already emitted rows")
+    parser.add_argument("--max-future-skew-min", type=int, default=60,
+                        help="drop events stamped more than this many minutes past the current time")
+    parser.add_argument("--flush-interval", type=float, default=30.0, help="seconds between writes and commits")
+    parser.add_argument("--batch-size", type=int, default=500, help="messages per consume() call")
+    args = parser.parse_args()
+    main(args.topic, args.allowed_lateness_min, args.correction_hours, args.flush_interval, args.batch_size,
+         args.max_future_skew_min)
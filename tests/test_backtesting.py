@@ -0,0 +1,23 @@
+import unittest
+
+from src.modeling.backtesting import rolling_origin_folds
+
+
+class RollingOriginFoldsTest(unittest.TestCase):
+    def test_folds_step_back_from_the_newest_hour(self):
+        folds = rolling_origin_folds(0, 999, n_folds=3, test_hours=100, min_train_hours=200)
+        self.assertEqual(folds, [(700, 800), (800, 900), (900, 1000)])
+
+    def test_step_can_differ_from_the_test_window(self):
+        folds = rolling_origin_folds(0, 999, n_folds=3, test_hours=100, step_hours=24, min_train_hours=200)
+        self.assertEqual(folds, [(852, 952), (876, 976), (900, 1000)])
+
+    def test_folds_stop_at_the_minimum_training_history(self):
+        folds = rolling_origin_folds(500, 999, n_folds=10, test_hours=100, min_train_hours=200)
+        # Origins at 900, 800 and 700 leave 400, 300 and 200 training hours
+        self.assertEqual([train_end for train_end, _ in folds], [700, 800, 900])
+        self.assertEqual(rolling_origin_folds(900, 999, test_hours=100, min_train_hours=200), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
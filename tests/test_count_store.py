@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.common import count_store
+from src.common.count_store import HourlyCountStore
+from src.modeling.utils import create_lag_features
+
+N_LAGS = 28
+LAG_COLUMNS = [f"lag_{k}" for k in range(1, N_LAGS + 1)]
+START = pd.Timestamp("2025-01-01")
+
+
+def hourly(stations, hours, start=START, seed=3):
+    """Sparse long-format counts: hours without trips have no row."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=hours, freq="h")
+    df = pd.DataFrame({
+        "start_station_name": np.repeat(stations, hours),
+        "datetime": np.tile(times, len(stations)),
+        "trip_count": rng.poisson(1.5, len(stations) * hours),
+    })
+    return df[df["trip_count"] > 0].reset_index(drop=True)
+
+
+def as_table(df):
+    df = df[["start_station_name", "datetime", "trip_count"] + LAG_COLUMNS].copy()
+    df["start_station_name"] = df["start_station_name"].astype(str)
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    df["trip_count"] = df["trip_count"].astype("int64")
+    df[LAG_COLUMNS] = df[LAG_COLUMNS].astype("float64")
+    return df.sort_values(["start_station_name", "datetime"]).reset_index(drop=True)
+
+
+class CountStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_writes_counts_and_upserts(self):
+        store = HourlyCountStore.create(self.root)
+        df = hourly(["A", "B"], 48)
+        self.assertEqual(store.append(df), len(df))
+        self.assertEqual(store.n_hours, 48)
+        self.assertEqual(int(store.matrix().sum()), int(df["trip_count"].sum()))
+
+        # Rewriting an hour overwrites it; hours without rows read as 0
+        store.append(pd.DataFrame({"start_station_name": ["A"], "datetime": [START + pd.Timedelta(hours=60)],
+                                   "trip_count": [7]}))
+        store.append(pd.DataFrame({"start_station_name": ["A"], "datetime": [START + pd.Timedelta(hours=60)],
+                                   "trip_count": [2]}))
+        series = HourlyCountStore(self.root).series("A", START + pd.Timedelta(hours=48))
+        self.assertEqual(series.tolist(), [0] * 12 + [2])
+
+    def test_station_relayout_switches_file_with_meta(self):
+        store = HourlyCountStore.create(self.root, start=START, station_capacity=4)
+        first = hourly(["A", "B", "C"], 24)
+        store.append(first)
+        reader = HourlyCountStore(self.root)
+        before = reader.matrix().copy()
+
+        many = hourly([f"S{i:03d}" for i in range(count_store.STATION_CHUNK + 2)], 24, seed=5)
+        store.append(many)
+        self.assertEqual(sorted(os.listdir(self.root)), ["counts.1.bin", "meta.json"])
+        # A reader that has not refreshed keeps its own mapping of the old data
+        np.testing.assert_array_equal(reader.matrix(), before)
+
+        reader.refresh()
+        self.assertGreater(reader.meta["station_capacity"], 4)
+        np.testing.assert_array_equal(reader.matrix()[:, :3], before)
+        self.assertEqual(int(reader.matrix().sum()), int(first["trip_count"].sum() + many["trip_count"].sum()))
+
+    def test_lag_rows_match_create_lag_features(self):
+        df = hourly(["A", "B", "C"], 24 * 4)
+        # C starts two days late and has no trips in the last 6 hours
+        c = df["start_station_name"] == "C"
+        df = df[~(c & ((df["datetime"] < START + pd.Timedelta(days=2))
+                       | (df["datetime"] >= df["datetime"].max() - pd.Timedelta(hours=5))))]
+        store = HourlyCountStore.create(self.root)
+        store.append(df)
+
+        expected = as_table(create_lag_features(df, lags=range(1, N_LAGS + 1), end=df["datetime"].max()))
+        pd.testing.assert_frame_equal(as_table(store.lag_rows(N_LAGS)), expected)
+        latest = expected.groupby("start_station_name").tail(1).reset_index(drop=True)
+        pd.testing.assert_frame_equal(as_table(store.latest_frame(N_LAGS)), latest)
+
+    def test_empty_and_short_stores_return_no_rows(self):
+        store = HourlyCountStore.create(self.root)
+        self.assertTrue(store.latest_frame(N_LAGS, since=START).empty)
+        self.assertTrue(store.lag_rows(N_LAGS).empty)
+
+        store.append(hourly(["A", "B"], N_LAGS))
+        for frame in (store.latest_frame(N_LAGS, since=START), store.lag_rows(N_LAGS)):
+            self.assertTrue(frame.empty)
+            self.assertEqual(list(frame.columns), ["start_station_name", "datetime", "trip_count"] + LAG_COLUMNS)
+
+
+if __name__ == "__main__":
+    unittest.main()
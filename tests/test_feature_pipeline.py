@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from src.common.feature_store import get_feature_store
+from src.common.feature_view import LagFeatureView
+from src.modeling.utils import create_lag_features
+from src.pipelines import feature_pipeline
+
+LAG_COLUMNS = [f"lag_{k}" for k in feature_pipeline.LAGS]
+
+
+def hourly_trips(days=6, seed=7):
+    """Sparse hourly counts like citibike_hourly_trips: hours without trips have no row."""
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2025-01-01", periods=24 * days, freq="h")
+    frames = []
+    for i, station in enumerate(["A", "B", "C"]):
+        counts = rng.poisson(1.0 + i, len(hours))
+        frames.append(pd.DataFrame({"start_station_name": station, "datetime": hours, "trip_count": counts}))
+    df = pd.concat(frames, ignore_index=True)
+    # C opens a day late and goes quiet for the last 10 hours
+    late = (df["start_station_name"] == "C") & (df["datetime"] < hours[24])
+    quiet = (df["start_station_name"] == "C") & (df["datetime"] > hours[-11])
+    return df[(df["trip_count"] > 0) & ~late & ~quiet].reset_index(drop=True)
+
+
+def as_table(df):
+    df = df[["start_station_name", "datetime", "trip_count"] + LAG_COLUMNS].copy()
+    df["start_station_name"] = df["start_station_name"].astype(str)
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    df["trip_count"] = df["trip_count"].astype("int64")
+    df[LAG_COLUMNS] = df[LAG_COLUMNS].astype("float64")
+    return df.sort_values(["start_station_name", "datetime"]).reset_index(drop=True)
+
+
+class FeaturePipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        env = {"FEATURE_STORE_BACKEND": "local", "FEATURE_STORE_ROOT": self.tmp.name,
+               "LAG_FEATURE_MODE": "materialized", "FEATURE_WRITE_WAIT": ""}
+        self.env = mock.patch.dict(os.environ, env)
+        self.env.start()
+        get_feature_store.cache_clear()
+        self.store = get_feature_store()
+        self.hourly = hourly_trips()
+
+    def tearDown(self):
+        get_feature_store.cache_clear()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def expected(self):
+        return as_table(create_lag_features(self.hourly, lags=feature_pipeline.LAGS,
+                                            end=self.hourly["datetime"].max()))
+
+    def test_incremental_runs_match_a_full_rebuild(self):
+        cuts = pd.date_range("2025-01-03", "2025-01-07", freq="17h").tolist()
+        previous = None
+        for cut in cuts + [self.hourly["datetime"].max() + pd.Timedelta(hours=1)]:
+            times = self.hourly["datetime"]
+            part = self.hourly[(times < cut) & (times >= previous if previous is not None else True)]
+            self.store.insert("citibike_hourly_trips", part)
+            feature_pipeline.main("incremental")
+            previous = cut
+
+        pd.testing.assert_frame_equal(as_table(self.store.read("citibike_lag_features")), self.expected())
+
+    def test_quiet_station_gets_zero_rows_up_to_the_newest_hour(self):
+        self.store.insert("citibike_hourly_trips", self.hourly)
+        feature_pipeline.main("full")
+
+        lagged = as_table(self.store.read("citibike_lag_features"))
+        newest = self.hourly["datetime"].max()
+        quiet = lagged[lagged["start_station_name"] == "C"].set_index("datetime")
+        self.assertEqual(quiet.index.max(), newest)
+        self.assertTrue((quiet.loc[newest - pd.Timedelta(hours=9):, "trip_count"] == 0).all())
+
+        watermarks = self.store.read("citibike_lag_watermarks").set_index("start_station_name")["watermark"]
+        self.assertTrue((pd.to_datetime(watermarks) == newest).all())
+
+    def test_view_latest_uses_the_newest_hour_of_any_station(self):
+        self.store.insert("citibike_hourly_trips", self.hourly)
+        newest = self.hourly["datetime"].max()
+        latest = LagFeatureView(self.store).latest(LAG_COLUMNS, cutoff=newest - pd.Timedelta(hours=28))
+        self.assertEqual(sorted(latest["start_station_name"].astype(str)), ["A", "B", "C"])
+        self.assertTrue((pd.to_datetime(latest["datetime"]) == newest).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
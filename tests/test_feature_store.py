@@ -0,0 +1,85 @@
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src.common.feature_store import LocalFeatureStore
+from src.common.feature_writer import changed_rows
+
+
+def hourly(stations, hours, counts, start="2025-01-01"):
+    times = pd.date_range(start, periods=hours, freq="h")
+    return pd.DataFrame({
+        "start_station_name": [s for s in stations for _ in times],
+        "datetime": list(times) * len(stations),
+        "trip_count": counts,
+    })
+
+
+class LocalFeatureStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = LocalFeatureStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_insert_upserts_on_the_primary_key(self):
+        self.store.insert("citibike_hourly_trips", hourly(["A", "B"], 3, [1, 2, 3, 4, 5, 6]))
+        # Overlapping keys take the newer value; new keys are appended
+        self.store.insert("citibike_hourly_trips", hourly(["B"], 4, [50, 60, 70, 80]))
+
+        df = self.store.read("citibike_hourly_trips").sort_values(["start_station_name", "datetime"])
+        self.assertEqual(len(df), 7)
+        self.assertEqual(df["trip_count"].tolist(), [1, 2, 3, 50, 60, 70, 80])
+        self.assertFalse(df.duplicated(["start_station_name", "datetime"]).any())
+
+    def test_reads_apply_filters_and_columns(self):
+        self.store.insert("citibike_hourly_trips", hourly(["A", "B", "C"], 4, list(range(12))))
+        fg = self.store.get("citibike_hourly_trips")
+
+        df = fg.read(columns=["start_station_name", "trip_count"], filters=[
+            ("start_station_name", "in", ["A", "C"]),
+            ("datetime", ">=", pd.Timestamp("2025-01-01 02:00")),
+        ])
+        self.assertEqual(list(df.columns), ["start_station_name", "trip_count"])
+        self.assertEqual(sorted(df["trip_count"].tolist()), [2, 3, 10, 11])
+
+        one = fg.read(filters=[("start_station_name", "==", "B"), ("datetime", "<", pd.Timestamp("2025-01-01 01:00"))])
+        self.assertEqual(one["trip_count"].tolist(), [4])
+
+    def test_missing_group_reads_empty_and_versions_change_on_insert(self):
+        fg = self.store.get("citibike_hourly_trips")
+        self.assertTrue(fg.read().empty)
+        self.assertIsNone(fg.data_version())
+
+        fg.insert(hourly(["A"], 2, [1, 2]))
+        first = fg.data_version()
+        fg.insert(hourly(["A"], 3, [1, 2, 3]))
+        self.assertNotEqual(fg.data_version(), first)
+
+
+class ChangedRowsTest(unittest.TestCase):
+    def test_only_new_and_changed_rows_are_written(self):
+        with tempfile.TemporaryDirectory() as root:
+            fg = LocalFeatureStore(root).get("citibike_hourly_trips")
+            fg.insert(hourly(["A", "B"], 3, [1, 2, 3, 4, 5, 6]))
+
+            incoming = hourly(["A", "B"], 4, [1, 2, 9, 7, 4, 5, 6, 8])
+            changed = changed_rows(fg, incoming, compare=["trip_count"])
+            self.assertEqual(
+                list(zip(changed["start_station_name"], changed["datetime"].dt.hour, changed["trip_count"])),
+                [("A", 2, 9), ("A", 3, 7), ("B", 3, 8)])
+
+            # Without compare columns, only keys not stored yet count as changed
+            self.assertEqual(len(changed_rows(fg, incoming)), 2)
+
+    def test_empty_group_takes_every_row(self):
+        with tempfile.TemporaryDirectory() as root:
+            fg = LocalFeatureStore(root).get("citibike_hourly_trips")
+            incoming = hourly(["A"], 3, [1, 2, 3])
+            self.assertEqual(len(changed_rows(fg, incoming, compare=["trip_count"])), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
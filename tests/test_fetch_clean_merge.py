@@ -0,0 +1,92 @@
+import functools
+import io
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import pandas as pd
+
+from src.data_engineering import fetch_clean_merge
+from src.data_engineering.tripdata_cache import TripdataCache
+
+
+def month_archive(yyyymm, trips_per_station):
+    """A monthly tripdata zip with `trips_per_station` {station: n} trips in the month's first hours."""
+    start = pd.Timestamp(f"{yyyymm[:4]}-{yyyymm[4:]}-01 08:00")
+    rows = []
+    for station, n in trips_per_station.items():
+        for i in range(n):
+            began = start + pd.Timedelta(minutes=13 * i)
+            rows.append({"ride_id": f"{station}{i}", "started_at": began,
+                         "ended_at": began + pd.Timedelta(minutes=9),
+                         "start_station_name": station, "end_station_name": "Z"})
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr(f"{yyyymm}-citibike-tripdata.csv", pd.DataFrame(rows).to_csv(index=False))
+    return buf.getvalue()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class FetchCleanMergeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        served = os.path.join(self.tmp.name, "served")
+        os.makedirs(served)
+        self.archives = {
+            # January only under the older *.csv.zip name, February only under the newer *.zip
+            "202401": ("202401-citibike-tripdata.csv.zip", month_archive("202401", {"A": 30, "B": 12, "C": 3})),
+            "202402": ("202402-citibike-tripdata.zip", month_archive("202402", {"A": 5, "B": 20, "C": 1})),
+        }
+        for name, body in self.archives.values():
+            with open(os.path.join(served, name), "wb") as f:
+                f.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                          functools.partial(QuietHandler, directory=served))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.base_url = mock.patch.object(fetch_clean_merge, "BASE_URL", base_url)
+        self.base_url.start()
+        self.cache = TripdataCache(os.path.join(self.tmp.name, "cache"))
+
+    def tearDown(self):
+        self.base_url.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_parallel_download_falls_back_to_the_other_url(self):
+        counts = dict(fetch_clean_merge.ingest_months(
+            ["202401", "202402", "202403"], self.cache, parse_fn=fetch_clean_merge.count_month_stations,
+            download_workers=3, parse_workers=1, use_cleaned=False))
+
+        # March is not served under either name and is skipped
+        self.assertEqual(sorted(counts), ["202401", "202402"])
+        self.assertEqual(counts["202401"].to_dict(), {"A": 30, "B": 12, "C": 3})
+        for yyyymm, (name, body) in self.archives.items():
+            with open(self.cache.archive_path(yyyymm), "rb") as f:
+                self.assertEqual(f.read(), body)
+            self.assertTrue(self.cache.manifest["months"][yyyymm]["url"].endswith(name))
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, "cache", "partial")), [])
+
+    def test_hourly_mode_writes_top_station_counts(self):
+        hourly_file = os.path.join(self.tmp.name, "hourly.parquet")
+        fetch_clean_merge.main_hourly(["202401", "202402"], self.cache, top_n=2, download_workers=2,
+                                      parse_workers=1, hourly_file=hourly_file)
+
+        df = pd.read_parquet(hourly_file)
+        totals = df.groupby("start_station_name", observed=True)["trip_count"].sum().to_dict()
+        self.assertEqual(totals, {"A": 35, "B": 32})
+        self.assertFalse(df.duplicated(["start_station_name", "datetime"]).any())
+
+
+if __name__ == "__main__":
+    unittest.main()
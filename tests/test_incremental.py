@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.modeling.incremental import (
+    boost_rounds,
+    continue_bundle,
+    full_retrain_reason,
+    split_new_hours,
+    training_state
+)
+from src.modeling.multi_station import train_bundle
+from src.modeling.utils import create_lag_features
+
+
+def lagged_trips(stations=("A", "B"), days=20, seed=11):
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range("2025-01-01", periods=24 * days, freq="h")
+    hourly = pd.concat([
+        pd.DataFrame({"start_station_name": s, "datetime": hours,
+                      "trip_count": rng.poisson(2 + np.sin(np.arange(len(hours)) * 2 * np.pi / 24) + i)})
+        for i, s in enumerate(stations)
+    ], ignore_index=True)
+    hourly = hourly[hourly["trip_count"] > 0]
+    return create_lag_features(hourly, lags=range(1, 29), end=hourly["datetime"].max())
+
+
+class SplitNewHoursTest(unittest.TestCase):
+    def test_new_rows_end_where_the_validation_week_starts(self):
+        df = lagged_trips()
+        since = pd.Timestamp("2025-01-10 05:00")
+        new_train, valid = split_new_hours(df, since, valid_hours=24 * 7)
+
+        newest = df["datetime"].max()
+        self.assertEqual(valid["datetime"].min(), newest - pd.Timedelta(hours=24 * 7 - 1))
+        self.assertEqual(valid["datetime"].nunique(), 24 * 7)
+        self.assertEqual(new_train["datetime"].min(), since + pd.Timedelta(hours=1))
+        self.assertEqual(new_train["datetime"].max() + pd.Timedelta(hours=1), valid["datetime"].min())
+        self.assertEqual(len(new_train) + len(valid), int((df["datetime"] > since).sum()))
+
+
+class ContinueBundleTest(unittest.TestCase):
+    def setUp(self):
+        df = lagged_trips()
+        cut = pd.Timestamp("2025-01-15")
+        self.old, self.new = df[df["datetime"] < cut], df[df["datetime"] >= cut]
+
+    def check_continued(self, strategy):
+        bundle = train_bundle(self.old, strategy)
+        before = bundle.predict(self.new)
+        updated = continue_bundle(bundle, self.new, rounds=5)
+
+        self.assertEqual(boost_rounds(updated), boost_rounds(bundle) + 5)
+        # The original bundle is left untouched
+        np.testing.assert_array_equal(bundle.predict(self.new), before)
+        self.assertFalse(np.allclose(updated.predict(self.new), before))
+
+    def test_global_bundle_gains_rounds(self):
+        self.check_continued("global")
+
+    def test_per_station_bundle_gains_rounds(self):
+        self.check_continued("per_station")
+
+    def test_unknown_station_needs_a_full_retrain(self):
+        bundle = train_bundle(self.old, "global")
+        other = self.new.assign(start_station_name="Z")
+        with self.assertRaises(KeyError):
+            continue_bundle(bundle, other, rounds=5)
+        with self.assertRaises(KeyError):
+            continue_bundle(train_bundle(self.old, "per_station"), other, rounds=5)
+
+
+class FullRetrainReasonTest(unittest.TestCase):
+    def setUp(self):
+        self.state = training_state(pd.Timestamp("2025-01-15"), baseline_mae=1.0, boost_rounds=100,
+                                    updates_since_full=2)
+
+    def test_update_is_kept_within_limits(self):
+        self.assertIsNone(full_retrain_reason(self.state, mae=1.1, rounds=150))
+
+    def test_limits_force_a_full_retrain(self):
+        self.assertIn("drifted", full_retrain_reason(self.state, mae=1.3, rounds=150, max_mae_increase=0.2))
+        self.assertIn("boosting rounds", full_retrain_reason(self.state, mae=1.0, rounds=1001, max_boost_rounds=1000))
+        self.assertIn("incremental updates",
+                      full_retrain_reason(self.state, mae=1.0, rounds=150, max_updates_since_full=2))
+        self.assertIsNone(full_retrain_reason(self.state, mae=1.0, rounds=150, max_updates_since_full=3))
+
+
+if __name__ == "__main__":
+    unittest.main()
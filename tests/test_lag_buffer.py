@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.serving.lag_buffer import StationLagBuffer, hour_number
+
+START = hour_number(pd.Timestamp("2025-01-01"))
+
+
+class StationLagBufferTest(unittest.TestCase):
+    def test_ring_wraps_around_without_shifting(self):
+        buffer = StationLagBuffer(n_lags=3, capacity=1)
+        for k in range(7):
+            buffer.push_hour(START + k, {"A": k + 1, "B": 10 * (k + 1)})
+
+        # Seven hours through a three-column ring: only hours 4..6 remain
+        self.assertEqual(buffer.current_hour, START + 6)
+        np.testing.assert_array_equal(buffer.lag_matrix(["A", "B"]), [[7, 6, 5], [70, 60, 50]])
+        self.assertEqual(len(buffer.values), 2)
+
+    def test_gap_hours_read_as_zero(self):
+        buffer = StationLagBuffer(n_lags=3)
+        buffer.push_hour(START, {"A": 1})
+        buffer.push_hour(START + 1, {"A": 2})
+        buffer.push_hour(START + 3, {"A": 4})
+        np.testing.assert_array_equal(buffer.lag_matrix(["A"]), [[4, 0, 2]])
+
+        # A gap longer than the ring clears every column
+        buffer.push_hour(START + 10, {"B": 5})
+        np.testing.assert_array_equal(buffer.lag_matrix(["A", "B"]), [[0, 0, 0], [5, 0, 0]])
+
+    def test_corrections_inside_the_window_only(self):
+        buffer = StationLagBuffer(n_lags=2, history=4)
+        for k in range(6):
+            buffer.push_hour(START + k, {"A": 1})
+
+        self.assertTrue(buffer.push_hour(START + 3, {"A": 9}))
+        self.assertTrue(buffer.increment("A", START + 2, 2))
+        self.assertFalse(buffer.push_hour(START + 1, {"A": 9}))
+        self.assertFalse(buffer.increment("A", START + 1))
+        np.testing.assert_array_equal(buffer.lag_matrix(["A"], target_hour=START + 4), [[9, 3]])
+        with self.assertRaises(ValueError):
+            buffer.lag_matrix(["A"], target_hour=START + 2)
+
+    def test_unknown_station_raises(self):
+        buffer = StationLagBuffer(n_lags=3)
+        buffer.push_hour(START, {"A": 1})
+        with self.assertRaises(KeyError):
+            buffer.lag_matrix(["A", "Z"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import unittest
+
+import pandas as pd
+
+from src.streaming.trip_stream import TOPIC, TripStreamProcessor, run_stream
+
+
+class FakeMessage:
+    def __init__(self, offset, station, started_at, partition=0):
+        self._offset = offset
+        self._partition = partition
+        self._value = json.dumps({"start_station_name": station, "started_at": started_at}).encode()
+
+    def error(self):
+        return None
+
+    def value(self):
+        return self._value
+
+    def topic(self):
+        return TOPIC
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+
+class FakeConsumer:
+    """Returns one scripted batch per consume() call, then nothing."""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def consume(self, num_messages, timeout):
+        return self.batches.pop(0) if self.batches else []
+
+
+class RecordingSink:
+    def __init__(self):
+        self.hourly, self.lags = [], []
+
+    def write(self, hourly_df, lag_df):
+        self.hourly.append(hourly_df)
+        self.lags.append(lag_df)
+
+    def table(self, frames):
+        """Rows as the feature group would hold them: last write per key wins."""
+        df = pd.concat(frames, ignore_index=True)
+        return df.drop_duplicates(["start_station_name", "datetime"], keep="last").set_index(
+            ["start_station_name", "datetime"])
+
+
+class RunStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.processor = TripStreamProcessor(n_lags=3, correction_hours=2)
+        self.sink = RecordingSink()
+        self.commits = []
+        batches = [
+            [FakeMessage(0, "A", "2025-01-01 10:05"), FakeMessage(1, "B", "2025-01-01 10:20")],
+            # Watermark passes 12:00: hour 10 is emitted, hour 11 had no trips
+            [FakeMessage(2, "A", "2025-01-01 12:30")],
+            # A late event for emitted hour 10 and one older than the correction window
+            [FakeMessage(3, "A", "2025-01-01 10:50"), FakeMessage(4, "B", "2025-01-01 05:00")],
+        ]
+        run_stream(FakeConsumer(batches), self.processor, self.sink, flush_interval_s=0,
+                   max_batches=len(batches), commit=self.commits.append)
+        self.lags = self.sink.table(self.sink.lags)
+        self.hourly = self.sink.table(self.sink.hourly)
+
+    def test_hours_without_trips_get_lag_rows(self):
+        hour_11 = pd.Timestamp("2025-01-01 11:00")
+        for station in ["A", "B"]:
+            row = self.lags.loc[(station, hour_11)]
+            self.assertEqual(row["trip_count"], 0)
+        self.assertEqual(self.lags.loc[("B", hour_11), "lag_1"], 1)
+
+    def test_late_event_corrects_emitted_rows(self):
+        hour_10, hour_11 = pd.Timestamp("2025-01-01 10:00"), pd.Timestamp("2025-01-01 11:00")
+        self.assertEqual(self.hourly.loc[("A", hour_10), "trip_count"], 2)
+        self.assertEqual(self.lags.loc[("A", hour_10), "trip_count"], 2)
+        self.assertEqual(self.lags.loc[("A", hour_11), "lag_1"], 2)
+        self.assertEqual(self.processor.late_dropped, 1)
+
+    def test_open_hour_is_not_emitted_or_committed_past(self):
+        hour_12 = pd.Timestamp("2025-01-01 12:00")
+        self.assertNotIn(("A", hour_12), self.lags.index)
+        self.assertEqual(self.processor.open_hours(), [pd.Timestamp(hour_12).value // 3_600_000_000_000])
+        # Offset 2 is the first event of the still-open hour 12
+        self.assertEqual(self.commits[0], {(TOPIC, 0): 0})
+        self.assertEqual(self.commits[-1], {(TOPIC, 0): 2})
+        self.assertTrue(all(p[(TOPIC, 0)] <= 2 for p in self.commits))
+
+
+class FutureEventTest(unittest.TestCase):
+    def test_event_far_past_the_clock_is_dropped(self):
+        processor = TripStreamProcessor(n_lags=3, correction_hours=2,
+                                        clock=lambda: pd.Timestamp("2025-01-01 11:10"))
+        sink, commits = RecordingSink(), []
+        batches = [
+            [FakeMessage(0, "A", "2025-01-01 10:05"), FakeMessage(1, "B", "2031-06-01 08:00")],
+            [FakeMessage(2, "A", "2025-01-01 10:40"), FakeMessage(3, "B", "2025-01-01 11:30")],
+        ]
+        run_stream(FakeConsumer(batches), processor, sink, flush_interval_s=0,
+                   max_batches=len(batches), commit=commits.append)
+
+        self.assertEqual(processor.future_dropped, 1)
+        self.assertEqual(processor.late_dropped, 0)
+        # The watermark follows the real events, so hour 10 is counted and emitted once
+        self.assertEqual(processor.watermark_ns, pd.Timestamp("2025-01-01 11:15").value)
+        hourly = sink.table(sink.hourly)
+        self.assertEqual(hourly.loc[("A", pd.Timestamp("2025-01-01 10:00")), "trip_count"], 2)
+        self.assertEqual(processor.open_hours(), [pd.Timestamp("2025-01-01 11:00").value // 3_600_000_000_000])
+        self.assertEqual(commits[-1], {(TOPIC, 0): 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
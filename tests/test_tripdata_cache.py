@@ -0,0 +1,117 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.data_engineering.tripdata_cache import TripdataCache
+
+CSV_URL = "https://example.test/202401-citibike-tripdata.csv.zip"
+ZIP_URL = "https://example.test/202401-citibike-tripdata.zip"
+ARCHIVE = bytes(range(256)) * 40
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeSession:
+    """Serves ARCHIVE from the URLs in `files` with Range support; everything else is a 404."""
+
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+
+    def get(self, url, stream=True, timeout=None, headers=None):
+        rng = (headers or {}).get("Range")
+        self.requests.append((url, rng))
+        body = self.files.get(url)
+        if body is None:
+            return FakeResponse(404)
+        if rng is None:
+            return FakeResponse(200, body)
+        start = int(rng.split("=")[1].rstrip("-"))
+        if start >= len(body):
+            return FakeResponse(416, headers={"Content-Range": f"bytes */{len(body)}"})
+        return FakeResponse(206, body[start:])
+
+
+class TripdataCacheFetchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = TripdataCache(self.tmp.name)
+        self.partial = Path(self.tmp.name) / "partial" / "202401.zip.part"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def leave_partial(self, url, n_bytes):
+        self.partial.write_bytes((ARCHIVE * 2)[:n_bytes])
+        self.partial.with_suffix(".part.url").write_text(url)
+
+    def test_partial_resumes_from_its_own_url_first(self):
+        self.cache.manifest["preferred_variant"] = ".csv.zip"
+        self.leave_partial(ZIP_URL, 1000)
+        session = FakeSession({CSV_URL: ARCHIVE, ZIP_URL: ARCHIVE})
+
+        path = self.cache.fetch(session, "202401", [CSV_URL, ZIP_URL])
+        self.assertEqual(session.requests, [(ZIP_URL, "bytes=1000-")])
+        self.assertEqual(path.read_bytes(), ARCHIVE)
+
+    def test_partial_kept_until_another_url_answers(self):
+        self.leave_partial(ZIP_URL, 1000)
+        self.assertIsNone(self.cache.fetch(FakeSession({}), "202401", [CSV_URL, ZIP_URL]))
+        self.assertEqual(self.partial.read_bytes(), ARCHIVE[:1000])
+
+        # Only the other variant answers now: its full body replaces the partial
+        path = self.cache.fetch(FakeSession({CSV_URL: ARCHIVE}), "202401", [CSV_URL, ZIP_URL])
+        self.assertEqual(path.read_bytes(), ARCHIVE)
+        self.assertEqual(self.cache.manifest["months"]["202401"]["url"], CSV_URL)
+
+    def test_complete_partial_is_committed_on_416(self):
+        self.leave_partial(CSV_URL, len(ARCHIVE))
+        session = FakeSession({CSV_URL: ARCHIVE})
+
+        path = self.cache.fetch(session, "202401", [CSV_URL, ZIP_URL])
+        self.assertEqual(session.requests, [(CSV_URL, f"bytes={len(ARCHIVE)}-")])
+        self.assertEqual(path.read_bytes(), ARCHIVE)
+        self.assertFalse(self.partial.exists())
+
+    def test_stale_partial_restarts_on_416(self):
+        self.leave_partial(CSV_URL, len(ARCHIVE) + 10)
+        session = FakeSession({CSV_URL: ARCHIVE})
+
+        path = self.cache.fetch(session, "202401", [CSV_URL, ZIP_URL])
+        self.assertEqual(session.requests, [(CSV_URL, f"bytes={len(ARCHIVE) + 10}-"), (CSV_URL, None)])
+        self.assertEqual(path.read_bytes(), ARCHIVE)
+
+
+class TripdataCacheEvictTest(unittest.TestCase):
+    def test_evict_skips_months_in_use(self):
+        with tempfile.TemporaryDirectory() as root:
+            cache = TripdataCache(root)
+            for i, month in enumerate(["202401", "202402", "202403"]):
+                cache.fetch(FakeSession({CSV_URL: ARCHIVE[i:]}), month, [CSV_URL])
+            cache.manifest["months"]["202401"]["last_used"] = 0
+
+            evicted = cache.evict(max_bytes=len(ARCHIVE), keep=["202401", "202403"])
+            self.assertEqual(evicted, ["202402"])
+            self.assertEqual(sorted(cache.manifest["months"]), ["202401", "202403"])
+
+
+if __name__ == "__main__":
+    unittest.main()